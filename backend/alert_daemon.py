@@ -0,0 +1,425 @@
+# alert_daemon.py
+# Headless alerting on the live level/ticket CSVs.
+#
+# The daemon tails cauldron_data.csv and tickets.csv (new rows only, see
+# CsvTail) and pushes each batch through the same streaming drain detector the
+# chunked pipeline uses, plus running per-day drained / ticketed totals. Every
+# event's volume counts toward its day, as after the noise-floor merge in
+# detect_drain_events (drain_noise.py), and only significant events can be an
+# unmatched drain, so the floor itself is not needed here. With
+# --denoise-window the detector sees the rolling-median filtered levels
+# (denoise.py), which trail the raw feed by half a window.
+# After every batch it evaluates:
+#
+#   unmatched_drain      significant drain whose cauldron-day got no ticket
+#   ticket_without_drain ticket on a cauldron-day with no drain event
+#   daily_mismatch       drained vs ticketed volume off by more than the verify tolerance
+#   predicted_overflow   level + mean fill rate reaches max_volume within the horizon
+#
+# Day-level rules fire once the level data has passed the end of that day plus
+# --ticket-grace minutes. Alerts are deduplicated by key, rate limited per rule
+# with a token bucket (alerts over the limit are queued and sent as tokens come
+# back; on exit whatever is still queued goes out as one digest per rule), and
+# sent to every configured sink:
+#
+#   python backend/alert_daemon.py run --sink stdout --sink file:alerts.jsonl --sink webhook:http://127.0.0.1:8766/
+#   python backend/alert_daemon.py webhook-stub --port 8766      # local receiver that prints what it gets
+#
+# History already on disk at startup is ingested silently (use --replay to
+# alert on it too), so a restart does not resend old alerts.
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from chunked_pipeline import StreamingDrainDetector, StreamingRates
+from compute_rates import rates_from_totals
+from denoise import StreamingMedianFilter
+from detect_drain_events import MIN_EVENT_GAP, SIGNIFICANT_VOLUME
+from verify_drain_tickets import TOLERANCE
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+POLL_SECONDS = 0.2
+TICKET_GRACE_MINUTES = 60
+OVERFLOW_HORIZON_MINUTES = 120
+RATE_PER_MINUTE = 30  # per rule
+BURST = 10
+TAIL_CHECK_BYTES = 4096
+DAY = pd.Timedelta(days=1)
+
+
+class CsvTail:
+    """New rows of a CSV that is appended to or rewritten with the old rows first.
+
+    If the bytes just before the last read offset are unchanged the file is read
+    from that offset; otherwise (shrunk or rewritten differently) it is reread
+    and the rows already returned are skipped.
+    """
+
+    def __init__(self, path, parse_dates=()):
+        self.path = path
+        self.parse_dates = list(parse_dates)
+        self.offset = 0
+        self.rows = 0
+        self.header = b""
+        self.check = b""
+        self.stat = None
+
+    def poll(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if key == self.stat:
+            return None
+        self.stat = key
+        with open(self.path, "rb") as f:
+            if self.offset and st.st_size >= self.offset:
+                f.seek(self.offset - len(self.check))
+                if f.read(len(self.check)) == self.check:
+                    return self._take(f.read(), self.offset, skip=None)
+            f.seek(0)
+            data = f.read()
+        header_end = data.find(b"\n") + 1
+        self.header = data[:header_end]
+        self.offset = header_end
+        return self._take(data[header_end:], header_end, skip=self.rows)
+
+    def _take(self, body, base, skip):
+        """Parse ``body`` (file bytes from ``base``); ``skip`` rows were already returned."""
+        end = body.rfind(b"\n") + 1  # a partly written last line waits for the next poll
+        if end == 0:
+            return None
+        body = body[:end]
+        self.offset = base + end
+        self.check = body[-TAIL_CHECK_BYTES:]
+        df = pd.read_csv(io.BytesIO(self.header + body))
+        if skip is None:
+            self.rows += len(df)
+        else:
+            df = df.iloc[skip:]
+            self.rows = skip + len(df)
+        if df.empty:
+            return None
+        for col in self.parse_dates:
+            df[col] = pd.to_datetime(df[col], utc=True)
+        return df
+
+
+class AlertEngine:
+    """Incremental detection + reconciliation state; ``evaluate`` returns new alert dicts."""
+
+    def __init__(self, max_volumes, tolerance=TOLERANCE, grace_minutes=TICKET_GRACE_MINUTES,
+                 horizon_minutes=OVERFLOW_HORIZON_MINUTES, denoise_window=0):
+        self.detector = StreamingDrainDetector()
+        self.smoother = StreamingMedianFilter(denoise_window) if denoise_window else None
+        self.rates = StreamingRates()
+        self.max_volumes = max_volumes
+        self.tolerance = tolerance
+        self.grace = pd.Timedelta(minutes=grace_minutes)
+        self.horizon = horizon_minutes
+        self.clock = None  # latest level timestamp
+        self.detected_to = None  # latest timestamp the detector has seen
+        self.latest = {}  # cauldron -> latest non-null level
+        self.final = set()  # (cauldron, start_time) of events already accounted
+        self.lost = defaultdict(float)  # (cauldron, day) -> drained volume (verify: by start day)
+        self.significant = defaultdict(list)  # (cauldron, day) -> significant events
+        self.collected = defaultdict(float)  # (cauldron, day) -> ticketed volume
+        self.ticket_days = set()
+        self.closed_days = set()
+        self.overflowing = set()
+
+    def ingest_levels(self, chunk):
+        chunk = chunk.set_index("timestamp").sort_index()
+        self.rates.feed(chunk)
+        self.clock = chunk.index[-1]
+        for cauldron, level in chunk.ffill().iloc[-1].items():
+            if pd.notna(level):
+                self.latest[cauldron] = float(level)
+        if self.smoother is not None:
+            chunk = self.smoother.feed(chunk)
+            if chunk.empty:
+                return
+        self.detector.feed(chunk)
+        self.detected_to = chunk.index[-1]
+        for event in self.detector.pop_closed():
+            self._account(event)
+        # an open event idle for longer than the gap can't grow any more
+        for cauldron in self.detector.columns:
+            event = self.detector.open_event(cauldron)
+            if event is not None and (self.detected_to - event["end_time"]).total_seconds() / 60 > MIN_EVENT_GAP:
+                self._account(event)
+
+    def ingest_tickets(self, tickets):
+        for cauldron, date, amount in zip(tickets["cauldron_id"], tickets["date"], tickets["amount_collected"]):
+            key = (cauldron, date.floor("D"))
+            self.collected[key] += float(amount)
+            self.ticket_days.add(key)
+
+    def _account(self, event):
+        ident = (event["cauldron_id"], event["start_time"])
+        if ident in self.final:
+            return
+        self.final.add(ident)
+        key = (event["cauldron_id"], pd.Timestamp(event["start_time"]).tz_convert("UTC").floor("D"))
+        self.lost[key] += event["volume_lost"]
+        if event["volume_lost"] >= SIGNIFICANT_VOLUME:
+            self.significant[key].append(event)
+
+    def evaluate(self):
+        if self.clock is None:
+            return []
+        alerts = []
+        horizon_day = self.clock.tz_convert("UTC") - self.grace - DAY
+        for key in sorted((set(self.lost) | self.ticket_days) - self.closed_days):
+            cauldron, day = key
+            if day > horizon_day:
+                continue  # day not over yet (or tickets may still arrive)
+            self.closed_days.add(key)
+            lost, collected = self.lost.get(key), self.collected.get(key, 0.0)
+            if lost is None:
+                alerts.append(_alert("ticket_without_drain", cauldron, day, f"{collected:.2f} L ticketed on a day with no drain",
+                                     collected=collected))
+                continue
+            if key not in self.ticket_days:
+                for event in self.significant.get(key, []):
+                    alerts.append(_alert("unmatched_drain", cauldron, event["start_time"],
+                                         f"{event['volume_lost']:.2f} L drained with no ticket that day",
+                                         volume_lost=event["volume_lost"], end_time=str(event["end_time"])))
+            if abs(lost - collected) > self.tolerance:
+                alerts.append(_alert("daily_mismatch", cauldron, day,
+                                     f"drained {lost:.2f} L vs ticketed {collected:.2f} L",
+                                     total_lost=lost, collected=collected, difference=collected - lost))
+        alerts.extend(self._overflow())
+        return alerts
+
+    def _overflow(self):
+        alerts = []
+        rates = rates_from_totals({c: tuple(t) for c, t in self.rates.totals.items()}).set_index("cauldron_id")
+        for cauldron, level in self.latest.items():
+            max_volume = self.max_volumes.get(cauldron)
+            fill_rate = rates["fill_rate"].get(cauldron)
+            if not max_volume or not fill_rate or pd.isna(fill_rate):
+                continue
+            minutes = max(0.0, (max_volume - level) / fill_rate)
+            if minutes <= self.horizon:
+                if cauldron not in self.overflowing:
+                    self.overflowing.add(cauldron)
+                    alerts.append(_alert("predicted_overflow", cauldron, self.clock,
+                                         f"{level:.1f}/{max_volume:.0f} L, full in ~{minutes:.0f} min",
+                                         level=level, max_volume=max_volume, minutes_to_full=minutes))
+            else:
+                self.overflowing.discard(cauldron)  # re-arm once it has been drained
+        return alerts
+
+
+def _alert(rule, cauldron, when, message, **details):
+    when = pd.Timestamp(when)
+    return {"rule": rule, "cauldron_id": cauldron, "time": when.isoformat(),
+            "key": f"{rule}|{cauldron}|{when.isoformat()}", "message": message, **details}
+
+
+class TokenBucket:
+    def __init__(self, per_minute=RATE_PER_MINUTE, burst=BURST):
+        self.rate = per_minute / 60.0
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class StdoutSink:
+    def send(self, alert):
+        print(f"[{alert['rule']}] {alert['cauldron_id']} {alert['time']}: {alert['message']}", flush=True)
+
+
+class FileSink:
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, alert):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(alert, default=str) + "\n")
+
+
+class WebhookSink:
+    def __init__(self, url, timeout=2):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alert):
+        req = urllib.request.Request(self.url, data=json.dumps(alert, default=str).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            urllib.request.urlopen(req, timeout=self.timeout).close()
+        except OSError as e:
+            print(f"webhook {self.url} failed: {e}", file=sys.stderr)
+
+
+def make_sink(spec):
+    """'stdout', 'file:<path>' or 'webhook:<url>'."""
+    kind, _, arg = spec.partition(":")
+    if kind == "stdout":
+        return StdoutSink()
+    if kind == "file":
+        return FileSink(arg or "alerts.jsonl")
+    if kind == "webhook":
+        return WebhookSink(arg or "http://127.0.0.1:8766/")
+    raise ValueError(f"unknown sink {spec!r}")
+
+
+class Dispatcher:
+    """Dedup by alert key, token bucket per rule, fan out to every sink.
+
+    Alerts over the rate limit wait in a per-rule queue and go out as tokens
+    come back (flush); a key only counts as seen once it has been sent, so a
+    throttled alert is delayed rather than lost. flush(final=True) sends what
+    is still queued as one digest per rule.
+    """
+
+    def __init__(self, sinks, per_minute=RATE_PER_MINUTE, burst=BURST):
+        self.sinks = sinks
+        self.seen = set()
+        self.buckets = defaultdict(lambda: TokenBucket(per_minute, burst))
+        self.queued = defaultdict(deque)  # rule -> (alert, ingested_at)
+        self.queued_keys = set()
+
+    def dispatch(self, alerts, ingested_at, silent=False):
+        for alert in alerts:
+            if alert["key"] in self.seen or alert["key"] in self.queued_keys:
+                continue
+            if silent:
+                self.seen.add(alert["key"])
+                continue
+            self.queued[alert["rule"]].append((alert, ingested_at))
+            self.queued_keys.add(alert["key"])
+        return self.flush()
+
+    def flush(self, final=False):
+        """Send queued alerts the buckets allow; with final, the rest as one digest per rule."""
+        sent = 0
+        for rule, queue in self.queued.items():
+            while queue and self.buckets[rule].allow():
+                alert, ingested_at = queue[0]
+                if len(queue) > 1:
+                    alert["queued_behind"] = len(queue) - 1
+                alert["latency_ms"] = round((time.monotonic() - ingested_at) * 1000, 1)
+                self._send(alert, [alert])
+                queue.popleft()
+                sent += 1
+            if final and queue:
+                held = [alert for alert, _ in queue]
+                self._send(_alert(rule, "*", held[-1]["time"], f"{len(held)} more {rule} alerts held back by the rate limit",
+                                  count=len(held), alerts=held), held)
+                queue.clear()
+                sent += 1
+        return sent
+
+    def _send(self, message, alerts):
+        """Send ``message`` to every sink, then mark ``alerts`` (what it covers) seen."""
+        for sink in self.sinks:
+            sink.send(message)
+        for alert in alerts:
+            self.queued_keys.discard(alert["key"])
+            self.seen.add(alert["key"])
+
+
+def load_max_volumes(path):
+    if not os.path.exists(path):
+        return {}
+    cauldrons = pd.read_csv(path)
+    return dict(zip(cauldrons["id"], cauldrons["max_volume"].astype(float)))
+
+
+def run(data_dir, sinks, replay=False, poll_seconds=POLL_SECONDS, once=False, **engine_kwargs):
+    engine = AlertEngine(load_max_volumes(os.path.join(data_dir, "cauldrons.csv")), **engine_kwargs)
+    dispatcher = Dispatcher(sinks)
+    levels = CsvTail(os.path.join(data_dir, "cauldron_data.csv"), ["timestamp"])
+    tickets = CsvTail(os.path.join(data_dir, "tickets.csv"), ["date"])
+    primed = replay
+    while True:
+        started = time.monotonic()
+        new_tickets = tickets.poll()
+        new_levels = levels.poll()
+        if new_tickets is not None:
+            engine.ingest_tickets(new_tickets)
+        if new_levels is not None:
+            engine.ingest_levels(new_levels)
+        if new_tickets is not None or new_levels is not None:
+            dispatcher.dispatch(engine.evaluate(), started, silent=not primed)
+        else:
+            dispatcher.flush()
+        primed = True
+        if once:
+            dispatcher.flush(final=True)
+            return dispatcher
+        try:
+            time.sleep(poll_seconds)
+        except KeyboardInterrupt:
+            dispatcher.flush(final=True)
+            return dispatcher
+
+
+class _WebhookStubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        print(body.decode("utf-8"), flush=True)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve_webhook_stub(port):
+    server = ThreadingHTTPServer(("127.0.0.1", port), _WebhookStubHandler)
+    print(f"webhook stub listening on http://127.0.0.1:{port}/")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Alert on suspicious drains as data arrives")
+    parser.add_argument("command", choices=["run", "webhook-stub"])
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--sink", action="append", default=[], help="stdout | file:<path> | webhook:<url> (repeatable)")
+    parser.add_argument("--replay", action="store_true", help="also alert on the history already on disk")
+    parser.add_argument("--once", action="store_true", help="process what is there and exit")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--ticket-grace", type=float, default=TICKET_GRACE_MINUTES, help="minutes after midnight")
+    parser.add_argument("--overflow-horizon", type=float, default=OVERFLOW_HORIZON_MINUTES, help="minutes")
+    parser.add_argument("--denoise-window", type=int, default=0, help="rolling-median window in rows before detection (odd; 0 = off)")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    if args.command == "webhook-stub":
+        server = serve_webhook_stub(args.port)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+    else:
+        sinks = [make_sink(s) for s in args.sink or ["stdout"]]
+        run(args.data_dir, sinks, replay=args.replay, once=args.once, tolerance=args.tolerance,
+            grace_minutes=args.ticket_grace, horizon_minutes=args.overflow_horizon,
+            denoise_window=args.denoise_window)
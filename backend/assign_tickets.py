@@ -0,0 +1,228 @@
+# assign_tickets.py
+# Exclusive ticket <-> drain assignment per cauldron.
+#
+# The daily sums in verify_drain_tickets.py and the +-N hour overlap in
+# maptest.match_tickets_to_drains both let one drain back several tickets (and
+# a ticket soak up every drain nearby). Here every drain event backs at most one
+# ticket and every ticket is paired with at most one drain.
+#
+# Per cauldron, tickets and drains are sorted by time and each ticket's
+# candidate drains come from a binary search over the drain times (its window),
+# so candidate generation is O((n + m) log m). A pair costs
+#
+#   cost = TIME_WEIGHT * |drain midpoint - ticket anchor| / window
+#        + VOLUME_WEIGHT * |amount - volume| / amount
+#
+# (a midnight ticket timestamp means "that day", so it is anchored at noon),
+# and leaving a ticket without a drain costs UNMATCHED_COST, so a pair is only
+# taken when it is cheaper than that. The pairing is order-preserving (a later
+# ticket never gets an earlier drain than an earlier ticket of the same
+# cauldron), which turns the assignment into a heaviest increasing chain over
+# the candidate pairs: one pass in ticket order with a prefix-max Fenwick tree
+# over the drain positions, O(P log m) for P candidate pairs, and the optimum
+# among order-preserving pairings rather than a greedy one. With a single
+# pairing per ticket, "partial" means the paired drain is off the amount by
+# more than the fill tolerance and "unbacked" that no drain in the window was
+# worth pairing. What is left over on either side is the residue: ticket
+# volume no drain accounts for, and significant drains no ticket claims.
+#
+# multi=True (--multi) keeps the older many-to-one fill instead: candidate
+# pairs are taken greedily, cheapest first, and a ticket takes drains until its
+# amount is covered within the fill tolerance. That is a packing heuristic, not
+# an optimum, and lets one ticket account for several drains.
+#
+# Run:  python backend/assign_tickets.py [--tickets tickets.csv] [--drains drain_events.csv] [--window-hours 18]
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import results_store
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+WINDOW_HOURS = 18  # half-width around the ticket anchor (noon) -> 06:00 the day before to 06:00 the day after
+TIME_WEIGHT = 1.0
+VOLUME_WEIGHT = 1.0
+UNMATCHED_COST = 2.0  # an in-window pair is kept unless its volume is off by about the whole amount
+# a ticket counts as backed within 20% of its amount: volume_lost misses what
+# flows in while the drain runs, so tickets sit ~15% above it on the sample data
+FILL_TOLERANCE = 0.2
+HOUR_NS = 3_600_000_000_000
+DAY_NS = 24 * HOUR_NS
+
+
+def _ns(series):
+    return pd.to_datetime(series, utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+
+
+def ticket_anchors(dates_ns):
+    """Day-level tickets (exactly midnight) are anchored at noon of that day."""
+    return np.where(dates_ns % DAY_NS == 0, dates_ns + DAY_NS // 2, dates_ns)
+
+
+def candidate_pairs(anchors, drain_ns, window_ns):
+    """(ticket index, drain index) for every drain within ``window_ns`` of a ticket; drain_ns sorted."""
+    lo = np.searchsorted(drain_ns, anchors - window_ns, "left")
+    hi = np.searchsorted(drain_ns, anchors + window_ns, "right")
+    counts = hi - lo
+    ti = np.repeat(np.arange(len(anchors)), counts)
+    starts = np.repeat(np.cumsum(counts) - counts, counts)
+    dj = np.repeat(lo, counts) + (np.arange(counts.sum()) - starts)
+    return ti, dj
+
+
+def pair_costs(anchors, amounts, drain_ns, volumes, window_ns):
+    """Candidate pairs with a positive amount and their cost; returns (ticket idx, drain idx, cost)."""
+    ti, dj = candidate_pairs(anchors, drain_ns, window_ns)
+    ok = amounts[ti] > 0
+    ti, dj = ti[ok], dj[ok]
+    cost = (TIME_WEIGHT * np.abs(drain_ns[dj] - anchors[ti]) / window_ns
+            + VOLUME_WEIGHT * np.abs(amounts[ti] - volumes[dj]) / amounts[ti])
+    return ti, dj, cost
+
+
+def match_cauldron(anchors, amounts, drain_ns, volumes, window_ns, unmatched_cost=UNMATCHED_COST):
+    """Cheapest order-preserving one-to-one pairing; anchors and drain_ns sorted.
+
+    Returns (ticket idx, drain idx, cost) arrays, in ticket order.
+    """
+    ti, dj, cost = pair_costs(anchors, amounts, drain_ns, volumes, window_ns)
+    keep = cost < unmatched_cost
+    ti, dj, cost = ti[keep], dj[keep], cost[keep]
+    gain = (unmatched_cost - cost).tolist()
+    m = len(drain_ns)
+    tree_v = [0.0] * (m + 1)  # Fenwick prefix max over drain positions: best chain ending before it
+    tree_k = [-1] * (m + 1)
+    best = [0.0] * len(ti)
+    prev = [-1] * len(ti)
+    ti_l, dj_l = ti.tolist(), dj.tolist()
+    k = 0
+    while k < len(ti_l):
+        end = k
+        while end < len(ti_l) and ti_l[end] == ti_l[k]:
+            end += 1
+        for q in range(k, end):  # query every candidate of this ticket before any of them is inserted
+            v, p, pos = 0.0, -1, dj_l[q]
+            while pos > 0:
+                if tree_v[pos] > v:
+                    v, p = tree_v[pos], tree_k[pos]
+                pos -= pos & -pos
+            best[q], prev[q] = v + gain[q], p
+        for q in range(k, end):
+            pos = dj_l[q] + 1
+            while pos <= m:
+                if best[q] > tree_v[pos]:
+                    tree_v[pos], tree_k[pos] = best[q], q
+                pos += pos & -pos
+        k = end
+    chain = []
+    q = int(np.argmax(best)) if best else -1
+    while q >= 0:
+        chain.append(q)
+        q = prev[q]
+    chain = np.array(chain[::-1], dtype="int64")
+    return ti[chain], dj[chain], cost[chain]
+
+
+def fill_cauldron(anchors, amounts, drain_ns, volumes, window_ns, tolerance=FILL_TOLERANCE):
+    """Greedy cheapest-first many-to-one fill; returns (ticket idx, drain idx, cost) arrays."""
+    ti, dj, cost = pair_costs(anchors, amounts, drain_ns, volumes, window_ns)
+    order = np.lexsort((dj, ti, cost))  # ties broken by ticket then drain order
+    remaining = amounts.astype("float64").copy()
+    slack = tolerance * amounts
+    taken = np.zeros(len(drain_ns), dtype=bool)
+    out_t, out_d, out_c = [], [], []
+    for k in order:
+        i, j = ti[k], dj[k]
+        if taken[j] or remaining[i] <= slack[i] or volumes[j] > remaining[i] + slack[i]:
+            continue
+        taken[j] = True
+        remaining[i] -= volumes[j]
+        out_t.append(i)
+        out_d.append(j)
+        out_c.append(cost[k])
+    return np.array(out_t, dtype="int64"), np.array(out_d, dtype="int64"), np.array(out_c)
+
+
+def assign_tickets(tickets, drains, window_hours=WINDOW_HOURS, tolerance=FILL_TOLERANCE, significant_only=True,
+                   multi=False):
+    """(pairs, per-ticket summary, unassigned drains) for all cauldrons; multi=True for the many-to-one fill."""
+    tickets = tickets.reset_index(drop=True).assign(ticket_index=lambda t: t.index)
+    if significant_only and "significant" in drains.columns:
+        drains = drains[drains["significant"].astype(bool)]
+    drains = drains.reset_index(drop=True)
+    t_ns = _ns(tickets["date"])
+    d_mid = (_ns(drains["start_time"]) // 2) + (_ns(drains["end_time"]) // 2)
+    amounts = pd.to_numeric(tickets["amount_collected"], errors="coerce").fillna(0.0).to_numpy()
+    volumes = drains["volume_lost"].to_numpy(dtype="float64")
+    window_ns = int(window_hours * HOUR_NS)
+
+    pair_t, pair_d, pair_c = [], [], []
+    t_groups = tickets.groupby("cauldron_id").indices
+    for cauldron, d_idx in drains.groupby("cauldron_id").indices.items():
+        t_idx = t_groups.get(cauldron)
+        if t_idx is None:
+            continue
+        d_idx = d_idx[np.argsort(d_mid[d_idx], kind="stable")]
+        if multi:
+            i, j, c = fill_cauldron(ticket_anchors(t_ns[t_idx]), amounts[t_idx], d_mid[d_idx], volumes[d_idx], window_ns, tolerance)
+        else:
+            t_idx = t_idx[np.argsort(ticket_anchors(t_ns[t_idx]), kind="stable")]
+            i, j, c = match_cauldron(ticket_anchors(t_ns[t_idx]), amounts[t_idx], d_mid[d_idx], volumes[d_idx], window_ns)
+        pair_t.append(t_idx[i])
+        pair_d.append(d_idx[j])
+        pair_c.append(c)
+    pair_t = np.concatenate(pair_t) if pair_t else np.array([], dtype="int64")
+    pair_d = np.concatenate(pair_d) if pair_d else np.array([], dtype="int64")
+    pair_c = np.concatenate(pair_c) if pair_c else np.array([])
+
+    pairs = pd.DataFrame({
+        "ticket_index": pair_t,
+        "cauldron_id": drains["cauldron_id"].to_numpy()[pair_d],
+        "date": tickets["date"].to_numpy()[pair_t],
+        "amount_collected": amounts[pair_t],
+        "start_time": drains["start_time"].to_numpy()[pair_d],
+        "end_time": drains["end_time"].to_numpy()[pair_d],
+        "volume_lost": volumes[pair_d],
+        "cost": pair_c,
+    }).sort_values(["cauldron_id", "ticket_index", "start_time"], kind="mergesort").reset_index(drop=True)
+
+    assigned = np.bincount(pair_t, weights=volumes[pair_d], minlength=len(tickets))
+    n_drains = np.bincount(pair_t, minlength=len(tickets))
+    residual = amounts - assigned
+    status = np.where(n_drains == 0, "unbacked", np.where(np.abs(residual) <= tolerance * amounts, "matched", "partial"))
+    summary = tickets.assign(assigned_volume=assigned, assigned_drains=n_drains, residual=residual, status=status)
+
+    taken = np.zeros(len(drains), dtype=bool)
+    taken[pair_d] = True
+    unassigned = drains[~taken].reset_index(drop=True)
+    return pairs, summary, unassigned
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exclusive ticket/drain assignment per cauldron")
+    parser.add_argument("--tickets", default=os.path.join(DEFAULT_DATA_DIR, "tickets.csv"))
+    parser.add_argument("--drains", default=os.path.join(DEFAULT_DATA_DIR, "drain_events.csv"))
+    parser.add_argument("--out-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--window-hours", type=float, default=WINDOW_HOURS)
+    parser.add_argument("--tolerance", type=float, default=FILL_TOLERANCE)
+    parser.add_argument("--all-drains", action="store_true", help="also consider drains below the significance cut")
+    parser.add_argument("--multi", action="store_true", help="let a ticket take several drains (greedy fill) instead of one")
+    args = parser.parse_args()
+
+    tickets = pd.read_csv(args.tickets)
+    drains = pd.read_csv(args.drains)
+    t0 = time.perf_counter()
+    pairs, summary, unassigned = assign_tickets(tickets, drains, args.window_hours, args.tolerance, not args.all_drains, args.multi)
+    elapsed = time.perf_counter() - t0
+    results_store.write_csv_atomic(pairs, os.path.join(args.out_dir, "ticket_assignments.csv"))
+    results_store.write_csv_atomic(summary, os.path.join(args.out_dir, "ticket_assignment_summary.csv"))
+    results_store.write_csv_atomic(unassigned, os.path.join(args.out_dir, "unassigned_drains.csv"))
+    print(f"{len(pairs)} assignments in {elapsed:.2f}s")
+    print(summary["status"].value_counts().to_string())
+    print(f"{len(unassigned)} drains not backing any ticket, "
+          f"{summary['residual'].clip(lower=0).sum():.2f} L of ticketed volume without a drain")
@@ -0,0 +1,241 @@
+# backfill.py
+# Rebuild drain events, rates and the suspicious-day report for the whole level
+# history in parallel, e.g. after a change to detection.
+#
+# The history is cut into day or week shards and every shard runs in its own
+# worker process with the ROLLING_WINDOW rows before it attached, so the
+# windowed diff (and the first 1-step diff for rates) sees exactly what the
+# serial pass sees. Workers return per-cauldron drain runs, integer diff
+# totals and diff histograms; the parent stitches runs that cross a shard
+# boundary with the same gap rule detection uses between consecutive drain
+# points, sums the totals, merges the histograms into the noise floor
+# (drain_noise.py), merges the noise events and adds the event features in one
+# vectorized pass. With --denoise-window the shards are first rolling-median
+# filtered in the workers (denoise.py), each with half a window of rows on
+# either side, and detection runs on the filtered levels. Reconciliation is then
+# sharded by day as well (verify groups by start day, so shards never share a
+# group). The outputs are byte-identical to run_pipeline's detect, rates and
+# verify stages; --verify runs those too and compares.
+#
+# Run:  python backend/backfill.py [--data-dir streamlit/data] [--shard week] [--jobs 8] [--verify]
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import results_store
+
+from compute_rates import diff_totals, rates_from_totals
+from denoise import median_filter
+from drain_noise import NOISE_K, DiffHistogram, daily_noise, diff_counts, split_noise
+from detect_drain_events import DRAIN_DROP_THRESHOLD, MIN_EVENT_GAP, ROLLING_WINDOW, SIGNIFICANT_VOLUME
+from event_features import event_features
+from sweep_drain_params import SECOND_NS, event_bounds, windowed_diff
+from verify_drain_tickets import SUSPICIOUS_COLUMNS, TOLERANCE, verify_drain_tickets
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+DAY_NS = 86_400 * SECOND_NS
+OUTPUTS = ["drain_events.csv", "cauldron_rates.csv", "suspicious_events.csv"]
+
+
+def shard_bounds(times_ns, shard="day"):
+    """[start, stop) row ranges of the UTC days (or Monday-based weeks) in ``times_ns``."""
+    key = times_ns // DAY_NS
+    if shard == "week":
+        key = (key + 3) // 7  # 1970-01-01 was a Thursday
+    elif shard != "day":
+        raise ValueError(f"unknown shard size {shard!r}")
+    cuts = np.flatnonzero(np.diff(key)) + 1
+    starts = np.concatenate([[0], cuts])
+    stops = np.concatenate([cuts, [len(times_ns)]])
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def denoise_shard(values, window, head, rows):
+    """Rolling median of ``rows`` shard rows that come after ``head`` overlap rows in ``values``."""
+    return median_filter(pd.DataFrame(values), window).to_numpy()[head:head + rows]
+
+
+def detect_shard(values, times_ns, carry, offset, raw=None):
+    """Drain runs and diff totals for one shard.
+
+    ``values`` / ``times_ns`` hold the shard rows preceded by ``carry`` overlap
+    rows; ``offset`` is the global row of the first shard row. Returns
+    (column, first row, last row) arrays in global rows, plus one diff-totals
+    tuple and one diff histogram per column. The totals come from ``raw`` (the
+    unfiltered rows, when ``values`` is denoised).
+    """
+    diff = windowed_diff(values, ROLLING_WINDOW)
+    mask = diff < -DRAIN_DROP_THRESHOLD
+    mask[:carry] = False
+    cols, starts, ends = [], [], []
+    for c in range(values.shape[1]):
+        s, e = event_bounds(np.flatnonzero(mask[:, c]), times_ns, MIN_EVENT_GAP)
+        cols.append(np.full(len(s), c))
+        starts.append(s)
+        ends.append(e)
+    shift = offset - carry
+    # the row just before the shard links its first 1-step diff to the previous shard
+    own = values[max(carry - 1, 0):]
+    own_raw = own if raw is None else raw[max(carry - 1, 0):]
+    totals = [diff_totals(own_raw[:, c]) for c in range(values.shape[1])]
+    counts = [diff_counts(own[:, c]) for c in range(values.shape[1])]
+    return np.concatenate(cols), np.concatenate(starts) + shift, np.concatenate(ends) + shift, totals, counts
+
+
+def stitch(cols, starts, ends, times_ns):
+    """Merge runs split by shard boundaries; inputs are per-column, time ordered, concatenated."""
+    order = np.lexsort((starts, cols))
+    cols, starts, ends = cols[order], starts[order], ends[order]
+    if len(cols) == 0:
+        return cols, starts, ends
+    # same break rule as between consecutive drain points: (t - prev).seconds / 60 > gap,
+    # and inside a shard consecutive runs were split by exactly that rule already
+    seconds = ((times_ns[starts[1:]] - times_ns[ends[:-1]]) // SECOND_NS) % 86_400
+    breaks = np.concatenate([[True], (cols[1:] != cols[:-1]) | (seconds / 60 > MIN_EVENT_GAP)])
+    first = np.flatnonzero(breaks)
+    last = np.concatenate([first[1:] - 1, [len(cols) - 1]])
+    return cols[first], starts[first], ends[last]
+
+
+def backfill(data_dir=DEFAULT_DATA_DIR, db_path=None, shard="day", jobs=None, tolerance=TOLERANCE,
+             noise_k=NOISE_K, keep_noise=False, denoise_window=0):
+    """Rebuild the detect, rates and verify outputs in ``data_dir``; returns {stage: seconds}.
+
+    ``keep_noise`` also writes the per-day counts of the merged noise events
+    to drain_noise.csv; ``denoise_window`` > 0 detects on rolling-median
+    filtered levels.
+    """
+    timings = {}
+    t0 = time.perf_counter()
+    df = pd.read_csv(os.path.join(data_dir, "cauldron_data.csv"), index_col="timestamp", parse_dates=True)
+    times_ns = pd.DatetimeIndex(df.index).as_unit("ns").asi8
+    values = df.to_numpy(dtype="float64")
+    bounds = shard_bounds(times_ns, shard)
+    timings["read"] = time.perf_counter() - t0
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        t0 = time.perf_counter()
+        raw = None
+        if denoise_window:
+            half = denoise_window // 2
+            futures = [pool.submit(denoise_shard, values[max(start - half, 0):stop + half], denoise_window,
+                                   start - max(start - half, 0), stop - start) for start, stop in bounds]
+            raw, values = values, np.concatenate([f.result() for f in futures])
+            df = pd.DataFrame(values, index=df.index, columns=df.columns)
+            timings["denoise"] = time.perf_counter() - t0
+            t0 = time.perf_counter()
+        futures = []
+        for start, stop in bounds:
+            lo = max(start - ROLLING_WINDOW, 0)
+            futures.append(pool.submit(detect_shard, values[lo:stop], times_ns[lo:stop], start - lo, start,
+                                       None if raw is None else raw[lo:stop]))
+        parts = [f.result() for f in futures]
+        cols, starts, ends = stitch(*(np.concatenate([p[i] for p in parts]) for i in range(3)), times_ns)
+        totals = {}
+        hist = DiffHistogram()
+        for c, cauldron in enumerate(df.columns):
+            per_shard = np.array([p[3][c] for p in parts], dtype=object)
+            totals[cauldron] = tuple(int(x) for x in per_shard.sum(axis=0))
+            for p in parts:
+                hist.add(cauldron, p[4][c])
+        rates_df = rates_from_totals(totals)
+
+        cauldrons = np.asarray(df.columns)
+        events_df = pd.DataFrame({
+            "cauldron_id": cauldrons[cols],
+            "start_time": df.index[starts],
+            "end_time": df.index[ends],
+            "volume_lost": np.abs(values[starts, cols] - values[ends, cols]),
+        })
+        events_df["significant"] = events_df["volume_lost"] >= SIGNIFICANT_VOLUME
+        events_df, noise_df = split_noise(events_df, hist.floors(SIGNIFICANT_VOLUME, noise_k))
+        events_df = event_features(df, events_df, ROLLING_WINDOW, rates_df)
+        _save(events_df, data_dir, "drain_events", db_path)
+        _save(rates_df, data_dir, "cauldron_rates", db_path)
+        if keep_noise:
+            results_store.write_csv_atomic(daily_noise(noise_df), os.path.join(data_dir, "drain_noise.csv"))
+        timings["detect"] = time.perf_counter() - t0
+
+        # reconcile from the file as written, like the verify stage does
+        t0 = time.perf_counter()
+        drains = pd.read_csv(os.path.join(data_dir, "drain_events.csv"))
+        tickets = pd.read_csv(os.path.join(data_dir, "tickets.csv"))
+        drain_day = pd.to_datetime(drains["start_time"], utc=True).dt.as_unit("ns").astype("int64") // DAY_NS
+        ticket_day = pd.to_datetime(tickets["date"], utc=True).dt.as_unit("ns").astype("int64") // DAY_NS
+        futures = []
+        for start, stop in bounds:
+            first_day, last_day = times_ns[start] // DAY_NS, times_ns[stop - 1] // DAY_NS
+            in_drains = drain_day.between(first_day, last_day)
+            if in_drains.any():
+                futures.append(pool.submit(verify_drain_tickets, drains[in_drains], tickets[ticket_day.between(first_day, last_day)], tolerance))
+        parts = [f.result() for f in futures]
+        parts = [p for p in parts if not p.empty]
+        if parts:
+            suspicious_df = pd.concat(parts, ignore_index=True).sort_values(["cauldron_id", "day"], kind="mergesort")
+        else:
+            suspicious_df = pd.DataFrame(columns=SUSPICIOUS_COLUMNS)
+        _save(suspicious_df.reset_index(drop=True), data_dir, "suspicious_events", db_path)
+        timings["verify"] = time.perf_counter() - t0
+    return timings
+
+
+def _save(df, data_dir, table, db_path):
+    results_store.write_csv_atomic(df, os.path.join(data_dir, f"{table}.csv"))
+    results_store.replace_table(table, df, db_path)
+
+
+def serial_outputs(data_dir, tolerance=TOLERANCE, noise_k=NOISE_K, denoise_window=0):
+    """The detect, rates and verify stages run one after the other in a scratch copy; returns {file: bytes}."""
+    from run_pipeline import Context, run_detect, run_rates, run_verify
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("cauldron_data.csv", "tickets.csv"):
+            shutil.copy(os.path.join(data_dir, name), tmp)
+        params = {"detect": {"noise_k": noise_k, "denoise_window": denoise_window}, "verify": {"tolerance": tolerance}}
+        ctx = Context(tmp, os.path.join(tmp, "results.db"), params)
+        for stage in (run_detect, run_rates, run_verify):
+            stage(ctx)
+        out = {}
+        for name in OUTPUTS:
+            path = ctx.path(name)
+            out[name] = open(path, "rb").read() if os.path.exists(path) else None
+        return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded parallel rebuild of drain events, rates and suspicious days")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--db", default=None, help="results store (default <data-dir>/results.db)")
+    parser.add_argument("--shard", choices=["day", "week"], default="day")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="verify: liters of mismatch per cauldron-day")
+    parser.add_argument("--noise-k", type=float, default=NOISE_K, help="noise floor in MAD sigmas (0 keeps every event)")
+    parser.add_argument("--keep-noise", action="store_true", help="write per-day counts of the merged noise events to drain_noise.csv")
+    parser.add_argument("--denoise-window", type=int, default=0, help="rolling-median window in rows before detection (odd; 0 = off)")
+    parser.add_argument("--verify", action="store_true", help="also run the serial stages and compare outputs byte for byte")
+    args = parser.parse_args()
+
+    db_path = args.db or os.environ.get("POTION_RESULTS_DB", os.path.join(args.data_dir, "results.db"))
+    timings = backfill(args.data_dir, db_path, args.shard, args.jobs, args.tolerance, args.noise_k, args.keep_noise,
+                       args.denoise_window)
+    print(", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+
+    if args.verify:
+        t0 = time.perf_counter()
+        serial = serial_outputs(args.data_dir, args.tolerance, args.noise_k, args.denoise_window)
+        print(f"serial run {time.perf_counter() - t0:.2f}s")
+        same = True
+        for name in OUTPUTS:
+            path = os.path.join(args.data_dir, name)
+            ours = open(path, "rb").read() if os.path.exists(path) else None
+            print(f"{name}: {'identical' if ours == serial[name] else 'DIFFERENT'}")
+            same &= ours == serial[name]
+        if not same:
+            raise SystemExit(1)
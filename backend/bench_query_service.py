@@ -0,0 +1,79 @@
+# bench_query_service.py
+# Concurrent load test for query_service.py.
+#
+# Run against a live service:   python backend/bench_query_service.py --url http://127.0.0.1:8765
+# or let it start one in-process: python backend/bench_query_service.py
+import argparse
+import gzip
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+QUERIES = [
+    "/levels/latest",
+    "/levels?cauldron={cauldron}&start={start}&end={end}",
+    "/drains?cauldron={cauldron}&start={start}&end={end}",
+    "/tickets?cauldron={cauldron}",
+    "/suspicious?days=7",
+    "/rollups?cauldron={cauldron}",
+]
+
+
+def fetch(url):
+    req = urllib.request.Request(url, headers={"Accept-Encoding": "gzip"})
+    t0 = time.perf_counter()
+    with urllib.request.urlopen(req) as resp:
+        body = resp.read()
+        if resp.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+    json.loads(body)
+    return time.perf_counter() - t0
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run(base_url, concurrency, total):
+    health = json.loads(urllib.request.urlopen(f"{base_url}/levels/latest").read())
+    cauldrons = list(health["items"]) or ["cauldron_001"]
+    day_starts = ["2025-10-30", "2025-11-02", "2025-11-05", "2025-11-08"]
+
+    rng = random.Random(0)
+    urls = []
+    for _ in range(total):
+        start = rng.choice(day_starts)
+        q = rng.choice(QUERIES).format(cauldron=rng.choice(cauldrons), start=start, end=f"{start}T06:00")
+        urls.append(base_url + q)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(fetch, urls))
+    elapsed = time.perf_counter() - t0
+
+    ms = [x * 1000 for x in latencies]
+    print(f"{total} requests, concurrency {concurrency}: {total / elapsed:.0f} req/s")
+    print(f"latency ms  p50 {statistics.median(ms):.2f}  p95 {percentile(ms, 95):.2f}  "
+          f"p99 {percentile(ms, 99):.2f}  max {max(ms):.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local query service under concurrent load")
+    parser.add_argument("--url", help="base URL of a running service (default: start one in-process)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    base_url = args.url
+    if not base_url:
+        import query_service
+        server = query_service.serve(port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    run(base_url.rstrip("/"), args.concurrency, args.requests)
@@ -0,0 +1,248 @@
+# build_report.py
+# Static HTML report for read-only audiences (management, auditors).
+#
+# Renders the views they use from maptest.py (daily mismatch heatmap, KPIs and
+# the suspicious tables) once per data version into a self-contained bundle:
+#
+#   <out>/index.html                -> redirects to the newest version
+#   <out>/<version>/index.html      heatmap, KPIs, suspicious days/tickets/drains
+#   <out>/<version>/<cauldron>.html level chart, daily table and findings per cauldron
+#
+# Charts are inline PNGs and the underlying tables are embedded as gzip+base64
+# CSV (the page decompresses them in the browser for download), so any static
+# file server can hand the bundle to any number of readers. The version is a
+# hash of the input files, the build parameters (tolerance) and REPORT_FORMAT,
+# which is bumped whenever the pages change; an existing bundle for it is left
+# alone. Cauldron pages are rendered in parallel worker processes (charts are
+# drawn on bare Figure objects, so no pyplot state or display is involved).
+#
+# Run:  python backend/build_report.py [--data-dir streamlit/data] [--out streamlit/data/report] [--jobs 4] [--force]
+import argparse
+import base64
+import gzip
+import hashlib
+import html
+import io
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from matplotlib.figure import Figure
+
+from assign_tickets import assign_tickets
+from build_rollups import build_rollups
+from verify_drain_tickets import TOLERANCE, verify_drain_tickets
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+INPUTS = ["cauldron_data.csv", "tickets.csv", "drain_events.csv", "cauldrons.csv"]
+REPORT_FORMAT = 1  # bump when the pages change, so existing bundles are rebuilt
+DPI = 100
+
+STYLE = """
+body { font-family: system-ui, sans-serif; margin: 2rem auto; max-width: 1200px; color: #1f2937; }
+h1, h2 { color: #14532d; }
+.kpis { display: flex; gap: 2rem; margin: 1rem 0; }
+.kpi { background: #f0fdf4; border-radius: 6px; padding: 0.8rem 1.2rem; }
+.kpi b { display: block; font-size: 1.6rem; }
+table { border-collapse: collapse; font-size: 0.85rem; margin-bottom: 1rem; }
+th, td { border: 1px solid #d1d5db; padding: 0.25rem 0.5rem; text-align: right; }
+th { background: #f3f4f6; }
+img { max-width: 100%; }
+nav a { margin-right: 0.8rem; }
+.meta { color: #6b7280; font-size: 0.8rem; }
+"""
+
+SCRIPT = """
+async function downloadData(id, name) {
+  const bytes = Uint8Array.from(atob(document.getElementById(id).textContent.trim()), c => c.charCodeAt(0));
+  const text = await new Response(new Blob([bytes]).stream().pipeThrough(new DecompressionStream('gzip'))).text();
+  const link = document.createElement('a');
+  link.href = URL.createObjectURL(new Blob([text], {type: 'text/csv'}));
+  link.download = name;
+  link.click();
+}
+"""
+
+
+def data_version(data_dir, tolerance=TOLERANCE):
+    """Short content hash of the report inputs, build parameters and format."""
+    h = hashlib.sha256()
+    h.update(json.dumps({"format": REPORT_FORMAT, "tolerance": float(tolerance)}, sort_keys=True).encode("utf-8"))
+    for name in INPUTS:
+        path = os.path.join(data_dir, name)
+        h.update(name.encode("utf-8"))
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+    return h.hexdigest()[:16]
+
+
+def load_inputs(data_dir):
+    levels = pd.read_csv(os.path.join(data_dir, "cauldron_data.csv"), index_col="timestamp", parse_dates=True)
+    tickets = pd.read_csv(os.path.join(data_dir, "tickets.csv"))
+    drains = pd.read_csv(os.path.join(data_dir, "drain_events.csv"))
+    cauldrons = pd.read_csv(os.path.join(data_dir, "cauldrons.csv"))
+    return levels, tickets, drains, cauldrons
+
+
+def daily_summary(levels, tickets, drains, cauldrons):
+    """build_rollups plus the capacity-relative columns the dashboard's heatmap and KPIs use."""
+    daily = build_rollups(levels, tickets, drains)
+    capacity = cauldrons.set_index("id")["max_volume"] if "max_volume" in cauldrons.columns else pd.Series(dtype="float64")
+    daily["max_volume"] = daily["cauldron_id"].map(capacity)
+    daily["fill_pct"] = daily["end_volume"] / daily["max_volume"] * 100
+    daily["mismatch_abs"] = daily["mismatch"].abs()
+    daily["mismatch_pct"] = daily["mismatch_abs"] / daily["max_volume"] * 100
+    return daily
+
+
+def kpis(daily):
+    total_days = len(daily)
+    suspicious_days = int((daily["mismatch_abs"] > 0).sum())
+    return {
+        "Total unaccounted (L)": f"{daily['mismatch_abs'].sum():.2f}",
+        "Suspicious day rate": f"{suspicious_days / total_days * 100 if total_days else 0:.1f}%",
+        "Cauldron-days": f"{total_days}",
+    }
+
+
+def png_tag(fig, alt):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", dpi=DPI, bbox_inches="tight")
+    return f'<img alt="{html.escape(alt)}" src="data:image/png;base64,{base64.b64encode(buf.getvalue()).decode("ascii")}">'
+
+
+def heatmap(daily):
+    heat = daily.pivot(index="cauldron_id", columns="day", values="mismatch_pct").fillna(0)
+    fig = Figure(figsize=(12, max(3, heat.shape[0] * 0.5)))
+    ax = fig.subplots()
+    im = ax.imshow(heat.values, aspect="auto", cmap="YlOrRd", origin="upper")
+    ax.set_yticks(range(len(heat.index)))
+    ax.set_yticklabels(heat.index)
+    ax.set_xticks(range(len(heat.columns)))
+    ax.set_xticklabels([d.strftime("%b %d") for d in heat.columns], rotation=90)
+    ax.set_title("Daily Ticket vs Drain Mismatch (% of capacity)")
+    fig.colorbar(im, ax=ax, label="Mismatch %")
+    return png_tag(fig, "Daily mismatch heatmap")
+
+
+def level_chart(series, drains, name):
+    fig = Figure(figsize=(12, 3.5))
+    ax = fig.subplots()
+    ax.plot(series.index, series.to_numpy(), color="darkgreen", linewidth=0.8)
+    for start, end in zip(pd.to_datetime(drains["start_time"], utc=True), pd.to_datetime(drains["end_time"], utc=True)):
+        ax.axvspan(start, end, color="orange", alpha=0.4)
+    ax.set_title(f"{name}: level and significant drains")
+    ax.set_ylabel("Level (L)")
+    return png_tag(fig, f"{name} level history")
+
+
+def embedded(frame, element_id, filename):
+    """The table as a gzip+base64 CSV script block plus its download link."""
+    blob = base64.b64encode(gzip.compress(frame.to_csv(index=False).encode("utf-8"), mtime=0)).decode("ascii")
+    return (f'<script type="application/gzip+base64" id="{element_id}">{blob}</script>'
+            f'<a href="#" onclick="downloadData(\'{element_id}\', \'{filename}\'); return false;">Download {filename}</a>')
+
+
+def table(frame, empty="None."):
+    if frame.empty:
+        return f"<p>{empty}</p>"
+    return frame.to_html(index=False, float_format=lambda x: f"{x:.2f}", border=0)
+
+
+def page(title, body, version):
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+            f"<style>{STYLE}</style><script>{SCRIPT}</script></head><body>"
+            f"<h1>{html.escape(title)}</h1>{body}"
+            f"<p class='meta'>Data version {version}, built {time.strftime('%Y-%m-%d %H:%M UTC', time.gmtime())}</p>"
+            "</body></html>")
+
+
+def cauldron_page(out_dir, version, cauldron, name, series, daily, drains, suspicious, ticket_status):
+    """Write <cauldron>.html; runs in a worker process."""
+    significant = drains[drains["significant"].astype(bool)] if "significant" in drains.columns else drains
+    findings = ticket_status[ticket_status["status"] != "matched"]
+    body = (
+        "<nav><a href='index.html'>&larr; Overview</a></nav>"
+        + level_chart(series, significant, name)
+        + f"<div class='kpis'>{''.join(f'<div class=kpi>{k}<b>{v}</b></div>' for k, v in kpis(daily).items())}</div>"
+        + "<h2>Suspicious days</h2>" + table(suspicious)
+        + "<h2>Tickets not fully backed by drains</h2>" + table(findings)
+        + "<h2>Daily summary</h2>" + table(daily) + embedded(daily, "daily", f"{cauldron}_daily.csv")
+        + "<h2>Drain events</h2>" + embedded(drains, "drains", f"{cauldron}_drains.csv")
+    )
+    with open(os.path.join(out_dir, f"{cauldron}.html"), "w", encoding="utf-8") as f:
+        f.write(page(f"{name} ({cauldron})", body, version))
+    return cauldron
+
+
+def build_report(data_dir=DEFAULT_DATA_DIR, out_dir=None, jobs=None, force=False, tolerance=TOLERANCE):
+    """Build the bundle for the current data version; returns its directory."""
+    out_dir = out_dir or os.path.join(data_dir, "report")
+    version = data_version(data_dir, tolerance)
+    target = os.path.join(out_dir, version)
+    if os.path.exists(os.path.join(target, "index.html")) and not force:
+        return target
+    levels, tickets, drains, cauldrons = load_inputs(data_dir)
+    names = dict(zip(cauldrons["id"], cauldrons["name"])) if "name" in cauldrons.columns else {}
+    daily = daily_summary(levels, tickets, drains, cauldrons)
+    suspicious = verify_drain_tickets(drains, tickets, tolerance)
+    _, ticket_status, unassigned = assign_tickets(tickets, drains)
+    ticket_cols = ["cauldron_id", "date", "amount_collected", "assigned_volume", "assigned_drains", "residual", "status"]
+    ticket_status = ticket_status[ticket_cols]
+    drain_cols = [c for c in ["cauldron_id", "start_time", "end_time", "volume_lost", "duration_min", "peak_drain_rate"] if c in unassigned.columns]
+    unassigned = unassigned[drain_cols]
+
+    # build into a scratch directory and swap it in, so readers never see half a bundle
+    tmp = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(cauldron_page, tmp, version, c, names.get(c, c), levels[c].dropna(),
+                        daily[daily["cauldron_id"] == c].reset_index(drop=True),
+                        drains[drains["cauldron_id"] == c].reset_index(drop=True),
+                        suspicious[suspicious["cauldron_id"] == c].reset_index(drop=True),
+                        ticket_status[ticket_status["cauldron_id"] == c].reset_index(drop=True))
+            for c in levels.columns
+        ]
+        overview = (
+            "<nav>" + "".join(f"<a href='{html.escape(c)}.html'>{html.escape(names.get(c, c))}</a>" for c in levels.columns) + "</nav>"
+            + f"<div class='kpis'>{''.join(f'<div class=kpi>{k}<b>{v}</b></div>' for k, v in kpis(daily).items())}</div>"
+            + "<h2>Daily mismatch</h2>" + heatmap(daily)
+            + f"<h2>Suspicious days (drained vs ticketed differs by more than {tolerance:g} L)</h2>" + table(suspicious)
+            + "<h2>Tickets not fully backed by drains</h2>" + table(ticket_status[ticket_status["status"] != "matched"])
+            + "<h2>Significant drains without a ticket</h2>" + table(unassigned)
+            + "<h2>Data</h2>" + embedded(daily, "daily", "daily_summary.csv") + " &middot; "
+            + embedded(suspicious, "suspicious", "suspicious_events.csv")
+        )
+        with open(os.path.join(tmp, "index.html"), "w", encoding="utf-8") as f:
+            f.write(page("Cauldron reconciliation report", overview, version))
+        for future in futures:
+            future.result()
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(f"<!DOCTYPE html><meta http-equiv='refresh' content='0; url={version}/index.html'>"
+                f"<a href='{version}/index.html'>Latest report</a>")
+    return target
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the static reconciliation report for the current data")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--out", default=None, help="report root (default <data-dir>/report)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes for the cauldron pages")
+    parser.add_argument("--force", action="store_true", help="rebuild even if this data version was already built")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    target = build_report(args.data_dir, args.out, args.jobs, args.force, args.tolerance)
+    print(f"report at {target} ({time.perf_counter() - t0:.2f}s)")
@@ -0,0 +1,52 @@
+# build_rollups.py
+# Daily per-cauldron rollups: end-of-day level, ticketed volume, drained volume
+# and their mismatch (same definitions as build_daily_summary in maptest.py).
+import argparse
+import os
+
+import pandas as pd
+
+import results_store
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+ROLLUP_COLUMNS = ["cauldron_id", "day", "end_volume", "ticket_volume", "drain_volume", "mismatch"]
+
+
+def build_rollups(levels, tickets, drains):
+    """Rollups for a wide level frame (timestamp index, one column per cauldron)."""
+    if levels.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+    days = pd.to_datetime(levels.index, utc=True).floor("D")
+    end_volume = levels.groupby(days).last().rename_axis("day").reset_index()
+    daily = end_volume.melt(id_vars=["day"], var_name="cauldron_id", value_name="end_volume")
+
+    if not tickets.empty:
+        t = tickets.assign(day=pd.to_datetime(tickets["date"], utc=True).dt.floor("D"))
+        t = t.groupby(["cauldron_id", "day"], as_index=False)["amount_collected"].sum()
+        daily = daily.merge(t.rename(columns={"amount_collected": "ticket_volume"}), on=["cauldron_id", "day"], how="left")
+    else:
+        daily["ticket_volume"] = 0.0
+    if not drains.empty:
+        d = drains.assign(day=pd.to_datetime(drains["end_time"], utc=True).dt.floor("D"))
+        d = d.groupby(["cauldron_id", "day"], as_index=False)["volume_lost"].sum()
+        daily = daily.merge(d.rename(columns={"volume_lost": "drain_volume"}), on=["cauldron_id", "day"], how="left")
+    else:
+        daily["drain_volume"] = 0.0
+    daily[["ticket_volume", "drain_volume"]] = daily[["ticket_volume", "drain_volume"]].fillna(0.0)
+    daily["mismatch"] = daily["ticket_volume"] - daily["drain_volume"]
+    return daily.sort_values(["cauldron_id", "day"], kind="mergesort")[ROLLUP_COLUMNS].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily per-cauldron rollups")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+
+    levels = pd.read_csv(os.path.join(args.data_dir, "cauldron_data.csv"), index_col="timestamp", parse_dates=True)
+    tickets = pd.read_csv(os.path.join(args.data_dir, "tickets.csv"))
+    drains = pd.read_csv(os.path.join(args.data_dir, "drain_events.csv"))
+    rollups_df = build_rollups(levels, tickets, drains)
+    results_store.write_csv_atomic(rollups_df, os.path.join(args.data_dir, "daily_rollups.csv"))
+    print(f"{len(rollups_df)} daily rollups saved to daily_rollups.csv")
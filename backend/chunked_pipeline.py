@@ -0,0 +1,243 @@
+# chunked_pipeline.py
+# Out-of-core mode for level histories that don't fit in RAM.
+#
+# cauldron_data.csv is streamed in time chunks. Drain detection carries the last
+# ROLLING_WINDOW rows and any still-open event per cauldron across chunk
+# boundaries, rates carry integer diff totals, the noise floor carries diff
+# histograms (drain_noise.py), and daily end volumes carry the last reading per
+# day, so the outputs are identical to the in-memory scripts while peak memory
+# is set by --chunk-rows rather than history length. Event features need every
+# event's full extent, so they take a second pass over the chunks once
+# detection has finished and the noise events are merged in. With --denoise-window
+# detection runs on the rolling-median filtered levels (denoise.py), streamed
+# the same way; rates always use the raw readings.
+#
+# Run:  python backend/chunked_pipeline.py [--levels streamlit/data/cauldron_data.csv] [--chunk-rows 100000] [--verify]
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import results_store
+
+from compute_rates import compute_rates, level_units, rates_from_totals
+from denoise import StreamingMedianFilter, filtered_chunks
+from drain_noise import NOISE_K, DiffHistogram, daily_noise, split_noise
+from event_features import FEATURE_COLUMNS, StreamingEventFeatures
+from detect_drain_events import (
+    DRAIN_DROP_THRESHOLD,
+    MIN_EVENT_GAP,
+    ROLLING_WINDOW,
+    SIGNIFICANT_VOLUME,
+    detect_drain_events,
+)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+DEFAULT_CHUNK_ROWS = 100_000
+
+
+def iter_level_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Wide level frames of at most ``chunk_rows`` rows, timestamp as index."""
+    for chunk in pd.read_csv(path, parse_dates=["timestamp"], chunksize=chunk_rows):
+        yield chunk.set_index("timestamp")
+
+
+class StreamingDrainDetector:
+    """Same events as ``detect_drain_events`` fed one chunk at a time."""
+
+    def __init__(self):
+        self.columns = None
+        self.tail = None  # last ROLLING_WINDOW rows seen, for the windowed diff
+        self.open = {}  # cauldron -> [start_time, start_level, end_time, end_level]
+        self.events = {}  # cauldron -> closed events, emitted per cauldron like the batch path
+        self.closed = []  # events closed since the last pop_closed(), in closing order
+
+    def feed(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+        carry = 0 if self.tail is None else len(self.tail)
+        frame = chunk if self.tail is None else pd.concat([self.tail, chunk])
+        for cauldron in self.columns:
+            diff = frame[cauldron].diff(ROLLING_WINDOW).to_numpy()[carry:]
+            mask = diff < -DRAIN_DROP_THRESHOLD
+            self._extend(cauldron, chunk.index[mask], chunk[cauldron].to_numpy()[mask])
+        self.tail = frame.iloc[-ROLLING_WINDOW:]
+
+    def _extend(self, cauldron, times, levels):
+        current = self.open.get(cauldron)
+        closed = self.events.setdefault(cauldron, [])
+        for t, level in zip(times, levels):
+            if current is None:
+                current = [t, level, t, level]
+            elif (t - current[2]).seconds / 60 > MIN_EVENT_GAP:
+                closed.append(self._event(cauldron, current))
+                self.closed.append(closed[-1])
+                current = [t, level, t, level]
+            else:
+                current[2] = t
+                current[3] = level
+        self.open[cauldron] = current
+
+    @staticmethod
+    def _event(cauldron, current):
+        return {
+            "cauldron_id": cauldron,
+            "start_time": current[0],
+            "end_time": current[2],
+            "volume_lost": abs(current[1] - current[3]),
+        }
+
+    def open_event(self, cauldron):
+        """The event still open for ``cauldron`` (it may grow with the next chunk), or None."""
+        current = self.open.get(cauldron)
+        return None if current is None else self._event(cauldron, current)
+
+    def pop_closed(self):
+        """Events closed by the chunks fed since the previous call (for incremental consumers)."""
+        closed, self.closed = self.closed, []
+        return closed
+
+    def finish(self):
+        rows = []
+        for cauldron in self.columns or []:
+            rows.extend(self.events.get(cauldron, []))
+            if self.open.get(cauldron) is not None:
+                rows.append(self._event(cauldron, self.open[cauldron]))
+        events_df = pd.DataFrame(rows)
+        events_df["significant"] = events_df["volume_lost"] >= SIGNIFICANT_VOLUME
+        return events_df
+
+
+class StreamingRates:
+    """Integer diff totals per cauldron, carried across chunks."""
+
+    def __init__(self):
+        self.columns = None
+        self.last = None  # previous chunk's final row
+        self.totals = {}
+
+    def feed(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.totals = {c: [0, 0, 0, 0] for c in self.columns}
+        for cauldron in self.columns:
+            values = chunk[cauldron].to_numpy(dtype="float64")
+            if self.last is not None:
+                values = np.concatenate([[self.last[cauldron]], values])
+            units, valid = level_units(values)
+            d = np.diff(units)
+            ok = valid[1:] & valid[:-1]
+            pos = ok & (d > 0)
+            neg = ok & (d < 0)
+            t = self.totals[cauldron]
+            t[0] += int(d[pos].sum())
+            t[1] += int(pos.sum())
+            t[2] += int(d[neg].sum())
+            t[3] += int(neg.sum())
+        self.last = chunk.iloc[-1]
+
+    def finish(self):
+        return rates_from_totals({c: tuple(t) for c, t in self.totals.items()})
+
+
+class StreamingDailyEndVolume:
+    """Last non-null reading per (cauldron, UTC day), as in build_daily_summary."""
+
+    def __init__(self):
+        self.days = None
+
+    def feed(self, chunk):
+        days = chunk.index.tz_convert("UTC").floor("D") if chunk.index.tz is not None else chunk.index.floor("D")
+        last = chunk.groupby(days).last()
+        # a day split across chunks: later non-null readings win
+        self.days = last if self.days is None else last.combine_first(self.days)
+
+    def finish(self):
+        if self.days is None:
+            return pd.DataFrame(columns=["cauldron_id", "date", "end_volume"])
+        out = self.days.sort_index().rename_axis("date").reset_index()
+        out["date"] = out["date"].dt.date
+        out = out.melt(id_vars=["date"], var_name="cauldron_id", value_name="end_volume")
+        return out[["cauldron_id", "date", "end_volume"]].sort_values(["cauldron_id", "date"], kind="mergesort").reset_index(drop=True)
+
+
+def daily_end_volumes(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    acc = StreamingDailyEndVolume()
+    for chunk in iter_level_chunks(path, chunk_rows):
+        acc.feed(chunk)
+    return acc.finish()
+
+
+def run_chunked(path, chunk_rows=DEFAULT_CHUNK_ROWS, noise_k=NOISE_K, return_noise=False, denoise_window=0):
+    """(drain events with features, rates) for the level history at ``path``, streamed.
+
+    Noise events are merged in as in detect_drain_events; with ``return_noise``
+    their per-day counts come back as a third frame. ``denoise_window`` > 0
+    detects on the rolling-median filtered levels.
+    """
+    detector = StreamingDrainDetector()
+    rates = StreamingRates()
+    hist = DiffHistogram()
+    smoother = StreamingMedianFilter(denoise_window) if denoise_window else None
+
+    def detect(chunk):
+        if len(chunk):
+            detector.feed(chunk)
+            hist.feed(chunk)
+
+    for chunk in iter_level_chunks(path, chunk_rows):
+        rates.feed(chunk)
+        detect(chunk if smoother is None else smoother.feed(chunk))
+    if smoother is not None:
+        detect(smoother.finish())
+    events_df, rates_df = detector.finish(), rates.finish()
+    events_df, noise_df = split_noise(events_df, hist.floors(SIGNIFICANT_VOLUME, noise_k))
+    if events_df.empty:
+        events_df = events_df.reindex(columns=list(events_df.columns) + FEATURE_COLUMNS)
+    else:
+        features = StreamingEventFeatures(events_df, ROLLING_WINDOW)
+        chunks = iter_level_chunks(path, chunk_rows)
+        for chunk in filtered_chunks(chunks, denoise_window) if denoise_window else chunks:
+            features.feed(chunk)
+        events_df = features.finish(rates_df)
+    if return_noise:
+        return events_df, rates_df, daily_noise(noise_df)
+    return events_df, rates_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Out-of-core drain detection and rates")
+    parser.add_argument("--levels", default=os.path.join(DEFAULT_DATA_DIR, "cauldron_data.csv"))
+    parser.add_argument("--out-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--noise-k", type=float, default=NOISE_K, help="noise floor in MAD sigmas (0 keeps every event)")
+    parser.add_argument("--keep-noise", action="store_true", help="write per-day counts of the merged noise events to drain_noise.csv")
+    parser.add_argument("--denoise-window", type=int, default=0, help="rolling-median window in rows before detection (odd; 0 = off)")
+    parser.add_argument("--verify", action="store_true", help="also run the in-memory path and compare outputs")
+    args = parser.parse_args()
+
+    events_df, rates_df, noise_df = run_chunked(args.levels, args.chunk_rows, args.noise_k, return_noise=True,
+                                                denoise_window=args.denoise_window)
+    events_file = os.path.join(args.out_dir, "drain_events.csv")
+    rates_file = os.path.join(args.out_dir, "cauldron_rates.csv")
+    results_store.write_csv_atomic(events_df, events_file)
+    results_store.write_csv_atomic(rates_df, rates_file)
+    results_store.replace_table("drain_events", events_df)
+    results_store.replace_table("cauldron_rates", rates_df)
+    print(f"{len(events_df)} drain events saved to {events_file}")
+    print(f"Rates saved to {rates_file}")
+    if args.keep_noise:
+        noise_file = os.path.join(args.out_dir, "drain_noise.csv")
+        results_store.write_csv_atomic(noise_df, noise_file)
+        print(f"{int(noise_df['noise_events'].sum())} noise events counted in {noise_file}")
+
+    if args.verify:
+        df = pd.read_csv(args.levels, parse_dates=["timestamp"]).set_index("timestamp")
+        same_events = (detect_drain_events(df, args.noise_k, denoise_window=args.denoise_window).to_csv(index=False)
+                       == events_df.to_csv(index=False))
+        same_rates = compute_rates(df).to_csv(index=False) == rates_df.to_csv(index=False)
+        print(f"identical to in-memory run: events {same_events}, rates {same_rates}")
+        if not (same_events and same_rates):
+            raise SystemExit(1)
@@ -0,0 +1,218 @@
+# courier_trips.py
+# Reconstruct likely courier trips from the drain events of all cauldrons.
+#
+# A courier drains one cauldron, walks to the next and drains that one, so a
+# trip shows up as a chain of drains at different cauldrons where each drain
+# starts a plausible travel time after the previous one ended. Travel times
+# come from the cauldron coordinates in cauldrons.csv (great-circle distance at
+# SPEED_KMH); a courier may also wait up to MAX_IDLE_MINUTES on top of that,
+# and a trip ends MAX_TRIP_MINUTES after it started (one shift). A drain at the
+# cauldron a trip is already at (no travel) continues that stop: the detector
+# splits one drain into several events wherever the level pauses for more
+# than MIN_EVENT_GAP, and those are one visit, not a walk of zero minutes.
+#
+# The per-cauldron event lists are already sorted by time, so they are
+# sort-merged on start time (heapq.merge) and swept once. Trips that could
+# still be extended are kept per last cauldron, sorted by end time; each new
+# drain binary-searches every cauldron's list for the trip that ended latest
+# while still leaving time to get here, and extends the best fit (least idle
+# time) or starts a new trip. Trips that can no longer be extended leave the
+# lists through a heap keyed by their deadline (the last start that could still
+# extend them, by idle time or trip length). That is O(n log n) for n drains
+# (times the number of cauldrons, which is small and fixed) instead of trying
+# every pair of events.
+#
+# Each trip's ticketed volume comes from the exclusive ticket <-> drain
+# assignment (assign_tickets.py): a ticket's amount goes to the drain it is
+# paired with (split by volume if the assignment is run with multi=True), and a
+# trip collects the shares of its drains. Trips whose drained volume is off
+# their ticketed volume by more than FILL_TOLERANCE of it are flagged (a trip
+# nobody ticketed always is).
+#
+# Run:  python backend/courier_trips.py [--data-dir streamlit/data] [--speed-kmh 5] [--max-idle 60] [--max-trip 480]
+import argparse
+import heapq
+import os
+import time
+from bisect import bisect_right, insort
+
+import numpy as np
+import pandas as pd
+
+import results_store
+
+from assign_tickets import FILL_TOLERANCE, assign_tickets
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+SPEED_KMH = 5.0  # a courier on foot with a cart
+MAX_IDLE_MINUTES = 60.0  # waiting allowed on top of the travel time between two stops
+MAX_TRIP_MINUTES = 8 * 60.0  # first drain start to last drain start of one trip
+EARTH_RADIUS_KM = 6371.0
+MINUTE_NS = 60_000_000_000
+
+TRIP_COLUMNS = ["trip_id", "start_time", "end_time", "stops", "drains", "route", "travel_minutes", "idle_minutes",
+                "volume_lost", "ticketed_volume", "difference", "flagged"]
+
+
+def _ns(series):
+    return pd.to_datetime(series, utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+
+
+def travel_minutes(cauldrons, speed_kmh=SPEED_KMH):
+    """Travel time in minutes between every pair of cauldrons, as a frame indexed by id both ways."""
+    lat = np.radians(cauldrons["latitude"].to_numpy(dtype="float64"))
+    lon = np.radians(cauldrons["longitude"].to_numpy(dtype="float64"))
+    dlat = lat[:, None] - lat[None, :]
+    dlon = lon[:, None] - lon[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:, None]) * np.cos(lat[None, :]) * np.sin(dlon / 2) ** 2
+    km = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    ids = cauldrons["id"].to_numpy()
+    return pd.DataFrame(km / speed_kmh * 60, index=ids, columns=ids)
+
+
+def chain_drains(drains, travel, max_idle=MAX_IDLE_MINUTES, max_trip=MAX_TRIP_MINUTES):
+    """Trip number per drain (aligned with ``drains``) and the idle minutes before each (NaN for a trip's first).
+
+    ``travel`` is the matrix from travel_minutes(); drains at cauldrons missing
+    from it always start a new trip.
+    """
+    ids = list(travel.index)
+    slot = {c: i for i, c in enumerate(ids)}
+    travel_ns = np.rint(travel.to_numpy() * MINUTE_NS).astype("int64")
+    idle_ns = int(max_idle * MINUTE_NS)
+    trip_ns = int(max_trip * MINUTE_NS)
+    reach_ns = travel_ns.max(axis=1) + idle_ns if len(ids) else travel_ns  # longest useful wait after a stop
+    starts = _ns(drains["start_time"])
+    ends = _ns(drains["end_time"])
+
+    lists = [
+        ((starts[i], i) for i in idx[np.argsort(starts[idx], kind="stable")])
+        for idx in drains.groupby("cauldron_id", sort=False).indices.values()
+    ]
+    trip = np.full(len(drains), -1, dtype="int64")
+    idle = np.full(len(drains), np.nan)
+    open_ends = [[] for _ in ids]  # per last cauldron: sorted (end_ns, trip, drain) of trips that may continue
+    deadlines = []  # (last useful start_ns, slot, end_ns, trip, drain)
+    trip_start = []
+    n_trips = 0
+    for start, i in heapq.merge(*lists):
+        while deadlines and deadlines[0][0] < start:
+            _, s, end, t, j = heapq.heappop(deadlines)
+            k = bisect_right(open_ends[s], (end, t, j)) - 1
+            if k >= 0 and open_ends[s][k] == (end, t, j):
+                del open_ends[s][k]
+        here = slot.get(drains["cauldron_id"].iat[i])
+        best = None
+        if here is not None:
+            for s, entries in enumerate(open_ends):
+                latest = start - travel_ns[s, here]
+                k = bisect_right(entries, (latest, n_trips, len(drains))) - 1
+                if k >= 0 and latest - entries[k][0] <= idle_ns and (best is None or latest - entries[k][0] < best[0]):
+                    best = (latest - entries[k][0], s, k)
+        if best is None:
+            t = n_trips
+            n_trips += 1
+            trip_start.append(start)
+        else:
+            wait, s, k = best
+            _, t, _ = open_ends[s].pop(k)
+            idle[i] = wait / MINUTE_NS
+        trip[i] = t
+        if here is not None:
+            insort(open_ends[here], (ends[i], t, i))
+            heapq.heappush(deadlines, (min(ends[i] + reach_ns[here], trip_start[t] + trip_ns), here, ends[i], t, i))
+    return trip, idle
+
+
+def ticket_shares(pairs):
+    """Ticketed volume per assigned drain, keyed by (cauldron_id, start_time): each ticket split over its drains by volume."""
+    if pairs.empty:
+        return pd.Series(dtype="float64")
+    weight = pairs["volume_lost"] / pairs.groupby("ticket_index")["volume_lost"].transform("sum")
+    share = pairs["amount_collected"] * weight.fillna(0.0)
+    return share.groupby([pairs["cauldron_id"], pairs["start_time"]]).sum()
+
+
+def courier_trips(drains, tickets, cauldrons, speed_kmh=SPEED_KMH, max_idle=MAX_IDLE_MINUTES,
+                  tolerance=FILL_TOLERANCE, significant_only=True, max_trip=MAX_TRIP_MINUTES):
+    """(trips, stops): one row per reconstructed trip, and its stops (one or more drains at one cauldron) in order."""
+    if significant_only and "significant" in drains.columns:
+        drains = drains[drains["significant"].astype(bool)]
+    drains = drains.reset_index(drop=True)
+    travel = travel_minutes(cauldrons, speed_kmh)
+    trip, idle = chain_drains(drains, travel, max_idle, max_trip)
+
+    pairs, _, _ = assign_tickets(tickets, drains)
+    shares = ticket_shares(pairs)
+    keys = pd.MultiIndex.from_arrays([drains["cauldron_id"], drains["start_time"]])
+    ticketed = shares.reindex(keys).fillna(0.0).to_numpy() if len(shares) else np.zeros(len(drains))
+
+    visits = drains[["cauldron_id", "start_time", "end_time", "volume_lost"]].assign(
+        trip_id=trip, idle_minutes=idle, ticketed_volume=ticketed, _start=_ns(drains["start_time"]))
+    visits = visits.sort_values(["trip_id", "_start"], kind="mergesort")
+    moved = visits["cauldron_id"] != visits.groupby("trip_id")["cauldron_id"].shift()
+    visits["stop"] = moved.groupby(visits["trip_id"]).cumsum() - 1
+    g = visits.groupby(["trip_id", "stop"], sort=True)
+    stops = pd.DataFrame({
+        "cauldron_id": g["cauldron_id"].first(),
+        "start_time": g["start_time"].first(),
+        "end_time": g["end_time"].last(),
+        "drains": g.size(),
+        "idle_minutes": g["idle_minutes"].sum(min_count=1),  # waiting before the stop and between its drains
+        "volume_lost": g["volume_lost"].sum(),
+        "ticketed_volume": g["ticketed_volume"].sum(),
+    }).reset_index()
+    prev = stops.groupby("trip_id")["cauldron_id"].shift()
+    has_prev = prev.notna().to_numpy()
+    legs = np.zeros(len(stops))
+    legs[has_prev] = travel.to_numpy()[travel.index.get_indexer(prev[has_prev]),
+                                       travel.columns.get_indexer(stops["cauldron_id"][has_prev])]
+    stops["travel_minutes"] = np.where(has_prev, legs, np.nan)
+    stops = stops[["trip_id", "stop", "cauldron_id", "start_time", "end_time", "drains", "travel_minutes",
+                   "idle_minutes", "volume_lost", "ticketed_volume"]]
+
+    if stops.empty:
+        return pd.DataFrame(columns=TRIP_COLUMNS), stops
+    g = stops.groupby("trip_id", sort=True)
+    trips = pd.DataFrame({
+        "start_time": g["start_time"].first(),
+        "end_time": g["end_time"].last(),
+        "stops": g.size(),
+        "drains": g["drains"].sum(),
+        "route": g["cauldron_id"].agg(" > ".join),
+        "travel_minutes": g["travel_minutes"].sum(),
+        "idle_minutes": g["idle_minutes"].sum(),
+        "volume_lost": g["volume_lost"].sum(),
+        "ticketed_volume": g["ticketed_volume"].sum(),
+    })
+    trips["difference"] = trips["volume_lost"] - trips["ticketed_volume"]
+    trips["flagged"] = trips["difference"].abs() > tolerance * trips["ticketed_volume"]
+    trips = trips.rename_axis("trip_id").reset_index()
+    return trips[TRIP_COLUMNS], stops
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconstruct courier trips from the drain events of all cauldrons")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--speed-kmh", type=float, default=SPEED_KMH)
+    parser.add_argument("--max-idle", type=float, default=MAX_IDLE_MINUTES, help="minutes a courier may wait between stops")
+    parser.add_argument("--max-trip", type=float, default=MAX_TRIP_MINUTES, help="minutes from a trip's first drain to its last")
+    parser.add_argument("--tolerance", type=float, default=FILL_TOLERANCE, help="allowed mismatch as a fraction of the ticketed volume")
+    parser.add_argument("--all-drains", action="store_true", help="also chain drains below the significance cut")
+    args = parser.parse_args()
+
+    drains = pd.read_csv(os.path.join(args.data_dir, "drain_events.csv"))
+    tickets = pd.read_csv(os.path.join(args.data_dir, "tickets.csv"))
+    cauldrons = pd.read_csv(os.path.join(args.data_dir, "cauldrons.csv"))
+    t0 = time.perf_counter()
+    trips, stops = courier_trips(drains, tickets, cauldrons, args.speed_kmh, args.max_idle, args.tolerance,
+                                 not args.all_drains, args.max_trip)
+    elapsed = time.perf_counter() - t0
+    results_store.write_csv_atomic(trips, os.path.join(args.data_dir, "courier_trips.csv"))
+    results_store.write_csv_atomic(stops, os.path.join(args.data_dir, "courier_trip_stops.csv"))
+    print(f"{len(trips)} trips, {len(stops)} stops over {int(trips['drains'].sum())} drains in {elapsed:.2f}s")
+    multi = trips[trips["stops"] > 1]
+    print(f"{len(multi)} trips visit more than one cauldron, {int(trips['flagged'].sum())} flagged "
+          f"(|drained - ticketed| > {args.tolerance:.0%} of ticketed)")
@@ -0,0 +1,171 @@
+# denoise.py
+# Optional rolling-median denoising of the level columns before detection.
+#
+# The sensors jitter by a few hundredths of a liter per minute, so the raw
+# series is full of 1-2 minute dips that detection has to threshold away. A
+# centered rolling median over WINDOW rows removes those spikes and keeps the
+# edges of real drains in place (a median does not smear a step the way a
+# mean does).
+#
+# Each column keeps the readings of its current window in two heaps (the lower
+# half as a max-heap, the upper half as a min-heap). Readings that leave the
+# window are deleted lazily: they are counted and only popped once they reach
+# the top of a heap. Insert, delete and median are O(log w), so a pass is
+# O(n log w) and needs no per-window sort.
+#
+# A row's median needs the WINDOW // 2 rows after it. The streaming filter
+# therefore returns rows half a window after it is fed them, and finish()
+# filters the last rows over the shorter windows at the end of the data, the
+# same way the first rows use the shorter windows at the start. Batch and
+# incremental runs give the same values. Missing readings stay missing and
+# are left out of their neighbours' windows.
+import heapq
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+WINDOW = 5  # rows (minutes in the sample data); odd, so the window is centered
+
+
+class RollingMedian:
+    """Median of a multiset under insert/delete: two heaps with lazy deletion."""
+
+    def __init__(self):
+        self.low = []  # max-heap (negated) of the lower half
+        self.high = []  # min-heap of the upper half
+        self.deleted = Counter()  # value -> copies still in a heap but gone from the window
+        self.low_size = 0  # live entries per heap
+        self.high_size = 0
+
+    def __len__(self):
+        return self.low_size + self.high_size
+
+    def _prune(self, heap, sign):
+        while heap and self.deleted[sign * heap[0]]:
+            self.deleted[sign * heap[0]] -= 1
+            heapq.heappop(heap)
+
+    def _rebalance(self):
+        # invariant: low_size == high_size or low_size == high_size + 1, live values on top
+        if self.low_size > self.high_size + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.low_size -= 1
+            self.high_size += 1
+            self._prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.high_size -= 1
+            self.low_size += 1
+            self._prune(self.high, 1)
+
+    def add(self, x):
+        if not self.low_size or x <= -self.low[0]:
+            heapq.heappush(self.low, -x)
+            self.low_size += 1
+        else:
+            heapq.heappush(self.high, x)
+            self.high_size += 1
+        self._rebalance()
+
+    def remove(self, x):
+        """Delete one copy of ``x``, which must be in the multiset."""
+        self.deleted[x] += 1
+        if x <= -self.low[0]:
+            self.low_size -= 1
+            if x == -self.low[0]:
+                self._prune(self.low, -1)
+        else:
+            self.high_size -= 1
+            if x == self.high[0]:
+                self._prune(self.high, 1)
+        self._rebalance()
+
+    def median(self):
+        if not self.low_size:
+            return np.nan
+        if self.low_size > self.high_size:
+            return -self.low[0]
+        return (-self.low[0] + self.high[0]) / 2
+
+
+class StreamingMedianFilter:
+    """Centered rolling median of every column of a wide level frame, fed one chunk at a time."""
+
+    def __init__(self, window=WINDOW):
+        if window < 1 or window % 2 == 0:
+            raise ValueError(f"window must be a positive odd number of rows, got {window}")
+        self.half = window // 2
+        self.columns = None
+        self.index_name = None
+        self.medians = None  # one RollingMedian per column
+        self.rows = deque()  # (row number, timestamp, readings) from the oldest row still in a window on
+        self.fed = 0  # rows fed so far
+        self.emitted = 0  # rows returned so far
+
+    def _emit(self, last):
+        """Filtered rows ``self.emitted`` .. ``last`` (row numbers), each over its window up to ``last + half``."""
+        times, out = [], []
+        for t in range(self.emitted, last + 1):
+            while self.rows[0][0] < t - self.half:
+                _, _, old = self.rows.popleft()
+                for median, x in zip(self.medians, old):
+                    if x == x:
+                        median.remove(x)
+            _, time, readings = self.rows[t - self.rows[0][0]]
+            times.append(time)
+            out.append([m.median() if x == x else np.nan for m, x in zip(self.medians, readings)])
+        self.emitted = last + 1
+        return times, out
+
+    def feed(self, chunk):
+        """The rows whose whole window has now been seen, filtered."""
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self.index_name = chunk.index.name
+            self.medians = [RollingMedian() for _ in self.columns]
+        times, out = [], []
+        for time, readings in zip(chunk.index, chunk[self.columns].to_numpy(dtype="float64").tolist()):
+            self.rows.append((self.fed, time, readings))
+            for median, x in zip(self.medians, readings):
+                if x == x:
+                    median.add(x)
+            if self.fed >= self.half:
+                t, o = self._emit(self.fed - self.half)
+                times += t
+                out += o
+            self.fed += 1
+        return self._frame(times, out)
+
+    def finish(self):
+        """The last WINDOW // 2 rows, filtered over the windows that end with the data."""
+        times, out = [], []
+        while self.emitted < self.fed:
+            t, o = self._emit(self.emitted)
+            times += t
+            out += o
+        return self._frame(times, out)
+
+    def _frame(self, times, out):
+        values = np.array(out, dtype="float64").reshape(len(out), len(self.columns or []))
+        return pd.DataFrame(values, index=pd.Index(times, name=self.index_name), columns=self.columns)
+
+
+def median_filter(df, window=WINDOW):
+    """Centered rolling median of every column of a wide level frame (timestamp index)."""
+    acc = StreamingMedianFilter(window)
+    out = pd.concat([acc.feed(df), acc.finish()])
+    out.index = df.index
+    return out
+
+
+def filtered_chunks(chunks, window=WINDOW):
+    """Filter a stream of wide level chunks; yields the filtered rows as they complete."""
+    acc = StreamingMedianFilter(window)
+    for chunk in chunks:
+        out = acc.feed(chunk)
+        if len(out):
+            yield out
+    out = acc.finish()
+    if len(out):
+        yield out
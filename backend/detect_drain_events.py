@@ -1,51 +1,98 @@
+import argparse
 import os
 import pandas as pd
 
-script_dir = os.path.dirname(__file__)
-file_path = os.path.join(script_dir, "cauldron_data.csv")
-df = pd.read_csv(file_path, parse_dates=["timestamp"])
-df.set_index("timestamp", inplace=True)
+import results_store
+
+from compute_rates import compute_rates
+from denoise import median_filter
+from drain_noise import NOISE_K, daily_noise, noise_floors, split_noise
+from event_features import event_features
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
 
 DRAIN_DROP_THRESHOLD = 0.01  # catch all small drops
 MIN_EVENT_GAP = 1  # minutes
 ROLLING_WINDOW = 3
+SIGNIFICANT_VOLUME = 0.2
+
+
+def detect_drain_events(df, noise_k=NOISE_K, return_noise=False, denoise_window=0):
+    """Drain events for a wide level frame (timestamp index, one column per cauldron).
+
+    Events below the cauldron's noise floor (drain_noise.py, ``noise_k`` sigmas;
+    0 keeps everything) are merged into the nearest event of their cauldron-day,
+    so the volume per cauldron-day does not depend on the floor. Each event
+    carries the per-event features of event_features.py. With ``return_noise``
+    the merged events are also returned, counted per cauldron-day.
+    ``denoise_window`` > 0 detects on the rolling-median filtered levels
+    (denoise.py); fill rates stay raw.
+    """
+    raw = df
+    if denoise_window:
+        df = median_filter(df, denoise_window)
+    drain_events = []
+
+    for cauldron in df.columns:
+        diff = df[cauldron].diff(ROLLING_WINDOW)
+        drain_mask = diff < -DRAIN_DROP_THRESHOLD
+        drain_times = df.index[drain_mask]
+
+        if not drain_times.empty:
+            current_event = [drain_times[0]]
+            for t in drain_times[1:]:
+                if (t - current_event[-1]).seconds / 60 > MIN_EVENT_GAP:
+                    event_start = current_event[0]
+                    event_end = current_event[-1]
+                    volume_change = df.loc[event_start, cauldron] - df.loc[event_end, cauldron]
+                    drain_events.append({
+                        "cauldron_id": cauldron,
+                        "start_time": event_start,
+                        "end_time": event_end,
+                        "volume_lost": abs(volume_change)
+                    })
+                    current_event = [t]
+                else:
+                    current_event.append(t)
+            # last event
+            event_start = current_event[0]
+            event_end = current_event[-1]
+            volume_change = df.loc[event_start, cauldron] - df.loc[event_end, cauldron]
+            drain_events.append({
+                "cauldron_id": cauldron,
+                "start_time": event_start,
+                "end_time": event_end,
+                "volume_lost": abs(volume_change)
+            })
+
+    events_df = pd.DataFrame(drain_events)
+    events_df["significant"] = events_df["volume_lost"] >= SIGNIFICANT_VOLUME
+    events_df, noise_df = split_noise(events_df, noise_floors(df, SIGNIFICANT_VOLUME, noise_k))
+    events_df = event_features(df, events_df, ROLLING_WINDOW, compute_rates(raw))
+    if return_noise:
+        return events_df, daily_noise(noise_df)
+    return events_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detect drain events in cauldron_data.csv")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--noise-k", type=float, default=NOISE_K, help="noise floor in MAD sigmas (0 keeps every event)")
+    parser.add_argument("--keep-noise", action="store_true", help="write per-day counts of the merged noise events to drain_noise.csv")
+    parser.add_argument("--denoise-window", type=int, default=0, help="rolling-median window in rows before detection (odd; 0 = off)")
+    args = parser.parse_args()
+
+    file_path = os.path.join(args.data_dir, "cauldron_data.csv")
+    df = pd.read_csv(file_path, parse_dates=["timestamp"])
+    df.set_index("timestamp", inplace=True)
 
-drain_events = []
-
-for cauldron in df.columns:
-    diff = df[cauldron].diff(ROLLING_WINDOW)
-    drain_mask = diff < -DRAIN_DROP_THRESHOLD
-    drain_times = df.index[drain_mask]
-
-    if not drain_times.empty:
-        current_event = [drain_times[0]]
-        for t in drain_times[1:]:
-            if (t - current_event[-1]).seconds / 60 > MIN_EVENT_GAP:
-                event_start = current_event[0]
-                event_end = current_event[-1]
-                volume_change = df.loc[event_start, cauldron] - df.loc[event_end, cauldron]
-                drain_events.append({
-                    "cauldron_id": cauldron,
-                    "start_time": event_start,
-                    "end_time": event_end,
-                    "volume_lost": abs(volume_change)
-                })
-                current_event = [t]
-            else:
-                current_event.append(t)
-        # last event
-        event_start = current_event[0]
-        event_end = current_event[-1]
-        volume_change = df.loc[event_start, cauldron] - df.loc[event_end, cauldron]
-        drain_events.append({
-            "cauldron_id": cauldron,
-            "start_time": event_start,
-            "end_time": event_end,
-            "volume_lost": abs(volume_change)
-        })
-
-events_df = pd.DataFrame(drain_events)
-events_df["significant"] = events_df["volume_lost"] >= 0.2
-events_file = os.path.join(script_dir, "drain_events.csv")
-events_df.to_csv(events_file, index=False)
-print("Drain events detected and saved to drain_events.csv")
+    events_df, noise_df = detect_drain_events(df, args.noise_k, return_noise=True, denoise_window=args.denoise_window)
+    events_file = os.path.join(args.data_dir, "drain_events.csv")
+    results_store.write_csv_atomic(events_df, events_file)
+    results_store.replace_table("drain_events", events_df)
+    print(f"{len(events_df)} drain events detected and saved to drain_events.csv")
+    if args.keep_noise:
+        noise_file = os.path.join(args.data_dir, "drain_noise.csv")
+        results_store.write_csv_atomic(noise_df, noise_file)
+        print(f"{int(noise_df['noise_events'].sum())} noise events counted in {noise_file}")
@@ -0,0 +1,149 @@
+# drain_noise.py
+# Per-cauldron noise floor for drain detection.
+#
+# DRAIN_DROP_THRESHOLD catches every small drop, so most detected events are
+# sensor jitter: a minute or two long with volume_lost at or near zero. The
+# noise of a cauldron is the spread of its 1-step level diffs, measured as
+# 1.4826 * MAD (median absolute deviation, a sigma that the few hours of real
+# draining per day barely move). Events that lost less than NOISE_K of those
+# sigmas are fragments, not events of their own: their volume is merged into
+# the nearest event above the floor on the same cauldron and UTC start day
+# (whose times stay as they are), and the fragments of a cauldron-day without
+# one become a single event spanning them. So the drained volume per
+# cauldron-day, which verify_drain_tickets reconciles, is the same as without a
+# floor. The floor is capped at the significance cut, so a significant event
+# is never merged away, and merging does not change the significant flags.
+#
+# Diffs are counted as integer centi-liters (compute_rates.level_units), which
+# makes the median and MAD exact and lets chunks, backfill shards and the
+# alert daemon build the same floor from partial histograms.
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from compute_rates import LEVEL_SCALE, level_units
+
+NOISE_K = 3.0
+MAD_SIGMA = 1.4826
+NOISE_COLUMNS = ["cauldron_id", "day", "noise_events", "noise_volume"]
+DAY_NS = 86_400 * 1_000_000_000
+
+
+def diff_counts(values):
+    """Counter of the 1-step diffs (centi-liters) between consecutive non-missing readings."""
+    units, valid = level_units(values)
+    d = np.diff(units)[valid[1:] & valid[:-1]]
+    keys, counts = np.unique(d, return_counts=True)
+    return Counter(dict(zip(keys.tolist(), counts.tolist())))
+
+
+def _weighted_median(keys, counts):
+    """np.median of the sample where ``keys[i]`` occurs ``counts[i]`` times (keys sorted)."""
+    cum = np.cumsum(counts)
+    n = cum[-1]
+    lo = keys[np.searchsorted(cum, (n - 1) // 2, "right")]
+    hi = keys[np.searchsorted(cum, n // 2, "right")]
+    return (lo + hi) / 2
+
+
+def floor_from_counts(counts, cap, k=NOISE_K):
+    """Noise floor in liters for one cauldron's diff histogram, at most ``cap``."""
+    if not counts or k <= 0:
+        return 0.0
+    keys = np.array(sorted(counts), dtype="float64")
+    weights = np.array([counts[key] for key in sorted(counts)], dtype="int64")
+    median = _weighted_median(keys, weights)
+    deviation = np.abs(keys - median)
+    order = np.argsort(deviation, kind="mergesort")
+    mad = _weighted_median(deviation[order], weights[order])
+    return float(min(k * MAD_SIGMA * mad / LEVEL_SCALE, cap))
+
+
+class DiffHistogram:
+    """Diff histograms per cauldron, fed a wide level frame one chunk at a time."""
+
+    def __init__(self):
+        self.counts = {}
+        self.last = None  # previous chunk's final row
+
+    def feed(self, chunk):
+        for cauldron in chunk.columns:
+            values = chunk[cauldron].to_numpy(dtype="float64")
+            if self.last is not None:
+                values = np.concatenate([[self.last[cauldron]], values])
+            self.add(cauldron, diff_counts(values))
+        if len(chunk):
+            self.last = chunk.iloc[-1]
+
+    def add(self, cauldron, counts):
+        self.counts.setdefault(cauldron, Counter()).update(counts)
+
+    def floors(self, cap, k=NOISE_K):
+        return {c: floor_from_counts(counts, cap, k) for c, counts in self.counts.items()}
+
+
+def noise_floors(df, cap, k=NOISE_K):
+    """{cauldron: floor in liters} for a wide level frame."""
+    hist = DiffHistogram()
+    hist.feed(df)
+    return hist.floors(cap, k)
+
+
+def noise_owners(cauldrons, start_ns, end_ns, noise):
+    """Row that carries each event's volume once the ``noise`` events are merged away.
+
+    Events must be in (cauldron, start) order. An event above the floor owns
+    itself; a noise event goes to the closer (by gap) of the events above the
+    floor before and after it on the same cauldron and UTC start day, or to the
+    first noise event of that cauldron-day when it has none.
+    """
+    n = len(noise)
+    pos = np.arange(n)
+    if not n:
+        return pos
+    day = start_ns // DAY_NS
+    new = np.ones(n, dtype=bool)
+    new[1:] = (cauldrons[1:] != cauldrons[:-1]) | (day[1:] != day[:-1])
+    first = np.maximum.accumulate(np.where(new, pos, 0))
+    last = np.minimum.accumulate(np.where(np.append(new[1:], True), pos, n)[::-1])[::-1]
+    prev = np.maximum.accumulate(np.where(noise, -1, pos))
+    nxt = np.minimum.accumulate(np.where(noise, n, pos)[::-1])[::-1]
+    has_prev, has_next = prev >= first, nxt <= last
+    gap_prev = start_ns - end_ns[np.where(has_prev, prev, 0)]
+    gap_next = start_ns[np.where(has_next, nxt, 0)] - end_ns
+    owner = np.where(has_prev & (~has_next | (gap_prev <= gap_next)), prev, np.where(has_next, nxt, first))
+    return np.where(noise, owner, pos)
+
+
+def split_noise(events, floors):
+    """(events, noise): events with the ones below their cauldron's floor merged in, and those merged.
+
+    ``events`` in (cauldron, start) order, as detection emits them.
+    """
+    if events.empty:
+        return events, events
+    floor = events["cauldron_id"].map(floors).fillna(0.0).to_numpy(dtype="float64")
+    volume = events["volume_lost"].to_numpy(dtype="float64")
+    noise = volume < floor
+    start = pd.to_datetime(events["start_time"], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+    end = pd.to_datetime(events["end_time"], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+    owner = noise_owners(events["cauldron_id"].to_numpy(), start, end, noise)
+    pos = np.arange(len(owner))
+    rows = np.flatnonzero(owner == pos)
+    last = pos.copy()
+    np.maximum.at(last, owner, pos)
+    kept = events.iloc[rows].reset_index(drop=True)
+    kept["volume_lost"] = np.bincount(owner, weights=volume)[rows]
+    # a cauldron-day of fragments only: the first one stands for all, up to the end of the last
+    kept["end_time"] = events["end_time"].iloc[np.where(noise[rows], last[rows], rows)].reset_index(drop=True)
+    return kept, events[noise].reset_index(drop=True)
+
+
+def daily_noise(noise):
+    """Merged fragments counted and summed per cauldron and UTC start day."""
+    if noise.empty:
+        return pd.DataFrame(columns=NOISE_COLUMNS)
+    day = pd.to_datetime(noise["start_time"], utc=True).dt.floor("D")
+    out = noise.groupby([noise["cauldron_id"], day.rename("day")])["volume_lost"].agg(["size", "sum"]).reset_index()
+    return out.rename(columns={"size": "noise_events", "sum": "noise_volume"})[NOISE_COLUMNS]
@@ -0,0 +1,139 @@
+# event_features.py
+# Per-event features for detected drains, so analytics never go back to the
+# minute data:
+#
+#   duration_min      end_time - start_time
+#   peak_drain_rate   steepest drop inside the event (L per minute), over the
+#                     same ROLLING_WINDOW-row diff detection thresholds
+#   min_level         lowest / highest reading from start to end
+#   max_level
+#   level_before      reading just before start_time / just after end_time
+#   level_after
+#   inflow_estimate   fill_rate * duration_min, what flowed in while draining
+#   since_prev_min    start_time - end_time of the previous event in the cauldron
+#
+# Every event is a [start row, end row] segment of its cauldron's column. The
+# level matrix is flattened column by column and all segments are reduced at
+# once with np.fmin/np.fmax.reduceat (NaN readings are skipped), so the cost is
+# one pass over the rows touched by events, not a slice per event. Events that
+# span chunk boundaries are reduced piecewise and combined, which is how the
+# chunked pipeline gets the same bits as the in-memory run.
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = [
+    "duration_min",
+    "peak_drain_rate",
+    "min_level",
+    "max_level",
+    "level_before",
+    "level_after",
+    "inflow_estimate",
+    "since_prev_min",
+]
+MINUTE_NS = 60_000_000_000
+
+
+def _ns(values):
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).as_unit("ns").asi8
+
+
+def segment_reduce(ufunc, flat, starts, stops):
+    """``ufunc.reduceat`` over the half-open segments [starts, stops) of ``flat``; segments non-empty."""
+    if len(starts) == 0:
+        return np.array([], dtype=flat.dtype)
+    # reduceat needs every index < len, and the stop of the last column can equal it
+    padded = np.append(flat, np.nan)
+    idx = np.empty(2 * len(starts), dtype="int64")
+    idx[0::2] = starts
+    idx[1::2] = stops
+    return ufunc.reduceat(padded, idx)[0::2]
+
+
+class StreamingEventFeatures:
+    """Features for a known set of events, fed the level history one chunk at a time."""
+
+    def __init__(self, events, window):
+        self.events = events.reset_index(drop=True)
+        self.window = window
+        self.start_ns = _ns(self.events["start_time"])
+        self.end_ns = _ns(self.events["end_time"])
+        self.columns = None
+        self.col = None
+        self.tail = None  # last ``window`` rows seen, for the windowed diff and level_before
+        n = len(self.events)
+        self.acc = {name: np.full(n, np.nan) for name in ("peak_drain_rate", "min_level", "max_level", "level_before", "level_after")}
+
+    def feed(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            col = {c: i for i, c in enumerate(self.columns)}
+            self.col = self.events["cauldron_id"].map(col).fillna(-1).to_numpy(dtype="int64")
+        carry = 0 if self.tail is None else len(self.tail)
+        frame = chunk if self.tail is None else pd.concat([self.tail, chunk])
+        self.tail = frame.iloc[-self.window:]
+        times = _ns(frame.index)
+        values = frame.to_numpy(dtype="float64")
+        n = len(frame)
+
+        active = np.flatnonzero((self.col >= 0) & (self.start_ns <= times[-1]) & (self.end_ns >= times[0]))
+        if len(active) == 0:
+            return
+        cols = self.col[active]
+        first = np.searchsorted(times, self.start_ns[active], "left")
+        stop = np.searchsorted(times, self.end_ns[active], "right")
+        offset = cols * n
+
+        # column-major flattening keeps each cauldron's rows contiguous
+        flat = values.T.ravel()
+        w = self.window
+        drops = np.full(values.shape, np.nan)
+        if w < n:
+            drops[w:] = (values[:-w] - values[w:]) / ((times[w:] - times[:-w]) / MINUTE_NS)[:, None]
+        flat_drops = drops.T.ravel()
+
+        lo = np.maximum(first, carry)
+        seg = lo < stop
+        if seg.any():
+            idx = active[seg]
+            starts, stops = offset[seg] + lo[seg], offset[seg] + stop[seg]
+            acc = self.acc
+            acc["min_level"][idx] = np.fmin(acc["min_level"][idx], segment_reduce(np.fmin, flat, starts, stops))
+            acc["max_level"][idx] = np.fmax(acc["max_level"][idx], segment_reduce(np.fmax, flat, starts, stops))
+            acc["peak_drain_rate"][idx] = np.fmax(acc["peak_drain_rate"][idx], segment_reduce(np.fmax, flat_drops, starts, stops))
+
+        # the row before the start / after the end may sit in the carried rows or the next chunk
+        at_start = (first < n) & (first >= 1)
+        at_start[at_start] = times[first[at_start]] == self.start_ns[active[at_start]]
+        self.acc["level_before"][active[at_start]] = flat[offset[at_start] + first[at_start] - 1]
+        at_end = (stop >= 1) & (stop < n)
+        at_end[at_end] = times[stop[at_end] - 1] == self.end_ns[active[at_end]]
+        self.acc["level_after"][active[at_end]] = flat[offset[at_end] + stop[at_end]]
+
+    def finish(self, rates=None):
+        """The events with FEATURE_COLUMNS appended; ``rates`` (compute_rates output) feeds inflow_estimate."""
+        out = self.events.copy()
+        duration = (self.end_ns - self.start_ns) / MINUTE_NS
+        out["duration_min"] = duration
+        for name, values in self.acc.items():
+            out[name] = values
+        fill_rate = np.nan
+        if rates is not None and not rates.empty:
+            fill_rate = out["cauldron_id"].map(rates.set_index("cauldron_id")["fill_rate"]).to_numpy(dtype="float64")
+        out["inflow_estimate"] = fill_rate * duration
+        # events come grouped by cauldron in time order, as detection emits them
+        cauldrons = out["cauldron_id"].to_numpy()
+        since_prev = np.full(len(out), np.nan)
+        same = cauldrons[1:] == cauldrons[:-1]
+        since_prev[1:][same] = (self.start_ns[1:] - self.end_ns[:-1])[same] / MINUTE_NS
+        out["since_prev_min"] = since_prev
+        return out[list(self.events.columns) + FEATURE_COLUMNS]
+
+
+def event_features(df, events, window, rates=None):
+    """``events`` with FEATURE_COLUMNS for a wide level frame (timestamp index, one column per cauldron)."""
+    if events.empty:
+        return events.reindex(columns=list(events.columns) + FEATURE_COLUMNS)
+    acc = StreamingEventFeatures(events, window)
+    acc.feed(df)
+    return acc.finish(rates)
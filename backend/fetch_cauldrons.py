@@ -1,21 +1,30 @@
-import requests
+import argparse
+import os
+
 import pandas as pd
 
+import http_cache
+import results_store
+
 url = "https://hackutd2025.eog.systems/api/Information/cauldrons"
 
-response = requests.get(url)
-
-print("Status code:", response.status_code)
-print("Raw text response:")
-print(response.text[:500])  # show first 500 characters to inspect
-
-if response.status_code == 200:
-    try:
-        data = response.json()
-        df = pd.DataFrame(data)
-        df.to_csv("cauldrons.csv", index=False)
-        print("Cauldron data fetched and saved to cauldrons.csv")
-    except Exception as e:
-        print("Could not parse JSON:", e)
-else:
-    print(f"Failed to fetch cauldron data (status {response.status_code})")
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+
+def fetch_cauldrons():
+    """Cauldron metadata (id, name, max_volume, latitude, longitude) from the API."""
+    response = http_cache.get(url)  # conditional GET / replay, see http_cache.py
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to fetch cauldron data (status {response.status_code})")
+    return pd.DataFrame(response.json())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch the cauldron list")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
+
+    df = fetch_cauldrons()
+    results_store.write_csv_atomic(df, os.path.join(args.data_dir, "cauldrons.csv"))
+    print("Cauldron data fetched and saved to cauldrons.csv")
@@ -1,32 +1,173 @@
 # fetch_tickets.py
+# Incremental ticket sync: only tickets whose identity key has not been seen
+# before are appended to tickets.csv. A persistent key index next to the CSV
+# remembers every identity key and how many tickets share each duplicate key
+# (same cauldron, same day, same amount), which is written out as `dup_count`.
+import argparse
+import hashlib
+import json
 import os
 import pandas as pd
-import requests
+
+import http_cache
+import results_store
 
 # API endpoint
 TICKET_API = "https://hackutd2025.eog.systems/api/Tickets"
 
 # Directory for saving CSV
-script_dir = os.path.dirname(__file__)
-output_file = os.path.join(script_dir, "../data/tickets.csv")
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+DEFAULT_OUTPUT = os.environ.get("POTION_TICKETS_CSV", os.path.join(DEFAULT_DATA_DIR, "tickets.csv"))
+
+OUTPUT_COLUMNS = ["ticket_id", "cauldron_id", "date", "amount_collected", "dup_count"]
+
+
+def _hash(*parts):
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+def identity_key(row, with_id=True):
+    # a re-fetched ticket has the same id (when the API exposes one), cauldron, time and amount
+    ticket_id = row.get("ticket_id") if with_id else None
+    ticket_id = "" if pd.isna(ticket_id) else ticket_id
+    return _hash(ticket_id, row["cauldron_id"], row["date"].isoformat(), repr(float(row["amount_collected"])))
+
+
+def duplicate_key(row):
+    # two different tickets for the same cauldron, day and amount count as duplicates
+    return _hash(row["cauldron_id"], row["date"].date().isoformat(), repr(float(row["amount_collected"])))
+
+
+def load_index(existing, output_file):
+    index_file = output_file + ".keys.json"
+    if os.path.exists(index_file) and os.path.exists(output_file):
+        with open(index_file) as f:
+            return json.load(f)
+    # first run with an existing CSV (or none at all): rebuild from the rows on disk
+    index = {"seen": {}, "legacy": {}, "dup_counts": {}}
+    for _, row in existing.iterrows():
+        index["seen"][identity_key(row)] = 1
+        if pd.isna(row.get("ticket_id")):
+            # rows stored before ticket ids were kept; matched once by the id-less key
+            lk = identity_key(row, with_id=False)
+            index["legacy"][lk] = index["legacy"].get(lk, 0) + 1
+        dk = duplicate_key(row)
+        index["dup_counts"][dk] = index["dup_counts"].get(dk, 0) + 1
+    return index
+
 
-# Fetch tickets from API
-response = requests.get(TICKET_API)
-if response.status_code != 200:
-    raise RuntimeError(f"Failed to fetch ticket data: {response.status_code}")
+def save_index(index, output_file):
+    index_file = output_file + ".keys.json"
+    tmp = index_file + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, index_file)
 
-tickets_json = response.json()
-tickets = pd.DataFrame(tickets_json.get("transport_tickets", []))
 
-if tickets.empty:
-    print("No tickets found in API data.")
-else:
+def load_existing(output_file):
+    """(stored tickets, whether the file predates the current columns)."""
+    existing = pd.DataFrame(columns=OUTPUT_COLUMNS)
+    schema_upgrade = False
+    if os.path.exists(output_file):
+        existing = pd.read_csv(output_file)
+        existing["date"] = pd.to_datetime(existing["date"], utc=True)
+        # older files only had cauldron_id, date, amount_collected
+        schema_upgrade = list(existing.columns) != OUTPUT_COLUMNS
+        for c in OUTPUT_COLUMNS:
+            if c not in existing.columns:
+                existing[c] = None
+    return existing, schema_upgrade
+
+
+def fetch_tickets():
+    """Tickets from the API: cauldron_id, date (UTC), amount_collected and ticket_id (None if not exposed)."""
+    response = http_cache.get(TICKET_API)  # conditional GET / replay, see http_cache.py
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to fetch ticket data: {response.status_code}")
+
+    tickets_json = response.json()
+    tickets = pd.DataFrame(tickets_json.get("transport_tickets", []))
+    if tickets.empty:
+        return tickets
     # Convert ticket date to datetime (UTC)
     tickets["date"] = pd.to_datetime(tickets["date"], utc=True)
+    if "ticket_id" not in tickets.columns:
+        tickets["ticket_id"] = None
+    return tickets
+
+
+def sync_tickets(tickets, output_file=DEFAULT_OUTPUT, db_path=None):
+    """Store the tickets not seen before; returns (new tickets as written, new duplicates, stored before)."""
+    existing, schema_upgrade = load_existing(output_file)
+    index = load_index(existing, output_file)
+    if tickets.empty:
+        return tickets, 0, len(existing)
+
+    # Keep only unseen tickets (also drops repeats within this batch)
+    fresh = []
+    for _, row in tickets.iterrows():
+        key = identity_key(row)
+        if key in index["seen"]:
+            fresh.append(False)
+            continue
+        index["seen"][key] = 1
+        lk = identity_key(row, with_id=False)
+        if index["legacy"].get(lk, 0) > 0:
+            index["legacy"][lk] -= 1
+            fresh.append(False)
+        else:
+            fresh.append(True)
+    new_tickets = tickets[fresh].copy()
+
+    # Update duplicate counts at ingest
+    dup_keys = new_tickets.apply(duplicate_key, axis=1) if not new_tickets.empty else pd.Series(dtype=str)
+    touched = set()
+    for dk in dup_keys:
+        if index["dup_counts"].get(dk, 0) > 0:
+            touched.add(dk)
+        index["dup_counts"][dk] = index["dup_counts"].get(dk, 0) + 1
+    new_dupes = int(sum(index["dup_counts"][dk] > 1 for dk in dup_keys))
+
+    if new_tickets.empty:
+        save_index(index, output_file)
+        return new_tickets, 0, len(existing)
+
+    new_tickets["dup_count"] = [index["dup_counts"][dk] for dk in dup_keys]
+    new_tickets = new_tickets[OUTPUT_COLUMNS]
+
+    if (touched or schema_upgrade) and not existing.empty:
+        # rare path: a new ticket duplicates a stored one (or the file predates
+        # dup_count), so refresh the stored counts and rewrite once
+        existing["dup_count"] = [index["dup_counts"][duplicate_key(r)] for _, r in existing.iterrows()]
+        all_tickets = pd.concat([existing[OUTPUT_COLUMNS], new_tickets])
+        results_store.write_csv_atomic(all_tickets, output_file)
+        results_store.replace_table("tickets", all_tickets, db_path)
+    elif os.path.exists(output_file):
+        # appending to a table that is missing the stored tickets would leave only the new ones in it
+        in_store = results_store.fresh("tickets", os.path.dirname(output_file), db_path)
+        results_store.append_csv_atomic(new_tickets, output_file)
+        if in_store:
+            results_store.append_rows("tickets", new_tickets, db_path)
+        else:
+            results_store.replace_table("tickets", pd.concat([existing[OUTPUT_COLUMNS], new_tickets]), db_path)
+    else:
+        results_store.write_csv_atomic(new_tickets, output_file)
+        results_store.replace_table("tickets", new_tickets, db_path)
+    save_index(index, output_file)
+    return new_tickets, new_dupes, len(existing)
+
 
-    # Keep only needed columns
-    tickets = tickets[["cauldron_id", "date", "amount_collected"]]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append new tickets from the API to tickets.csv")
+    parser.add_argument("--out", default=DEFAULT_OUTPUT, help="tickets CSV (default $POTION_TICKETS_CSV or <data dir>/tickets.csv)")
+    args = parser.parse_args()
 
-    # Save to CSV
-    tickets.to_csv(output_file, index=False)
-    print(f"Tickets saved to {output_file}")
+    tickets = fetch_tickets()
+    new_tickets, new_dupes, stored = sync_tickets(tickets, args.out)
+    if tickets.empty:
+        print("No tickets found in API data.")
+    elif new_tickets.empty:
+        print(f"Tickets up to date ({stored} stored, 0 new)")
+    else:
+        print(f"Tickets saved to {args.out} ({len(new_tickets)} new, {new_dupes} duplicates at ingest)")
@@ -0,0 +1,114 @@
+# http_cache.py
+# On-disk response cache for the fetch scripts.
+#
+# Modes (POTION_HTTP_MODE, or the `mode` argument):
+#   revalidate  (default) send If-None-Match / If-Modified-Since from the stored
+#               response; a 304 is answered from disk
+#   record      always download and store the response
+#   replay      serve stored responses only, never touch the network
+#   off         plain GET, cache untouched
+#
+# Responses are stored gzip-compressed under POTION_HTTP_CACHE (default
+# backend/.http_cache), one <sha1(url)>.json metadata file plus .body.gz each.
+import gzip
+import hashlib
+import json
+import os
+import time
+
+import requests
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.environ.get("POTION_HTTP_CACHE", os.path.join(script_dir, ".http_cache"))
+MODE = os.environ.get("POTION_HTTP_MODE", "revalidate")
+MODES = ("revalidate", "record", "replay", "off")
+TIMEOUT_SECONDS = 60
+
+_session = requests.Session()
+_session.headers["Accept-Encoding"] = "gzip"
+
+
+class CachedResponse:
+    """The subset of ``requests.Response`` the fetch scripts use."""
+
+    def __init__(self, url, status_code, content, headers, from_cache):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _paths(url, cache_dir):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key + ".json"), os.path.join(cache_dir, key + ".body.gz")
+
+
+def _load(url, cache_dir):
+    meta_path, body_path = _paths(url, cache_dir)
+    if not (os.path.exists(meta_path) and os.path.exists(body_path)):
+        return None, None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    with open(body_path, "rb") as f:
+        body = gzip.decompress(f.read())
+    return meta, body
+
+
+def _store(url, response, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_path, body_path = _paths(url, cache_dir)
+    meta = {
+        "url": url,
+        "status_code": response.status_code,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "content_type": response.headers.get("Content-Type"),
+        "stored_at": time.time(),
+    }
+    # write body first, metadata last, both atomically, so a reader never
+    # pairs new metadata with an old or half-written body
+    for path, data, mode in ((body_path, gzip.compress(response.content), "wb"),
+                             (meta_path, json.dumps(meta, indent=1), "w")):
+        tmp = path + ".tmp"
+        with open(tmp, mode) as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def get(url, mode=None, cache_dir=None):
+    mode = mode or MODE
+    cache_dir = cache_dir or CACHE_DIR
+    if mode not in MODES:
+        raise ValueError(f"unknown cache mode {mode!r} (expected one of {', '.join(MODES)})")
+
+    if mode == "off":
+        r = _session.get(url, timeout=TIMEOUT_SECONDS)
+        return CachedResponse(url, r.status_code, r.content, dict(r.headers), False)
+
+    meta, body = _load(url, cache_dir)
+    if mode == "replay":
+        if meta is None:
+            raise RuntimeError(f"No recorded response for {url} in {cache_dir} (replay mode)")
+        return CachedResponse(url, meta["status_code"], body, {"Content-Type": meta.get("content_type")}, True)
+
+    headers = {}
+    if mode == "revalidate" and meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = _session.get(url, headers=headers, timeout=TIMEOUT_SECONDS)
+    if r.status_code == 304 and meta is not None:
+        return CachedResponse(url, meta["status_code"], body, dict(r.headers), True)
+    if r.status_code == 200:
+        _store(url, r, cache_dir)
+    return CachedResponse(url, r.status_code, r.content, dict(r.headers), False)
@@ -0,0 +1,308 @@
+# level_codec.py
+# Compact fixed-point archive for the wide level history (cauldron_data.csv).
+#
+# Levels are stored as int64 centi-liters (compute_rates.LEVEL_SCALE), so every
+# sum or difference over them is exact integer arithmetic. Each cauldron is cut
+# into fixed-size blocks of BLOCK_ROWS readings; a block is stored as deltas from
+# its first value in the narrowest int type that fits, zlib-compressed, with a
+# header holding first/last reading, min/max/sum/count and the positive/negative diff
+# totals compute_rates needs. Range queries read whole blocks from their header
+# alone and only decode the partial blocks at the range edges (net_change walks
+# further in while an edge has no valid reading).
+#
+# File layout: b"LVC1" | uint32 header length | JSON header | block payloads.
+#
+#   python backend/level_codec.py encode [--levels streamlit/data/cauldron_data.csv] [--out streamlit/data/cauldron_data.lvc]
+#   python backend/level_codec.py decode [--archive streamlit/data/cauldron_data.lvc] --out cauldron_data.csv
+#   python backend/level_codec.py stats [--archive streamlit/data/cauldron_data.lvc]
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from compute_rates import LEVEL_SCALE, rates_from_totals
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+MAGIC = b"LVC1"
+BLOCK_ROWS = 4096
+DELTA_TYPES = ("int8", "int16", "int32", "int64")
+# block header fields, in order
+# (first: decode base; head/tail: first/last reading if valid, else null)
+FIELDS = ("offset", "length", "dtype", "has_nan", "first", "head", "tail", "min", "max", "sum", "count",
+          "pos_sum", "pos_n", "neg_sum", "neg_n")
+
+
+def _to_units(values):
+    """float levels -> int64 centi-liters + valid mask; refuses values with more than 2 decimals."""
+    valid = ~np.isnan(values)
+    units = np.zeros(len(values), dtype="int64")
+    scaled = np.rint(values[valid] * LEVEL_SCALE)
+    if not np.array_equal(scaled / LEVEL_SCALE, values[valid]):
+        raise ValueError(f"levels are not multiples of 1/{LEVEL_SCALE}; the codec would not be lossless")
+    units[valid] = scaled.astype("int64")
+    return units, valid
+
+
+def _encode_block(units, valid):
+    # NaN readings repeat the previous value so they cost nothing in the deltas
+    filled = units.copy()
+    if not valid.all():
+        idx = np.where(valid, np.arange(len(units)), 0)
+        np.maximum.accumulate(idx, out=idx)
+        filled = units[idx]
+    deltas = np.diff(filled, prepend=filled[0])
+    dtype = next(t for t in DELTA_TYPES
+                 if deltas.size == 0 or (deltas.min() >= np.iinfo(t).min and deltas.max() <= np.iinfo(t).max))
+    payload = deltas.astype(dtype).tobytes()
+    if not valid.all():
+        payload += np.packbits(valid).tobytes()
+    v = units[valid]
+    d = np.diff(units)
+    ok = valid[1:] & valid[:-1]
+    pos = ok & (d > 0)
+    neg = ok & (d < 0)
+    header = {
+        "dtype": dtype,
+        "has_nan": bool(not valid.all()),
+        "first": int(filled[0]),
+        "head": int(units[0]) if valid[0] else None,
+        "tail": int(units[-1]) if valid[-1] else None,
+        "min": int(v.min()) if v.size else None,
+        "max": int(v.max()) if v.size else None,
+        "sum": int(v.sum()),
+        "count": int(v.size),
+        "pos_sum": int(d[pos].sum()), "pos_n": int(pos.sum()),
+        "neg_sum": int(d[neg].sum()), "neg_n": int(neg.sum()),
+    }
+    return zlib.compress(payload, 6), header
+
+
+def encode(df, block_rows=BLOCK_ROWS):
+    """Wide level frame (timestamp index, one column per cauldron) -> archive bytes."""
+    times = pd.to_datetime(df.index, utc=True).as_unit("ns").asi8
+    time_blob = zlib.compress(np.diff(times, prepend=times[:1]).astype("int64").tobytes(), 6)
+    payloads = [time_blob]
+    offset = len(time_blob)
+    blocks = {}
+    for cauldron in df.columns:
+        units, valid = _to_units(df[cauldron].to_numpy(dtype="float64"))
+        rows = []
+        for lo in range(0, len(units), block_rows):
+            blob, header = _encode_block(units[lo:lo + block_rows], valid[lo:lo + block_rows])
+            header["offset"], header["length"] = offset, len(blob)
+            rows.append([header[f] for f in FIELDS])
+            payloads.append(blob)
+            offset += len(blob)
+        blocks[str(cauldron)] = rows
+    meta = {
+        "version": 1, "scale": LEVEL_SCALE, "block_rows": block_rows, "rows": len(times),
+        "first_time": int(times[0]) if len(times) else 0, "time_length": len(time_blob),
+        "fields": list(FIELDS), "cauldrons": [str(c) for c in df.columns], "blocks": blocks,
+    }
+    head = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(head)) + head + b"".join(payloads)
+
+
+def write(df, path, block_rows=BLOCK_ROWS):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(encode(df, block_rows))
+    os.replace(tmp, path)
+
+
+class LevelArchive:
+    """Read side: headers are parsed on open, block payloads decoded on demand."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f"{path} is not a level archive")
+        (head_len,) = struct.unpack("<I", data[4:8])
+        meta = json.loads(data[8:8 + head_len])
+        self._data = memoryview(data)[8 + head_len:]
+        self.scale = meta["scale"]
+        self.block_rows = meta["block_rows"]
+        self.rows = meta["rows"]
+        self.cauldrons = meta["cauldrons"]
+        self.blocks = {c: [dict(zip(meta["fields"], b)) for b in rows] for c, rows in meta["blocks"].items()}
+        deltas = np.frombuffer(zlib.decompress(self._data[:meta["time_length"]]), dtype="int64")
+        self.times = np.cumsum(deltas) + meta["first_time"]
+
+    def _block(self, cauldron, b):
+        """(units, valid) of block ``b``."""
+        h = self.blocks[cauldron][b]
+        raw = zlib.decompress(self._data[h["offset"]:h["offset"] + h["length"]])
+        n = min(self.block_rows, self.rows - b * self.block_rows)
+        width = np.dtype(h["dtype"]).itemsize
+        units = np.cumsum(np.frombuffer(raw[:n * width], dtype=h["dtype"]).astype("int64")) + h["first"]
+        if h["has_nan"]:
+            valid = np.unpackbits(np.frombuffer(raw[n * width:], dtype="uint8"), count=n).astype(bool)
+        else:
+            valid = np.ones(n, dtype=bool)
+        return units, valid
+
+    def _block_range(self, lo, hi):
+        return range(lo // self.block_rows, (hi - 1) // self.block_rows + 1) if hi > lo else range(0)
+
+    def span(self, start=None, end=None):
+        """Row range [lo, hi) for timestamps in [start, end]."""
+        lo = 0 if start is None else int(np.searchsorted(self.times, pd.Timestamp(start).value, "left"))
+        hi = self.rows if end is None else int(np.searchsorted(self.times, pd.Timestamp(end).value, "right"))
+        return lo, hi
+
+    def units(self, cauldron, lo=0, hi=None):
+        """Decoded int64 centi-liters and valid mask for rows [lo, hi)."""
+        hi = self.rows if hi is None else hi
+        parts, masks = [], []
+        for b in self._block_range(lo, hi):
+            units, valid = self._block(cauldron, b)
+            base = b * self.block_rows
+            parts.append(units[max(lo - base, 0):hi - base])
+            masks.append(valid[max(lo - base, 0):hi - base])
+        if not parts:
+            return np.array([], dtype="int64"), np.array([], dtype=bool)
+        return np.concatenate(parts), np.concatenate(masks)
+
+    def column(self, cauldron, start=None, end=None):
+        lo, hi = self.span(start, end)
+        units, valid = self.units(cauldron, lo, hi)
+        return np.where(valid, units / self.scale, np.nan)
+
+    def frame(self, start=None, end=None, cauldrons=None):
+        """Wide float frame like cauldron_data.csv (UTC timestamp index)."""
+        lo, hi = self.span(start, end)
+        cauldrons = cauldrons or self.cauldrons
+        data = {}
+        for c in cauldrons:
+            units, valid = self.units(c, lo, hi)
+            data[c] = np.where(valid, units / self.scale, np.nan)
+        index = pd.DatetimeIndex(pd.to_datetime(self.times[lo:hi], utc=True), name="timestamp")
+        return pd.DataFrame(data, index=index)
+
+    def _reduce(self, cauldron, lo, hi, field, combine, partial):
+        """Fold ``field`` over whole blocks in [lo, hi) from headers, decoding only edge blocks."""
+        out = []
+        for b in self._block_range(lo, hi):
+            base = b * self.block_rows
+            n = min(self.block_rows, self.rows - base)
+            if lo <= base and base + n <= hi:
+                value = self.blocks[cauldron][b][field]
+            else:
+                units, valid = self._block(cauldron, b)
+                sl = slice(max(lo - base, 0), hi - base)
+                value = partial(units[sl][valid[sl]])
+            if value is not None:
+                out.append(value)
+        return combine(out) if out else None
+
+    def total(self, cauldron, start=None, end=None):
+        """Exact sum of the readings in [start, end], in liters."""
+        lo, hi = self.span(start, end)
+        units = self._reduce(cauldron, lo, hi, "sum", sum, lambda v: int(v.sum()))
+        return (units or 0) / self.scale
+
+    def min(self, cauldron, start=None, end=None):
+        lo, hi = self.span(start, end)
+        units = self._reduce(cauldron, lo, hi, "min", min, lambda v: int(v.min()) if v.size else None)
+        return None if units is None else units / self.scale
+
+    def max(self, cauldron, start=None, end=None):
+        lo, hi = self.span(start, end)
+        units = self._reduce(cauldron, lo, hi, "max", max, lambda v: int(v.max()) if v.size else None)
+        return None if units is None else units / self.scale
+
+    def _edge(self, cauldron, lo, hi, last):
+        """First (or ``last``) valid reading in rows [lo, hi), in units, or None.
+
+        Walks inward block by block: whole blocks answer from their header
+        (head/tail, or count 0 to skip), and only edge blocks or blocks whose
+        own edge reading is missing are decoded.
+        """
+        blocks = self._block_range(lo, hi)
+        for b in reversed(blocks) if last else blocks:
+            h = self.blocks[cauldron][b]
+            base = b * self.block_rows
+            n = min(self.block_rows, self.rows - base)
+            whole = lo <= base and base + n <= hi
+            if whole and h["count"] == 0:
+                continue
+            if whole and h["tail" if last else "head"] is not None:
+                return h["tail" if last else "head"]
+            units, valid = self._block(cauldron, b)
+            sl = slice(max(lo - base, 0), hi - base)
+            v = units[sl][valid[sl]]
+            if v.size:
+                return int(v[-1] if last else v[0])
+        return None
+
+    def net_change(self, cauldron, start=None, end=None):
+        """Last minus first valid reading in [start, end] (exact); 0.0 without one."""
+        lo, hi = self.span(start, end)
+        first = self._edge(cauldron, lo, hi, last=False)
+        if first is None:
+            return 0.0
+        return (self._edge(cauldron, lo, hi, last=True) - first) / self.scale
+
+    def diff_totals(self, cauldron):
+        """compute_rates.diff_totals for the whole column, from the block headers only."""
+        totals = [0, 0, 0, 0]
+        prev_tail = None
+        for h in self.blocks[cauldron]:
+            totals[0] += h["pos_sum"]
+            totals[1] += h["pos_n"]
+            totals[2] += h["neg_sum"]
+            totals[3] += h["neg_n"]
+            # the diff across the block boundary (both readings must be valid)
+            if prev_tail is not None and h["head"] is not None:
+                d = h["head"] - prev_tail
+                if d > 0:
+                    totals[0] += d
+                    totals[1] += 1
+                elif d < 0:
+                    totals[2] += d
+                    totals[3] += 1
+            prev_tail = h["tail"]
+        return tuple(totals)
+
+    def rates(self):
+        """Fill/drain rates identical to compute_rates(), without decoding any block."""
+        return rates_from_totals({c: self.diff_totals(c) for c in self.cauldrons})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fixed-point delta archive for level histories")
+    parser.add_argument("command", choices=["encode", "decode", "stats"])
+    parser.add_argument("--levels", default=os.path.join(DEFAULT_DATA_DIR, "cauldron_data.csv"))
+    parser.add_argument("--archive", default=os.path.join(DEFAULT_DATA_DIR, "cauldron_data.lvc"))
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--block-rows", type=int, default=BLOCK_ROWS)
+    args = parser.parse_args()
+
+    if args.command == "encode":
+        out = args.out or args.archive
+        t0 = time.perf_counter()
+        df = pd.read_csv(args.levels, index_col="timestamp", parse_dates=True)
+        write(df, out, args.block_rows)
+        print(f"{os.path.getsize(args.levels)} -> {os.path.getsize(out)} bytes in {time.perf_counter() - t0:.2f}s: {out}")
+    elif args.command == "decode":
+        if not args.out:
+            parser.error("decode needs --out (it would otherwise overwrite the CSV the archive was made from)")
+        df = LevelArchive(args.archive).frame()
+        out = args.out
+        df.reset_index().to_csv(out, index=False)
+        print(f"{len(df)} rows written to {out}")
+    else:
+        t0 = time.perf_counter()
+        archive = LevelArchive(args.archive)
+        frame = archive.frame()
+        print(f"{archive.rows} rows x {len(archive.cauldrons)} cauldrons, {archive.block_rows} rows/block, "
+              f"decoded in {time.perf_counter() - t0:.3f}s")
+        print(archive.rates().to_string(index=False))
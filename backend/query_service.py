@@ -0,0 +1,377 @@
+# query_service.py
+# Small local HTTP/JSON service that keeps the precomputed pipeline results
+# (levels, drain events, tickets, daily rollups, suspicious events) indexed in
+# memory so the dashboard and ad-hoc scripts don't have to reparse the CSVs.
+#
+# Run:  python backend/query_service.py --port 8765
+#
+# Endpoints (all GET, all return JSON, gzip if the client accepts it):
+#   /health
+#   /levels/latest
+#   /levels?cauldron=X&start=T1&end=T2&offset=0&limit=1000
+#   /drains?cauldron=X&start=T1&end=T2&significant=1
+#   /tickets?cauldron=X&start=T1&end=T2
+#   /rollups?cauldron=X&start=T1&end=T2
+#   /suspicious?days=7        (or start/end)
+# Times are ISO strings or epoch seconds; ranges are inclusive on both ends.
+#
+# The listen backlog is REQUEST_QUEUE_SIZE: with the stdlib default of 5, a
+# burst of concurrent connects overflows it and the dropped SYNs are retried
+# by the client kernel after a full second, which shows up as a ~1 s p99.
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from build_rollups import build_rollups
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 50000
+GZIP_MIN_BYTES = 1024
+RELOAD_CHECK_SECONDS = 1.0
+REQUEST_QUEUE_SIZE = 128  # listen backlog
+
+FILES = {
+    "levels": "cauldron_data.csv",
+    "drains": "drain_events.csv",
+    "tickets": "tickets.csv",
+    "suspicious": "suspicious_events.csv",
+    "cauldrons": "cauldrons.csv",
+}
+
+
+def _to_ns(value):
+    """Parse an ISO string or epoch seconds into int64 UTC nanoseconds."""
+    if value is None or value == "":
+        return None
+    try:
+        return int(float(value) * 1_000_000_000)
+    except ValueError:
+        pass
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+    return ts.value
+
+
+def _ns(series):
+    """int64 UTC nanoseconds for a tz-aware datetime column, whatever its unit."""
+    return series.dt.as_unit("ns").astype("int64").to_numpy()
+
+
+def _iso(ns):
+    return pd.Timestamp(int(ns), tz="UTC").isoformat()
+
+
+def _read_csv(path, time_cols):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    df = pd.read_csv(path)
+    for c in time_cols:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], utc=True, errors="coerce")
+    return df
+
+
+class TimeTable:
+    """Rows grouped per cauldron and sorted by one time column.
+
+    Each cauldron owns a contiguous block of the sorted frame, so a range
+    query is two ``searchsorted`` calls plus the output slice.
+    """
+
+    def __init__(self, df, time_col):
+        self.time_col = time_col
+        self.columns = list(df.columns)
+        if df.empty:
+            self.df = df
+            self.times = np.array([], dtype="int64")
+            self.blocks = {}
+            return
+        df = df.dropna(subset=[time_col]).sort_values(["cauldron_id", time_col], kind="mergesort")
+        self.df = df.reset_index(drop=True)
+        self.times = _ns(self.df[time_col])
+        ids = self.df["cauldron_id"].to_numpy()
+        self.blocks = {}
+        if len(ids):
+            cuts = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+            starts = np.concatenate([[0], cuts])
+            ends = np.concatenate([cuts, [len(ids)]])
+            for s, e in zip(starts, ends):
+                self.blocks[ids[s]] = (int(s), int(e))
+
+    def positions(self, cauldron=None, start=None, end=None):
+        if cauldron and cauldron not in self.blocks:
+            return np.array([], dtype="int64")
+        blocks = [self.blocks[cauldron]] if cauldron else sorted(self.blocks.values())
+        out = []
+        for s, e in blocks:
+            block = self.times[s:e]
+            lo = s + (np.searchsorted(block, start, "left") if start is not None else 0)
+            hi = s + (np.searchsorted(block, end, "right") if end is not None else e - s)
+            out.append(np.arange(lo, hi))
+        return np.concatenate(out) if out else np.array([], dtype="int64")
+
+    def records(self, idx):
+        rows = self.df.iloc[idx]
+        out = []
+        for rec in rows.to_dict("records"):
+            for k, v in rec.items():
+                if isinstance(v, pd.Timestamp):
+                    rec[k] = v.isoformat()
+                elif isinstance(v, (np.bool_,)):
+                    rec[k] = bool(v)
+                elif isinstance(v, float) and np.isnan(v):
+                    rec[k] = None
+            out.append(rec)
+        return out
+
+
+class LevelStore:
+    """Wide level history as a sorted int64 time axis plus a float matrix."""
+
+    def __init__(self, df):
+        if df.empty or "timestamp" not in df.columns:
+            self.times = np.array([], dtype="int64")
+            self.cauldrons = []
+            self.values = np.empty((0, 0))
+            self.col = {}
+            return
+        df = df.dropna(subset=["timestamp"]).sort_values("timestamp", kind="mergesort")
+        self.times = _ns(df["timestamp"])
+        self.cauldrons = [c for c in df.columns if c != "timestamp"]
+        self.values = df[self.cauldrons].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+        self.col = {c: i for i, c in enumerate(self.cauldrons)}
+
+    def span(self, start=None, end=None):
+        lo = np.searchsorted(self.times, start, "left") if start is not None else 0
+        hi = np.searchsorted(self.times, end, "right") if end is not None else len(self.times)
+        return int(lo), int(hi)
+
+    def latest(self):
+        out = {}
+        for c, j in self.col.items():
+            col = self.values[:, j]
+            valid = np.flatnonzero(~np.isnan(col))
+            if len(valid):
+                i = valid[-1]
+                out[c] = {"timestamp": _iso(self.times[i]), "level": float(col[i])}
+        return out
+
+
+def level_frame(levels):
+    """LevelStore back to a wide frame (UTC timestamp index, one column per cauldron)."""
+    return pd.DataFrame(levels.values, index=pd.to_datetime(levels.times, utc=True), columns=levels.cauldrons)
+
+
+class Store:
+    """Immutable snapshot of every indexed table; swapped whole on reload."""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.mtimes = self._mtimes(data_dir)
+        p = {k: os.path.join(data_dir, v) for k, v in FILES.items()}
+        self.levels = LevelStore(_read_csv(p["levels"], ["timestamp"]))
+        drains = _read_csv(p["drains"], ["start_time", "end_time"])
+        tickets = _read_csv(p["tickets"], ["date"])
+        suspicious = _read_csv(p["suspicious"], ["day"])
+        self.cauldrons = _read_csv(p["cauldrons"], [])
+        self.drains = TimeTable(drains, "start_time")
+        self.tickets = TimeTable(tickets, "date")
+        self.suspicious = TimeTable(suspicious, "day")
+        self.rollups = TimeTable(build_rollups(level_frame(self.levels), tickets, drains), "day")
+
+    @staticmethod
+    def _mtimes(data_dir):
+        out = {}
+        for name in FILES.values():
+            path = os.path.join(data_dir, name)
+            out[name] = os.path.getmtime(path) if os.path.exists(path) else None
+        return out
+
+    def stale(self):
+        return self._mtimes(self.data_dir) != self.mtimes
+
+
+class QueryService:
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.store = Store(data_dir)
+        self._lock = threading.Lock()
+        self._last_check = time.monotonic()
+
+    def current(self):
+        # cheap mtime check at most once per RELOAD_CHECK_SECONDS
+        now = time.monotonic()
+        if now - self._last_check >= RELOAD_CHECK_SECONDS:
+            with self._lock:
+                if now - self._last_check >= RELOAD_CHECK_SECONDS:
+                    self._last_check = now
+                    if self.store.stale():
+                        self.store = Store(self.data_dir)
+        return self.store
+
+    # --- handlers: each returns a JSON-serialisable dict ---
+    def health(self, store, q):
+        return {
+            "status": "ok",
+            "levels": int(len(store.levels.times)),
+            "drains": int(len(store.drains.df)),
+            "tickets": int(len(store.tickets.df)),
+            "suspicious": int(len(store.suspicious.df)),
+            "rollups": int(len(store.rollups.df)),
+        }
+
+    def levels_latest(self, store, q):
+        latest = store.levels.latest()
+        if not store.cauldrons.empty and "max_volume" in store.cauldrons.columns:
+            caps = dict(zip(store.cauldrons["id"], store.cauldrons["max_volume"]))
+            for cid, rec in latest.items():
+                cap = caps.get(cid)
+                if cap and cap > 0:
+                    rec["percent"] = round(rec["level"] / float(cap) * 100.0, 2)
+        return {"items": latest}
+
+    def levels(self, store, q):
+        lv = store.levels
+        cauldron = q.get("cauldron")
+        if cauldron and cauldron not in lv.col:
+            return _page([], 0, q)
+        lo, hi = lv.span(_to_ns(q.get("start")), _to_ns(q.get("end")))
+        offset, limit = _paging(q)
+        cols = [cauldron] if cauldron else lv.cauldrons
+        # pagination is over rows of the wide time axis
+        a, b = lo + offset, min(hi, lo + offset + limit)
+        items = []
+        for i in range(a, b):
+            ts = _iso(lv.times[i])
+            for c in cols:
+                v = lv.values[i, lv.col[c]]
+                items.append({"timestamp": ts, "cauldron_id": c, "level": None if np.isnan(v) else float(v)})
+        return _page(items, hi - lo, q)
+
+    def _table(self, table, q, extra_mask=None):
+        idx = table.positions(q.get("cauldron"), _to_ns(q.get("start")), _to_ns(q.get("end")))
+        if extra_mask is not None and len(idx):
+            idx = idx[extra_mask(table.df.iloc[idx])]
+        offset, limit = _paging(q)
+        return _page(table.records(idx[offset:offset + limit]), len(idx), q)
+
+    def drains(self, store, q):
+        mask = None
+        if q.get("significant") in ("1", "true", "True") and "significant" in store.drains.columns:
+            mask = lambda rows: rows["significant"].astype(bool).to_numpy()
+        return self._table(store.drains, q, mask)
+
+    def tickets(self, store, q):
+        return self._table(store.tickets, q)
+
+    def rollups(self, store, q):
+        return self._table(store.rollups, q)
+
+    def suspicious(self, store, q):
+        if q.get("days") and not q.get("start"):
+            # "last N days" is relative to the newest data we hold, not wall-clock
+            anchor = store.levels.times[-1] if len(store.levels.times) else store.suspicious.times.max()
+            day_ns = 86_400 * 1_000_000_000
+            q = dict(q, start=str((anchor // day_ns - int(q["days"]) + 1) * day_ns / 1e9))
+        return self._table(store.suspicious, q)
+
+
+ROUTES = {
+    "/health": QueryService.health,
+    "/levels/latest": QueryService.levels_latest,
+    "/levels": QueryService.levels,
+    "/drains": QueryService.drains,
+    "/tickets": QueryService.tickets,
+    "/rollups": QueryService.rollups,
+    "/suspicious": QueryService.suspicious,
+}
+
+
+def _paging(q):
+    offset = max(0, int(q.get("offset", 0)))
+    limit = min(MAX_LIMIT, max(1, int(q.get("limit", DEFAULT_LIMIT))))
+    return offset, limit
+
+
+def _page(items, total, q):
+    offset, limit = _paging(q)
+    # for /levels the page is sized in time rows, everywhere else in records
+    consumed = offset + limit
+    return {
+        "items": items,
+        "total": int(total),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": consumed if consumed < total else None,
+    }
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            route = ROUTES.get(url.path.rstrip("/") or "/")
+            if route is None:
+                return self._send(404, {"error": f"unknown endpoint {url.path}"})
+            q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                body = route(service, service.current(), q)
+            except (ValueError, TypeError) as e:
+                return self._send(400, {"error": str(e)})
+            self._send(200, body)
+
+        def _send(self, status, body):
+            payload = json.dumps(body, separators=(",", ":")).encode("utf-8")
+            gz = "gzip" in self.headers.get("Accept-Encoding", "") and len(payload) >= GZIP_MIN_BYTES
+            if gz:
+                payload = gzip.compress(payload, compresslevel=5)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if gz:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = REQUEST_QUEUE_SIZE
+
+
+def serve(data_dir=DEFAULT_DATA_DIR, host="127.0.0.1", port=8765):
+    service = QueryService(data_dir)
+    return QueryServer((host, port), make_handler(service))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve indexed pipeline results over HTTP/JSON")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = serve(args.data_dir, args.host, args.port)
+    print(f"Query service on http://{args.host}:{args.port} (data: {os.path.abspath(args.data_dir)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
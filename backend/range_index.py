@@ -0,0 +1,219 @@
+# range_index.py
+# Range queries over the level history without rescanning minute data.
+#
+# Levels are held as integer centi-liters (compute_rates.LEVEL_SCALE) in a
+# time x cauldron matrix. Per cauldron there are prefix sums of the positive and
+# negative 1-step diffs, so inflow, outflow and net change over any time range
+# are two binary searches and a subtraction, exact to the centi-liter. Minimum
+# and maximum come from per-block extrema (BLOCK rows) with a sparse table over
+# the blocks: a range costs O(1) table lookups plus at most two partial blocks.
+#
+# append() takes new rows in time order and only touches the prefix entries
+# for those rows, the blocks they land in and one sparse-table entry per level
+# above each, so a live feed keeps the index current in O(rows + log blocks).
+#
+# Diffs follow compute_rates: only pairs of consecutive non-missing readings
+# count, and a range covers the readings with start <= t <= end (the step into
+# the first reading is outside it).
+import numpy as np
+import pandas as pd
+
+from compute_rates import LEVEL_SCALE, level_units
+
+BLOCK = 64
+_HI = np.iinfo(np.int64).max
+_LO = np.iinfo(np.int64).min
+
+
+def _ns(value):
+    """UTC nanoseconds for a timestamp-like scalar or sequence."""
+    if np.ndim(value) == 0:
+        ts = pd.Timestamp(value)
+        ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+        return ts.as_unit("ns").value
+    return pd.DatetimeIndex(pd.to_datetime(value, utc=True)).as_unit("ns").asi8
+
+
+def _grow(array, rows, fill=0):
+    """``array`` with at least ``rows`` rows, doubling capacity (new rows set to ``fill``)."""
+    if rows <= len(array):
+        return array
+    out = np.full((max(rows, 2 * len(array)),) + array.shape[1:], fill, dtype=array.dtype)
+    out[:len(array)] = array
+    return out
+
+
+class LevelRangeIndex:
+    def __init__(self, columns, block=BLOCK):
+        self.columns = list(columns)
+        self.col = {c: i for i, c in enumerate(self.columns)}
+        self.block = block
+        width = len(self.columns)
+        self.n = 0
+        self.times = np.empty(0, dtype="int64")
+        self.units = np.empty((0, width), dtype="int64")
+        self.valid = np.empty((0, width), dtype=bool)
+        self.pos = np.empty((0, width), dtype="int64")  # running sum of positive diffs up to each row
+        self.neg = np.empty((0, width), dtype="int64")
+        self.st_min = []  # sparse table level k: extremum of blocks [i, i + 2**k)
+        self.st_max = []
+
+    @classmethod
+    def from_wide(cls, frame, time_col=None, block=BLOCK):
+        """Index for a wide level frame (timestamp index or ``time_col``, one column per cauldron)."""
+        if time_col is not None:
+            frame = frame.set_index(time_col)
+        index = cls(frame.columns, block)
+        index.append(frame.index, frame.to_numpy(dtype="float64"))
+        return index
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def blocks(self):
+        return -(-self.n // self.block)
+
+    def append(self, times, values):
+        """Add rows (T x cauldrons, same column order) that come after every row already indexed."""
+        times = _ns(times)
+        values = np.asarray(values, dtype="float64").reshape(len(times), len(self.columns))
+        if len(times) == 0:
+            return
+        if np.any(np.diff(times) < 0) or (self.n and times[0] < self.times[self.n - 1]):
+            raise ValueError("append needs rows in time order, after the indexed ones")
+        a, b = self.n, self.n + len(times)
+        self.times = _grow(self.times, b)
+        for name in ("units", "valid", "pos", "neg"):
+            setattr(self, name, _grow(getattr(self, name), b))
+        units, valid = level_units(values.ravel())
+        self.units[a:b] = units.reshape(values.shape)
+        self.valid[a:b] = valid.reshape(values.shape)
+        self.times[a:b] = times
+
+        lo = max(a - 1, 0)
+        d = np.diff(self.units[lo:b], axis=0)
+        ok = self.valid[lo + 1:b] & self.valid[lo:b - 1]
+        step_pos = np.where(ok & (d > 0), d, 0)
+        step_neg = np.where(ok & (d < 0), d, 0)
+        if a == 0:
+            self.pos[0] = 0
+            self.neg[0] = 0
+        self.pos[lo + 1:b] = self.pos[lo] + np.cumsum(step_pos, axis=0)
+        self.neg[lo + 1:b] = self.neg[lo] + np.cumsum(step_neg, axis=0)
+        self.n = b
+        self._update_blocks(a // self.block)
+
+    def _update_blocks(self, first):
+        """Recompute block extrema from block ``first`` on, then the sparse-table entries above them."""
+        nb, B = self.blocks, self.block
+        if not self.st_min:
+            self.st_min.append(np.empty((0, len(self.columns)), dtype="int64"))
+            self.st_max.append(np.empty((0, len(self.columns)), dtype="int64"))
+        self.st_min[0] = _grow(self.st_min[0], nb, _HI)
+        self.st_max[0] = _grow(self.st_max[0], nb, _LO)
+        rows = nb * B
+        units = _grow(self.units, rows)[first * B:rows]
+        valid = _grow(self.valid, rows)[first * B:rows].copy()
+        valid[self.n - first * B:] = False
+        shape = (nb - first, B, len(self.columns))
+        self.st_min[0][first:nb] = np.where(valid, units, _HI).reshape(shape).min(axis=1)
+        self.st_max[0][first:nb] = np.where(valid, units, _LO).reshape(shape).max(axis=1)
+
+        k = 1
+        while (1 << k) <= nb:
+            half = 1 << (k - 1)
+            if len(self.st_min) <= k:
+                self.st_min.append(np.empty((0, len(self.columns)), dtype="int64"))
+                self.st_max.append(np.empty((0, len(self.columns)), dtype="int64"))
+            self.st_min[k] = _grow(self.st_min[k], nb, _HI)
+            self.st_max[k] = _grow(self.st_max[k], nb, _LO)
+            # entries whose span [i, i + 2**k) reaches a changed block and fits in nb blocks
+            lo, hi = max(first - (1 << k) + 1, 0), nb - (1 << k) + 1
+            if lo < hi:
+                below_min, below_max = self.st_min[k - 1], self.st_max[k - 1]
+                self.st_min[k][lo:hi] = np.minimum(below_min[lo:hi], below_min[lo + half:hi + half])
+                self.st_max[k][lo:hi] = np.maximum(below_max[lo:hi], below_max[lo + half:hi + half])
+            k += 1
+
+    def rows(self, start=None, end=None):
+        """[first, last] row numbers of the readings with start <= t <= end (first > last when none)."""
+        times = self.times[:self.n]
+        first = 0 if start is None else int(np.searchsorted(times, _ns(start), "left"))
+        last = self.n - 1 if end is None else int(np.searchsorted(times, _ns(end), "right")) - 1
+        return first, last
+
+    def totals(self, cauldron, starts, ends):
+        """(inflow, outflow) in liters for many [start, end] windows of one cauldron at once."""
+        c = self.col[cauldron]
+        times = self.times[:self.n]
+        first = np.searchsorted(times, _ns(starts), "left")
+        last = np.searchsorted(times, _ns(ends), "right") - 1
+        empty = first > last
+        first, last = np.where(empty, 0, first), np.where(empty, 0, last)
+        inflow = (self.pos[last, c] - self.pos[first, c]) / LEVEL_SCALE
+        outflow = -(self.neg[last, c] - self.neg[first, c]) / LEVEL_SCALE
+        return np.where(empty, np.nan, inflow), np.where(empty, np.nan, outflow)
+
+    def inflow(self, cauldron, start=None, end=None):
+        """Sum of the level rises inside the range (liters)."""
+        first, last = self.rows(start, end)
+        if first > last:
+            return np.nan
+        c = self.col[cauldron]
+        return int(self.pos[last, c] - self.pos[first, c]) / LEVEL_SCALE
+
+    def outflow(self, cauldron, start=None, end=None):
+        """Sum of the level drops inside the range, as a positive number of liters."""
+        first, last = self.rows(start, end)
+        if first > last:
+            return np.nan
+        c = self.col[cauldron]
+        return -int(self.neg[last, c] - self.neg[first, c]) / LEVEL_SCALE
+
+    def net_change(self, cauldron, start=None, end=None):
+        """Inflow minus outflow over the range (liters)."""
+        first, last = self.rows(start, end)
+        if first > last:
+            return np.nan
+        c = self.col[cauldron]
+        return int(self.pos[last, c] - self.pos[first, c] + self.neg[last, c] - self.neg[first, c]) / LEVEL_SCALE
+
+    def _extreme(self, cauldron, start, end, table, reduce, sentinel):
+        first, last = self.rows(start, end)
+        if first > last:
+            return np.nan
+        c, B = self.col[cauldron], self.block
+        units, valid = self.units[:, c], self.valid[:, c]
+
+        def scan(a, b):
+            part = units[a:b][valid[a:b]]
+            return reduce(part) if len(part) else sentinel
+
+        head, tail = first // B, last // B
+        if head == tail:
+            best = scan(first, last + 1)
+        else:
+            best = reduce([scan(first, (head + 1) * B), scan(tail * B, last + 1)])
+            lo, hi = head + 1, tail  # whole blocks in between
+            if lo < hi:
+                k = (hi - lo).bit_length() - 1
+                best = reduce([best, table[k][lo, c], table[k][hi - (1 << k), c]])
+        return np.nan if best == sentinel else int(best) / LEVEL_SCALE
+
+    def min(self, cauldron, start=None, end=None):
+        """Lowest reading in the range (liters)."""
+        return self._extreme(cauldron, start, end, self.st_min, np.min, _HI)
+
+    def max(self, cauldron, start=None, end=None):
+        """Highest reading in the range (liters)."""
+        return self._extreme(cauldron, start, end, self.st_max, np.max, _LO)
+
+    def summary(self, cauldron, start=None, end=None):
+        return {
+            "net_change": self.net_change(cauldron, start, end),
+            "inflow": self.inflow(cauldron, start, end),
+            "outflow": self.outflow(cauldron, start, end),
+            "min": self.min(cauldron, start, end),
+            "max": self.max(cauldron, start, end),
+        }
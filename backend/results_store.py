@@ -0,0 +1,245 @@
+# results_store.py
+# Embedded SQLite store for the pipeline results that used to be handed over
+# only as loose CSVs. Every table is typed (times are INTEGER epoch seconds UTC)
+# and indexed on (cauldron_id, time); each stage replaces or appends its rows in
+# one transaction, and WAL mode lets the dashboard read while a stage writes, so
+# readers always see either the old or the new results, never half of them.
+#
+# The CSV outputs are still written (atomically, via write_csv_atomic) for the
+# scripts and notebooks that read them. Readers should prefer a table only
+# while fresh() says so: a stage that ran without the store (or a store created
+# after the CSVs) leaves the table empty or older than its CSV.
+#
+#   python backend/results_store.py import [--data-dir streamlit/data]   # load existing CSVs
+import argparse
+import os
+import shutil
+import sqlite3
+
+import pandas as pd
+
+from event_features import FEATURE_COLUMNS
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+DEFAULT_DB = os.environ.get("POTION_RESULTS_DB", os.path.join(DEFAULT_DATA_DIR, "results.db"))
+
+# table -> (columns with SQL types, time column, CSV file name, CSV time columns)
+TABLES = {
+    "levels": (
+        [("cauldron_id", "TEXT NOT NULL"), ("ts", "INTEGER NOT NULL"), ("level", "REAL")],
+        "ts", "cauldron_data.csv", {"ts": "timestamp"},
+    ),
+    "drain_events": (
+        [("cauldron_id", "TEXT NOT NULL"), ("start_ts", "INTEGER NOT NULL"), ("end_ts", "INTEGER NOT NULL"),
+         ("volume_lost", "REAL"), ("significant", "INTEGER")] + [(c, "REAL") for c in FEATURE_COLUMNS],
+        "start_ts", "drain_events.csv", {"start_ts": "start_time", "end_ts": "end_time"},
+    ),
+    "tickets": (
+        [("ticket_id", "TEXT"), ("cauldron_id", "TEXT NOT NULL"), ("ts", "INTEGER NOT NULL"),
+         ("amount_collected", "REAL"), ("dup_count", "INTEGER")],
+        "ts", "tickets.csv", {"ts": "date"},
+    ),
+    "suspicious_events": (
+        [("cauldron_id", "TEXT NOT NULL"), ("day_ts", "INTEGER NOT NULL"), ("total_lost", "REAL"),
+         ("collected", "REAL"), ("difference", "REAL"), ("level_outflow", "REAL")],
+        "day_ts", "suspicious_events.csv", {"day_ts": "day"},
+    ),
+    "cauldron_rates": (
+        [("cauldron_id", "TEXT NOT NULL"), ("fill_rate", "REAL"), ("drain_rate", "REAL")],
+        None, "cauldron_rates.csv", {},
+    ),
+}
+
+
+def write_csv_atomic(df, path, **kwargs):
+    """df.to_csv via a temp file + rename, so readers never see a partial file."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    df.to_csv(tmp, index=False, **kwargs)
+    os.replace(tmp, path)
+
+
+def append_csv_atomic(df, path):
+    """Append ``df`` (no header) to the CSV at ``path`` on a temp copy + rename, like write_csv_atomic."""
+    tmp = f"{path}.tmp{os.getpid()}"
+    shutil.copyfile(path, tmp)
+    df.to_csv(tmp, mode="a", header=False, index=False)
+    os.replace(tmp, path)
+
+
+def connect(db_path=None):
+    conn = sqlite3.connect(db_path or DEFAULT_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for name, (columns, time_col, _, _) in TABLES.items():
+        cols = ", ".join(f"{c} {t}" for c, t in columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({cols})")
+        # stores created before a column was added to TABLES get it here
+        present = {row[1] for row in conn.execute(f"PRAGMA table_info({name})")}
+        for c, t in columns:
+            if c not in present:
+                conn.execute(f"ALTER TABLE {name} ADD COLUMN {c} {t.replace(' NOT NULL', '')}")
+        if time_col:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_cauldron_time ON {name} (cauldron_id, {time_col})")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name}_time ON {name} ({time_col})")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (table_name TEXT PRIMARY KEY, rows INTEGER, updated_at INTEGER)")
+    conn.commit()
+    return conn
+
+
+def exists(db_path=None):
+    return os.path.exists(db_path or DEFAULT_DB)
+
+
+def fresh(name, data_dir=DEFAULT_DATA_DIR, db_path=None):
+    """True if ``name`` holds rows and was written no earlier than its CSV in ``data_dir``.
+
+    Compared in whole seconds (meta.updated_at), so a table written in the same
+    second as its CSV counts as fresh.
+    """
+    if not exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path or DEFAULT_DB, timeout=30)
+    try:
+        row = conn.execute("SELECT rows, updated_at FROM meta WHERE table_name = ?", (name,)).fetchone()
+    except sqlite3.OperationalError:  # no meta table yet
+        return False
+    finally:
+        conn.close()
+    if row is None or not row[0]:
+        return False
+    csv_path = os.path.join(data_dir, TABLES[name][2])
+    return not os.path.exists(csv_path) or int(row[1]) >= int(os.path.getmtime(csv_path))
+
+
+def _epoch_seconds(series):
+    ts = pd.to_datetime(series, utc=True, errors="coerce")
+    return ts.dt.as_unit("s").astype("int64")
+
+
+def _param_seconds(value):
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize("UTC") if ts.tzinfo is None else ts
+    return int(ts.timestamp())
+
+
+def _to_rows(name, df):
+    """Frame in CSV shape (timestamp strings/datetimes) -> tuples in table column order."""
+    columns, _, _, time_map = TABLES[name]
+    out = pd.DataFrame(index=df.index)
+    for col, _type in columns:
+        src = time_map.get(col, col)
+        if src not in df.columns:
+            out[col] = None
+        elif col in time_map:
+            out[col] = _epoch_seconds(df[src])
+        elif col == "significant":
+            out[col] = df[src].astype(bool).astype(int)
+        else:
+            out[col] = df[src]
+    out = out.astype(object).where(out.notna(), None)
+    return list(out.itertuples(index=False, name=None))
+
+
+def _levels_long(wide):
+    """Wide cauldron_data frame (timestamp + one column per cauldron) -> long."""
+    wide = wide.reset_index() if "timestamp" not in wide.columns else wide
+    return wide.melt(id_vars=["timestamp"], var_name="cauldron_id", value_name="level")
+
+
+def replace_table(name, df, db_path=None):
+    """Replace all rows of ``name`` with ``df`` in one transaction."""
+    if name == "levels":
+        df = _levels_long(df)
+    rows = _to_rows(name, df)
+    columns = [c for c, _ in TABLES[name][0]]
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute(f"DELETE FROM {name}")
+            conn.executemany(f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+            conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?, strftime('%s','now'))", (name, len(rows)))
+    finally:
+        conn.close()
+
+
+def append_rows(name, df, db_path=None):
+    """Append ``df`` to ``name`` in one transaction."""
+    rows = _to_rows(name, df)
+    columns = [c for c, _ in TABLES[name][0]]
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.executemany(f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, (SELECT COUNT(*) FROM " + name + "), strftime('%s','now'))",
+                (name,))
+    finally:
+        conn.close()
+
+
+def query(name, cauldron=None, start=None, end=None, where=None, db_path=None):
+    """Rows of ``name`` for one cauldron and/or a time range [start, end].
+
+    Returns a frame with the CSV column names and tz-aware UTC datetimes, so it
+    can stand in for the old CSV loaders.
+    """
+    columns, time_col, _, time_map = TABLES[name]
+    clauses, params = [], []
+    if cauldron is not None:
+        clauses.append("cauldron_id = ?")
+        params.append(cauldron)
+    if start is not None and time_col:
+        clauses.append(f"{time_col} >= ?")
+        params.append(_param_seconds(start))
+    if end is not None and time_col:
+        clauses.append(f"{time_col} <= ?")
+        params.append(_param_seconds(end))
+    if where:
+        clauses.append(where)
+    sql = f"SELECT * FROM {name}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if time_col:
+        sql += f" ORDER BY cauldron_id, {time_col}"
+    conn = connect(db_path)
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    for col, src in time_map.items():
+        df[col] = pd.to_datetime(df[col], unit="s", utc=True)
+    df = df.rename(columns=time_map)
+    if "significant" in df.columns:
+        df["significant"] = df["significant"].astype(bool)
+    return df
+
+
+def cauldron_ids(name, db_path=None):
+    conn = connect(db_path)
+    try:
+        return [row[0] for row in conn.execute(f"SELECT DISTINCT cauldron_id FROM {name} ORDER BY cauldron_id")]
+    finally:
+        conn.close()
+
+
+def import_csvs(data_dir=DEFAULT_DATA_DIR, db_path=None):
+    for name, (_, _, csv_name, _) in TABLES.items():
+        path = os.path.join(data_dir, csv_name)
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path)
+        replace_table(name, df, db_path)
+        print(f"{name}: {len(df)} rows from {csv_name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite results store")
+    parser.add_argument("command", choices=["import"])
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--db", default=DEFAULT_DB)
+    args = parser.parse_args()
+
+    if args.command == "import":
+        import_csvs(args.data_dir, args.db)
+        print(f"Results store written to {args.db}")
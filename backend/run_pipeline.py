@@ -0,0 +1,349 @@
+# run_pipeline.py
+# Single entry point for the whole pipeline. The stages form a small DAG:
+#
+#   fetch_levels ──┬── detect ──┬── verify
+#                  │            ├── rollups
+#                  │            ├── assign
+#                  │            └── trips    (courier trips, courier_trips.py; also reads cauldrons.csv)
+#                  ├── rates        (verify, rollups, assign and trips also read tickets.csv)
+#                  ├── archive      (fixed-point level archive, level_codec.py)
+#                  └── report       (static HTML bundle, build_report.py)
+#   fetch_tickets ─── verify, rollups, assign, trips, report
+#
+# A stage is rerun only when its fingerprint changes: the sha256 of every input
+# file, its parameters and the source of the module that implements it and of
+# every local module that one imports, directly or not (found with ast, so
+# lazy imports inside functions count too). File hashes are cached by (size,
+# mtime_ns) and each module's imports by its hash in the state file, so a
+# refresh where nothing changed only stats a handful of files. Parameters hold
+# only what was given on the command line; the defaults are the stage modules'
+# constants (NOISE_K, TOLERANCE), whose source is already in the fingerprint.
+# Stages whose dependencies are done run concurrently. Fetch stages hit the API
+# and only run with --fetch.
+#
+# Run:  python backend/run_pipeline.py [--fetch] [--force detect] [--data-dir streamlit/data]
+import argparse
+import ast
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+STATE_FILE = ".pipeline_state.json"
+HASH_BLOCK = 1 << 20
+
+
+# Stage bodies import the pandas modules lazily so a no-op refresh does not pay
+# for importing them.
+def _read_levels(path):
+    import pandas as pd
+    return pd.read_csv(path, index_col="timestamp", parse_dates=True)
+
+
+def _save(df, path, table, db_path):
+    import results_store
+    results_store.write_csv_atomic(df, path)
+    if table:
+        results_store.replace_table(table, df, db_path)
+
+
+def run_detect(ctx):
+    from drain_noise import NOISE_K
+    from detect_drain_events import detect_drain_events
+    params = ctx.params.get("detect", {})
+    events_df, noise_df = detect_drain_events(_read_levels(ctx.path("cauldron_data.csv")), params.get("noise_k", NOISE_K),
+                                              return_noise=True, denoise_window=params.get("denoise_window", 0))
+    _save(events_df, ctx.path("drain_events.csv"), "drain_events", ctx.db_path)
+    if params.get("keep_noise"):
+        _save(noise_df, ctx.path("drain_noise.csv"), None, ctx.db_path)
+
+
+def run_rates(ctx):
+    from compute_rates import compute_rates
+    rates_df = compute_rates(_read_levels(ctx.path("cauldron_data.csv")))
+    _save(rates_df, ctx.path("cauldron_rates.csv"), "cauldron_rates", ctx.db_path)
+
+
+def run_verify(ctx):
+    import pandas as pd
+    from verify_drain_tickets import TOLERANCE, verify_drain_tickets
+    drains = pd.read_csv(ctx.path("drain_events.csv"))
+    tickets = pd.read_csv(ctx.path("tickets.csv"))
+    suspicious_df = verify_drain_tickets(drains, tickets, tolerance=ctx.params.get("verify", {}).get("tolerance", TOLERANCE))
+    _save(suspicious_df, ctx.path("suspicious_events.csv"), "suspicious_events", ctx.db_path)
+
+
+def run_rollups(ctx):
+    import pandas as pd
+    from build_rollups import build_rollups
+    rollups_df = build_rollups(
+        _read_levels(ctx.path("cauldron_data.csv")),
+        pd.read_csv(ctx.path("tickets.csv")),
+        pd.read_csv(ctx.path("drain_events.csv")),
+    )
+    _save(rollups_df, ctx.path("daily_rollups.csv"), None, ctx.db_path)
+
+
+def run_assign(ctx):
+    import pandas as pd
+    from assign_tickets import assign_tickets
+    pairs, summary, unassigned = assign_tickets(pd.read_csv(ctx.path("tickets.csv")), pd.read_csv(ctx.path("drain_events.csv")))
+    _save(pairs, ctx.path("ticket_assignments.csv"), None, ctx.db_path)
+    _save(summary, ctx.path("ticket_assignment_summary.csv"), None, ctx.db_path)
+    _save(unassigned, ctx.path("unassigned_drains.csv"), None, ctx.db_path)
+
+
+def run_trips(ctx):
+    import pandas as pd
+    from courier_trips import courier_trips
+    trips, stops = courier_trips(pd.read_csv(ctx.path("drain_events.csv")), pd.read_csv(ctx.path("tickets.csv")),
+                                 pd.read_csv(ctx.path("cauldrons.csv")))
+    _save(trips, ctx.path("courier_trips.csv"), None, ctx.db_path)
+    _save(stops, ctx.path("courier_trip_stops.csv"), None, ctx.db_path)
+
+
+def run_archive(ctx):
+    import level_codec
+    level_codec.write(_read_levels(ctx.path("cauldron_data.csv")), ctx.path("cauldron_data.lvc"))
+
+
+def run_report(ctx):
+    from build_report import build_report
+    from verify_drain_tickets import TOLERANCE
+    build_report(ctx.data_dir, ctx.path("report"), tolerance=ctx.params.get("report", {}).get("tolerance", TOLERANCE))
+
+
+def run_fetch_levels(ctx):
+    from test_api import fetch_levels, save_levels
+    save_levels(fetch_levels(), ctx.path("cauldron_data.csv"), ctx.db_path)
+
+
+def run_fetch_tickets(ctx):
+    from fetch_tickets import fetch_tickets, sync_tickets
+    sync_tickets(fetch_tickets(), ctx.path("tickets.csv"), ctx.db_path)
+
+
+def run_fetch_cauldrons(ctx):
+    from fetch_cauldrons import fetch_cauldrons
+    _save(fetch_cauldrons(), ctx.path("cauldrons.csv"), None, ctx.db_path)
+
+
+class Stage:
+    def __init__(self, name, run, inputs=(), outputs=(), source=None, fetch=False):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.source = source  # module file whose code (and local imports) are part of the fingerprint
+        self.fetch = fetch
+
+
+STAGES = [
+    Stage("fetch_levels", run_fetch_levels, outputs=["cauldron_data.csv"], fetch=True),
+    Stage("fetch_tickets", run_fetch_tickets, outputs=["tickets.csv"], fetch=True),
+    Stage("fetch_cauldrons", run_fetch_cauldrons, outputs=["cauldrons.csv"], fetch=True),
+    Stage("detect", run_detect, ["cauldron_data.csv"], ["drain_events.csv"], "detect_drain_events.py"),
+    Stage("rates", run_rates, ["cauldron_data.csv"], ["cauldron_rates.csv"], "compute_rates.py"),
+    Stage("verify", run_verify, ["drain_events.csv", "tickets.csv"], ["suspicious_events.csv"], "verify_drain_tickets.py"),
+    Stage("rollups", run_rollups, ["cauldron_data.csv", "tickets.csv", "drain_events.csv"], ["daily_rollups.csv"],
+          "build_rollups.py"),
+    Stage("assign", run_assign, ["drain_events.csv", "tickets.csv"],
+          ["ticket_assignments.csv", "ticket_assignment_summary.csv", "unassigned_drains.csv"], "assign_tickets.py"),
+    Stage("trips", run_trips, ["drain_events.csv", "tickets.csv", "cauldrons.csv"],
+          ["courier_trips.csv", "courier_trip_stops.csv"], "courier_trips.py"),
+    Stage("archive", run_archive, ["cauldron_data.csv"], ["cauldron_data.lvc"], "level_codec.py"),
+    Stage("report", run_report, ["cauldron_data.csv", "tickets.csv", "drain_events.csv", "cauldrons.csv"],
+          ["report/index.html"], "build_report.py"),
+]
+
+
+def dependencies(stages):
+    """stage name -> names of the stages that produce one of its inputs."""
+    producers = {out: s.name for s in stages for out in s.outputs}
+    return {s.name: sorted({producers[i] for i in s.inputs if i in producers}) for s in stages}
+
+
+class FileHasher:
+    """sha256 of file contents, reusing the stored digest while (size, mtime_ns) is unchanged."""
+
+    def __init__(self, cache):
+        self.cache = cache  # path -> [size, mtime_ns, sha256]
+
+    def __call__(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        cached = self.cache.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+        self.cache[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+
+class Context:
+    def __init__(self, data_dir, db_path, params):
+        self.data_dir = data_dir
+        self.db_path = db_path
+        self.params = params
+
+    def path(self, name):
+        return os.path.join(self.data_dir, name)
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {"files": {}, "imports": {}, "stages": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    state.setdefault("imports", {})  # state files written before imports were tracked
+    return state
+
+
+def save_state(state, path):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def direct_imports(path):
+    """Local module files (next to this one) imported anywhere in ``path``."""
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names.add(node.module.split(".")[0])
+    return sorted(f"{n}.py" for n in names if os.path.exists(os.path.join(script_dir, f"{n}.py")))
+
+
+def source_files(source, hasher, imports):
+    """``source`` and every local module it imports, directly or not.
+
+    ``imports`` caches module file -> [sha256, direct imports] across runs.
+    """
+    seen, todo = set(), [source]
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        path = os.path.join(script_dir, name)
+        digest = hasher(path)
+        if digest is None:
+            continue
+        cached = imports.get(name)
+        if not cached or cached[0] != digest:
+            cached = imports[name] = [digest, direct_imports(path)]
+        todo.extend(cached[1])
+    return sorted(seen)
+
+
+def fingerprint(stage, ctx, hasher, imports):
+    files = source_files(stage.source, hasher, imports) if stage.source else []
+    payload = {
+        "inputs": {name: hasher(ctx.path(name)) for name in stage.inputs},
+        "params": ctx.params.get(stage.name, {}),
+        "source": {name: hasher(os.path.join(script_dir, name)) for name in files},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def run_pipeline(data_dir=DEFAULT_DATA_DIR, db_path=None, fetch=False, force=(), jobs=4, params=None):
+    """Run every stage whose fingerprint changed; returns {stage: status}."""
+    if db_path is None:
+        db_path = os.environ.get("POTION_RESULTS_DB", os.path.join(data_dir, "results.db"))
+    ctx = Context(data_dir, db_path, params or {})
+    state_path = os.path.join(data_dir, STATE_FILE)
+    state = load_state(state_path)
+    hasher = FileHasher(state["files"])
+    deps = dependencies(STAGES)
+    stages = {s.name: s for s in STAGES}
+    status = {}
+    pending = dict(stages)
+    running = {}
+
+    def finished(name):
+        return name in status and status[name] in ("ran", "unchanged", "skipped")
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name in list(pending):
+                stage = pending[name]
+                if any(d in status and not finished(d) for d in deps[name]):
+                    status[name] = "blocked"
+                    del pending[name]
+                    continue
+                if not all(finished(d) for d in deps[name]):
+                    continue
+                del pending[name]
+                if stage.fetch and not (fetch or name in force or "all" in force):
+                    status[name] = "skipped"
+                    continue
+                fp = None if stage.fetch else fingerprint(stage, ctx, hasher, state["imports"])
+                outputs_present = all(os.path.exists(ctx.path(o)) for o in stage.outputs)
+                forced = name in force or "all" in force
+                if not stage.fetch and not forced and outputs_present and state["stages"].get(name, {}).get("fingerprint") == fp:
+                    status[name] = "unchanged"
+                    continue
+                running[pool.submit(_timed, stage.run, ctx)] = (name, fp)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, fp = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    status[name] = "failed"
+                    print(f"{name}: failed ({e})")
+                    continue
+                status[name] = "ran"
+                state["stages"][name] = {"fingerprint": fp, "seconds": round(seconds, 3), "finished_at": int(time.time())}
+                save_state(state, state_path)
+                print(f"{name}: ran in {seconds:.2f}s")
+    # refresh cached file hashes (the stages above may have rewritten outputs)
+    save_state(state, state_path)
+    return status
+
+
+def _timed(fn, ctx):
+    t0 = time.perf_counter()
+    fn(ctx)
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the pipeline stages whose inputs changed")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--db", default=None, help="results store (default <data-dir>/results.db)")
+    parser.add_argument("--fetch", action="store_true", help="refresh levels, tickets and cauldrons from the API first")
+    parser.add_argument("--force", action="append", default=[], help="rerun this stage regardless (repeatable, or 'all')")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--tolerance", type=float, help="verify, report: liters of mismatch per cauldron-day (default TOLERANCE)")
+    parser.add_argument("--noise-k", type=float, help="detect: noise floor in MAD sigmas, 0 keeps every event (default NOISE_K)")
+    parser.add_argument("--keep-noise", action="store_true", default=None, help="detect: write per-day counts of the merged noise events to drain_noise.csv")
+    parser.add_argument("--denoise-window", type=int, help="detect: rolling-median window in rows (odd; 0 = off)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    given = {"detect": {"noise_k": args.noise_k, "keep_noise": args.keep_noise, "denoise_window": args.denoise_window},
+             "verify": {"tolerance": args.tolerance}, "report": {"tolerance": args.tolerance}}
+    params = {stage: {k: v for k, v in p.items() if v is not None} for stage, p in given.items()}
+    status = run_pipeline(args.data_dir, args.db, args.fetch, args.force, args.jobs, params)
+    for name, s in status.items():
+        if s != "ran":
+            print(f"{name}: {s}")
+    print(f"pipeline done in {time.perf_counter() - t0:.2f}s")
+    if "failed" in status.values():
+        raise SystemExit(1)
@@ -0,0 +1,83 @@
+# stages.py
+# The pipeline as an importable API: every stage is a function that takes and
+# returns in-memory frames, so callers can chain stages without writing and
+# re-parsing CSVs in between:
+#
+#   import stages
+#   levels = stages.fetch_levels()                      # or stages.read_levels(path)
+#   out = stages.run(levels, stages.fetch_tickets())
+#   out["suspicious"], out["drains"], out["rates"], ...
+#
+# The stage modules' command lines (detect_drain_events.py, verify_drain_tickets.py,
+# fetch_tickets.py, test_api.py, ...) are thin wrappers over the same functions
+# that read and write the data dir, and run_pipeline.py schedules them by
+# file fingerprint. Importing this module does no work.
+import os
+
+import pandas as pd
+
+from assign_tickets import assign_tickets
+from build_rollups import build_rollups
+from compute_rates import compute_rates
+from courier_trips import courier_trips
+from detect_drain_events import detect_drain_events
+from drain_noise import NOISE_K
+from fetch_cauldrons import fetch_cauldrons
+from fetch_tickets import fetch_tickets, sync_tickets
+from test_api import fetch_levels, save_levels
+from verify_drain_tickets import TOLERANCE, verify_drain_tickets
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+__all__ = [
+    "assign_tickets",
+    "build_rollups",
+    "compute_rates",
+    "courier_trips",
+    "detect_drain_events",
+    "fetch_cauldrons",
+    "fetch_levels",
+    "fetch_tickets",
+    "load",
+    "read_levels",
+    "run",
+    "save_levels",
+    "sync_tickets",
+    "verify_drain_tickets",
+]
+
+
+def read_levels(path):
+    """Wide level frame (timestamp index, one column per cauldron) from cauldron_data.csv."""
+    return pd.read_csv(path, index_col="timestamp", parse_dates=True)
+
+
+def load(data_dir=DEFAULT_DATA_DIR):
+    """(levels, tickets, cauldrons) as stored in ``data_dir``."""
+    return (
+        read_levels(os.path.join(data_dir, "cauldron_data.csv")),
+        pd.read_csv(os.path.join(data_dir, "tickets.csv")),
+        pd.read_csv(os.path.join(data_dir, "cauldrons.csv")),
+    )
+
+
+def run(levels, tickets, tolerance=TOLERANCE, noise_k=NOISE_K, denoise_window=0):
+    """Every derived output for ``levels`` and ``tickets``, chained in memory.
+
+    Returns a dict of frames: drains, noise (merged noise events per cauldron-day),
+    rates, suspicious, rollups, assignments, assignment_summary, unassigned.
+    ``denoise_window`` > 0 detects on the rolling-median filtered levels.
+    """
+    drains, noise = detect_drain_events(levels, noise_k, return_noise=True, denoise_window=denoise_window)
+    assignments, summary, unassigned = assign_tickets(tickets, drains)
+    return {
+        "drains": drains,
+        "noise": noise,
+        "rates": compute_rates(levels),
+        "suspicious": verify_drain_tickets(drains, tickets, tolerance),
+        "rollups": build_rollups(levels, tickets, drains),
+        "assignments": assignments,
+        "assignment_summary": summary,
+        "unassigned": unassigned,
+    }
@@ -0,0 +1,157 @@
+# sweep_drain_params.py
+# Batch evaluation of drain detection / reconciliation parameters.
+#
+# Every combination of DRAIN_DROP_THRESHOLD, ROLLING_WINDOW, MIN_EVENT_GAP, the
+# significance cut and the verify tolerance is scored in one pass. Work is
+# shared along the grid: the windowed diff is computed once per window, the
+# drop mask once per (window, threshold), events and their per-day totals once
+# per (window, threshold, gap), and the significance cut and tolerance are then
+# just vector comparisons. Events follow detect_drain_events exactly (including
+# the gap being measured with Timedelta.seconds and the noise floor, which is
+# capped at each significance cut) and reconciliation follows
+# verify_drain_tickets, so the default grid point reproduces both scripts.
+#
+# Run:  python backend/sweep_drain_params.py --thresholds 0.01,0.05,0.1 --windows 3,5 --gaps 1,5 \
+#           --significance 0.2,0.5 --tolerances 5,10 [--out drain_param_sweep.csv]
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from denoise import median_filter
+from detect_drain_events import DRAIN_DROP_THRESHOLD, MIN_EVENT_GAP, ROLLING_WINDOW, SIGNIFICANT_VOLUME
+from drain_noise import NOISE_K, noise_floors, noise_owners
+from verify_drain_tickets import TOLERANCE
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+DAY_NS = 86_400 * 1_000_000_000
+SECOND_NS = 1_000_000_000
+
+
+def windowed_diff(values, window):
+    """``DataFrame.diff(window)`` on a T x C float matrix."""
+    out = np.full(values.shape, np.nan)
+    if window < len(values):
+        out[window:] = values[window:] - values[:-window]
+    return out
+
+
+def event_bounds(drain_idx, times_ns, gap):
+    """Row indices of the first and last drain point of every event in one cauldron."""
+    if len(drain_idx) == 0:
+        return drain_idx, drain_idx
+    # (t - prev).seconds / 60 > gap, where Timedelta.seconds drops whole days
+    seconds = (np.diff(times_ns[drain_idx]) // SECOND_NS) % 86_400
+    breaks = np.flatnonzero(seconds / 60 > gap) + 1
+    starts = np.concatenate([[0], breaks])
+    ends = np.concatenate([breaks - 1, [len(drain_idx) - 1]])
+    return drain_idx[starts], drain_idx[ends]
+
+
+def detect_events(values, times_ns, diff, threshold, gap):
+    """(cauldron column, start row, end row, volume lost) arrays for one parameter set."""
+    mask = diff < -threshold
+    cols, starts, ends = [], [], []
+    for c in range(values.shape[1]):
+        s, e = event_bounds(np.flatnonzero(mask[:, c]), times_ns, gap)
+        cols.append(np.full(len(s), c))
+        starts.append(s)
+        ends.append(e)
+    cols = np.concatenate(cols) if cols else np.array([], dtype="int64")
+    starts = np.concatenate(starts) if starts else np.array([], dtype="int64")
+    ends = np.concatenate(ends) if ends else np.array([], dtype="int64")
+    volume = np.abs(values[starts, cols] - values[ends, cols])
+    return cols, starts, ends, volume
+
+
+def daily_lost_vs_collected(cols, starts, volume, times_ns, collected):
+    """Per drain-day: drained volume summed per (cauldron, start day) and the ticketed volume."""
+    days = times_ns[starts] // DAY_NS
+    lost = pd.Series(volume).groupby([cols, days]).sum()
+    got = collected.reindex(lost.index, fill_value=0.0).to_numpy()
+    return lost.to_numpy(), got
+
+
+def ticket_totals(tickets, cauldrons):
+    """amount_collected summed per (cauldron column, UTC day)."""
+    col = {c: i for i, c in enumerate(cauldrons)}
+    t = tickets[tickets["cauldron_id"].isin(col)]
+    days = pd.to_datetime(t["date"], utc=True).dt.as_unit("ns").astype("int64") // DAY_NS
+    return t["amount_collected"].groupby([t["cauldron_id"].map(col).to_numpy(), days.to_numpy()]).sum()
+
+
+def sweep(levels, tickets, thresholds, windows, gaps, significance, tolerances, noise_k=NOISE_K):
+    """One row per parameter combination with event counts and mismatch rates."""
+    times_ns = pd.to_datetime(levels.index, utc=True).as_unit("ns").asi8
+    cauldrons = list(levels.columns)
+    values = levels.to_numpy(dtype="float64")
+    collected = ticket_totals(tickets, cauldrons)
+    significance = np.asarray(significance, dtype="float64")
+    tolerances = np.asarray(tolerances, dtype="float64")
+    # uncapped floor per column; each significance cut caps it
+    floors = noise_floors(levels, np.inf, noise_k)
+    floor = np.array([floors[c] for c in cauldrons], dtype="float64")
+
+    rows = []
+    for window in windows:
+        diff = windowed_diff(values, window)
+        for threshold, gap in itertools.product(thresholds, gaps):
+            cols, starts, ends, volume = detect_events(values, times_ns, diff, threshold, gap)
+            # noise events are merged within their cauldron-day, so the day totals don't depend on the floor
+            lost, got = daily_lost_vs_collected(cols, starts, volume, times_ns, collected)
+            n_suspicious = (np.abs(lost - got)[:, None] > tolerances[None, :]).sum(axis=0)
+            for sig in significance:
+                noise = volume < np.minimum(floor[cols], sig)
+                owner = noise_owners(cols, times_ns[starts], times_ns[ends], noise)
+                for j, tol in enumerate(tolerances):
+                    rows.append({
+                        "threshold": threshold,
+                        "window": window,
+                        "gap": gap,
+                        "significance": sig,
+                        "tolerance": tol,
+                        "events": int((owner == np.arange(len(owner))).sum()),
+                        "significant_events": int((volume >= sig).sum()),
+                        "drain_days": len(lost),
+                        "suspicious_days": int(n_suspicious[j]),
+                        "mismatch_rate": n_suspicious[j] / len(lost) if len(lost) else np.nan,
+                    })
+    return pd.DataFrame(rows)
+
+
+def _floats(text):
+    return [float(x) for x in text.split(",") if x]
+
+
+def _ints(text):
+    return [int(x) for x in text.split(",") if x]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep drain detection and reconciliation parameters")
+    parser.add_argument("--levels", default=os.path.join(DEFAULT_DATA_DIR, "cauldron_data.csv"))
+    parser.add_argument("--tickets", default=os.path.join(DEFAULT_DATA_DIR, "tickets.csv"))
+    parser.add_argument("--thresholds", type=_floats, default=[DRAIN_DROP_THRESHOLD])
+    parser.add_argument("--windows", type=_ints, default=[ROLLING_WINDOW])
+    parser.add_argument("--gaps", type=_floats, default=[MIN_EVENT_GAP], help="minutes")
+    parser.add_argument("--significance", type=_floats, default=[SIGNIFICANT_VOLUME])
+    parser.add_argument("--tolerances", type=_floats, default=[TOLERANCE])
+    parser.add_argument("--noise-k", type=float, default=NOISE_K, help="noise floor in MAD sigmas (0 keeps every event)")
+    parser.add_argument("--denoise-window", type=int, default=0, help="rolling-median window in rows before detection (odd; 0 = off)")
+    parser.add_argument("--out", default=os.path.join(DEFAULT_DATA_DIR, "drain_param_sweep.csv"))
+    args = parser.parse_args()
+
+    levels = pd.read_csv(args.levels, index_col="timestamp", parse_dates=True)
+    if args.denoise_window:
+        levels = median_filter(levels, args.denoise_window)
+    tickets = pd.read_csv(args.tickets)
+    t0 = time.perf_counter()
+    result = sweep(levels, tickets, args.thresholds, args.windows, args.gaps, args.significance, args.tolerances,
+                   args.noise_k)
+    result.to_csv(args.out, index=False)
+    print(f"{len(result)} combinations in {time.perf_counter() - t0:.2f}s, saved to {args.out}")
+    print(result.sort_values("mismatch_rate").head(10).to_string(index=False))
@@ -1,24 +1,51 @@
-import requests
+import argparse
+import os
+
 import pandas as pd
 
-# 1. Call the API to fetch cauldron level data
+import http_cache
+import results_store
+
 url = "https://hackutd2025.eog.systems/api/Data/?start_date=0&end_date=2000000000"
-response = requests.get(url)
-print("Status Code:", response.status_code)  # Check if the API request was successful
 
-data = response.json()  # Parse the JSON response
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+
+def fetch_levels():
+    """Cauldron levels from the API as a wide frame (timestamp index, one column per cauldron)."""
+    # 1. Call the API to fetch cauldron level data
+    response = http_cache.get(url)  # conditional GET / replay, see http_cache.py
+    if response.status_code != 200:
+        raise RuntimeError(f"Failed to fetch level data: {response.status_code}")
+
+    data = response.json()  # Parse the JSON response
+
+    # 2. Convert JSON into a pandas DataFrame
+    df = pd.DataFrame([
+        {'timestamp': item['timestamp'], **item['cauldron_levels']} for item in data
+    ])
+
+    # 3. Convert timestamp to datetime format and sort the DataFrame by timestamp
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df.set_index('timestamp').sort_index()
+
+
+def save_levels(df, path, db_path=None):
+    """Write the level history to ``path`` and the results store."""
+    results_store.write_csv_atomic(df.reset_index(), path)
+    results_store.replace_table("levels", df, db_path)
+
 
-# 2. Convert JSON into a pandas DataFrame
-df = pd.DataFrame([
-    {'timestamp': item['timestamp'], **item['cauldron_levels']} for item in data
-])
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fetch the cauldron level history")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    args = parser.parse_args()
 
-# 3. Convert timestamp to datetime format and sort the DataFrame by timestamp
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-df = df.set_index('timestamp').sort_index()
+    df = fetch_levels()
 
-# 4. Check a sample of the data
-print(df.head())
+    # 4. Check a sample of the data
+    print(df.head())
 
-# 5. Save the full dataset to a CSV file for later analysis
-df.to_csv("cauldron_data.csv")
+    # 5. Save the full dataset to a CSV file for later analysis
+    save_levels(df, os.path.join(args.data_dir, "cauldron_data.csv"))
@@ -1,56 +1,104 @@
 # verify_drain_tickets_local.py
+import argparse
 import os
 import pandas as pd
 
-# --- 1. Load drain events ---
-script_dir = os.path.dirname(__file__)
-drain_file = os.path.join(script_dir, "drain_events.csv")
-drains = pd.read_csv(drain_file, parse_dates=["start_time", "end_time"])
-
-# Ensure drain events are tz-aware UTC
-drains["start_time"] = pd.to_datetime(drains["start_time"], utc=True)
-drains["end_time"] = pd.to_datetime(drains["end_time"], utc=True)
-
-# --- 2. Load ticket CSV ---
-ticket_file = os.path.join(script_dir, "tickets.csv")
-tickets = pd.read_csv(ticket_file, parse_dates=["date"])
-
-# Ensure tickets are tz-aware UTC
-tickets["date"] = pd.to_datetime(tickets["date"], utc=True)
-
-# --- 3. Compare drains with tickets per day ---
-suspicious_events = []
-
-# Group drains by cauldron and day
-drains["day"] = drains["start_time"].dt.floor("D")
-grouped_drains = drains.groupby(["cauldron_id", "day"])["volume_lost"].sum().reset_index()
-
-for _, row in grouped_drains.iterrows():
-    cauldron = row["cauldron_id"]
-    day = row["day"]
-    total_lost = row["volume_lost"]
-
-    # Get ticket for that cauldron and day
-    mask = (tickets["cauldron_id"] == cauldron) & (tickets["date"].dt.floor("D") == day)
-    ticket_row = tickets[mask]
-
-    collected = ticket_row["amount_collected"].sum() if not ticket_row.empty else 0
-
-    # Flag as suspicious if total_lost and collected differ
-    if abs(total_lost - collected) > 10:  # tolerance for floating point
-        suspicious_events.append({
-            "cauldron_id": cauldron,
-            "day": day,
-            "total_lost": total_lost,
-            "collected": collected,
-            "difference": collected - total_lost
-        })
-
-# --- 4. Save suspicious events ---
-if suspicious_events:
-    suspicious_df = pd.DataFrame(suspicious_events)
-    output_file = os.path.join(script_dir, "suspicious_events.csv")
-    suspicious_df.to_csv(output_file, index=False)
-    print(f"Suspicious events saved to {output_file}")
-else:
-    print("No suspicious events detected.")
+import results_store
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATA_DIR = os.path.join(script_dir, "..", "streamlit", "data")
+
+TOLERANCE = 10  # liters per cauldron-day
+SUSPICIOUS_COLUMNS = ["cauldron_id", "day", "total_lost", "collected", "difference"]
+
+
+def verify_drain_tickets(drains, tickets, tolerance=TOLERANCE, levels=None):
+    """Cauldron-days whose drained volume and ticketed volume differ by more than ``tolerance``.
+
+    With ``levels`` (a range_index.LevelRangeIndex over the level history) each
+    flagged day also gets level_outflow: the sum of all level drops that day,
+    measured straight from the levels rather than from the detected events.
+    """
+    # Ensure drain events and tickets are tz-aware UTC
+    drains = drains.copy()
+    tickets = tickets.copy()
+    drains["start_time"] = pd.to_datetime(drains["start_time"], utc=True)
+    drains["end_time"] = pd.to_datetime(drains["end_time"], utc=True)
+    tickets["date"] = pd.to_datetime(tickets["date"], utc=True)
+
+    # --- Compare drains with tickets per day ---
+    suspicious_events = []
+
+    # Group drains by cauldron and day
+    drains["day"] = drains["start_time"].dt.floor("D")
+    grouped_drains = drains.groupby(["cauldron_id", "day"])["volume_lost"].sum().reset_index()
+
+    for _, row in grouped_drains.iterrows():
+        cauldron = row["cauldron_id"]
+        day = row["day"]
+        total_lost = row["volume_lost"]
+
+        # Get ticket for that cauldron and day
+        mask = (tickets["cauldron_id"] == cauldron) & (tickets["date"].dt.floor("D") == day)
+        ticket_row = tickets[mask]
+
+        collected = ticket_row["amount_collected"].sum() if not ticket_row.empty else 0
+
+        # Flag as suspicious if total_lost and collected differ
+        if abs(total_lost - collected) > tolerance:  # tolerance for floating point
+            suspicious_events.append({
+                "cauldron_id": cauldron,
+                "day": day,
+                "total_lost": total_lost,
+                "collected": collected,
+                "difference": collected - total_lost
+            })
+
+    suspicious_df = pd.DataFrame(suspicious_events, columns=SUSPICIOUS_COLUMNS)
+    if levels is not None:
+        suspicious_df["level_outflow"] = level_outflow(levels, suspicious_df)
+    return suspicious_df
+
+
+def level_outflow(levels, days):
+    """Level drops (liters) over each (cauldron_id, day) row of ``days``, NaN for cauldrons not indexed."""
+    out = pd.Series(float("nan"), index=days.index)
+    for cauldron, rows in days.groupby("cauldron_id").groups.items():
+        if cauldron in levels.col:
+            start = pd.to_datetime(days.loc[rows, "day"], utc=True)
+            _, out[rows] = levels.totals(cauldron, start, start + pd.Timedelta(days=1) - pd.Timedelta(1, "ns"))
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare drained and ticketed volume per cauldron-day")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="liters of mismatch per cauldron-day")
+    parser.add_argument("--level-outflow", action="store_true",
+                        help="add the level drops measured on each flagged day (reads cauldron_data.csv)")
+    args = parser.parse_args()
+
+    # --- 1. Load drain events ---
+    drain_file = os.path.join(args.data_dir, "drain_events.csv")
+    drains = pd.read_csv(drain_file, parse_dates=["start_time", "end_time"])
+
+    # --- 2. Load ticket CSV ---
+    ticket_file = os.path.join(args.data_dir, "tickets.csv")
+    tickets = pd.read_csv(ticket_file, parse_dates=["date"])
+
+    levels = None
+    if args.level_outflow:
+        from range_index import LevelRangeIndex
+        levels = LevelRangeIndex.from_wide(pd.read_csv(os.path.join(args.data_dir, "cauldron_data.csv")), "timestamp")
+
+    # --- 3. Compare drains with tickets per day ---
+    suspicious_df = verify_drain_tickets(drains, tickets, args.tolerance, levels)
+
+    # --- 4. Save suspicious events ---
+    if not suspicious_df.empty:
+        output_file = os.path.join(args.data_dir, "suspicious_events.csv")
+        results_store.write_csv_atomic(suspicious_df, output_file)
+        results_store.replace_table("suspicious_events", suspicious_df)
+        print(f"Suspicious events saved to {output_file}")
+    else:
+        print("No suspicious events detected.")
@@ -4,6 +4,11 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 
+import query_client
+from render_cache import show_chart
+from section_timer import timed
+from time_index import TimeIndex, data_version
+
 st.title("Historic Data Playback")
 
 # -------------------------------
@@ -12,7 +17,7 @@ st.title("Historic Data Playback")
 import os
 
 BASE_DIR = os.path.dirname(__file__)  # points to streamlit_app
-DATA_DIR = os.path.join(BASE_DIR, "data")  # look inside streamlit_app/data
+DATA_DIR = os.environ.get("POTION_DATA_DIR", os.path.join(BASE_DIR, "data"))  # look inside streamlit_app/data
 
 
 potion_path = os.path.join(DATA_DIR, "cauldron_data.csv")
@@ -21,48 +26,55 @@ cauldrons_path = os.path.join(DATA_DIR, "cauldrons.csv")
 rates_path = os.path.join(DATA_DIR, "cauldron_rates.csv")
 
 # -------------------------------
-# 2. Load CSVs
+# 2. Load CSVs and build time indexes (cached per data version)
 # -------------------------------
-potion_df = pd.read_csv(potion_path, parse_dates=["timestamp"])
-ticket_df = pd.read_csv(ticket_path, parse_dates=["date"])
-cauldrons_df = pd.read_csv(cauldrons_path)
-rates_df = pd.read_csv(rates_path)
+@st.cache_resource
+def load_playback(version):
+    # (served by the query service when POTION_QUERY_URL is set)
+    potion_long = query_client.levels()
+    ticket_df = query_client.tickets()
+    if ticket_df is None:
+        ticket_df = pd.read_csv(ticket_path, parse_dates=["date"])
+    cauldrons_df = pd.read_csv(cauldrons_path)
+    rates_df = pd.read_csv(rates_path)
 
-# -------------------------------
-# 3️. Transform potion_df to long format
-# -------------------------------
-potion_long = potion_df.melt(id_vars=["timestamp"],
-                             var_name="cauldron_id",
-                             value_name="level")
+    # 3️. Transform potion_df to long format
+    if potion_long is None:
+        potion_df = pd.read_csv(potion_path, parse_dates=["timestamp"])
+        potion_long = potion_df.melt(id_vars=["timestamp"],
+                                     var_name="cauldron_id",
+                                     value_name="level")
 
-# -------------------------------
-# 4️. Merge with cauldrons info and rates
-# -------------------------------
-potion_long = potion_long.merge(cauldrons_df, left_on="cauldron_id", right_on="id", how="left")
-potion_long = potion_long.merge(rates_df, on="cauldron_id", how="left")
+    # 4️. Merge with cauldrons info and rates
+    potion_long = potion_long.merge(cauldrons_df, left_on="cauldron_id", right_on="id", how="left")
+    potion_long = potion_long.merge(rates_df, on="cauldron_id", how="left")
+
+    level_index = TimeIndex(potion_long, "timestamp")
+    ticket_index = TimeIndex(ticket_df, "date")  # Assuming ticket_df already has cauldron_id
+    return level_index, ticket_index, cauldrons_df
 
-ticket_long = ticket_df.copy()  # Assuming ticket_df already has cauldron_id
+
+version = data_version(potion_path, ticket_path, cauldrons_path, rates_path)
+with timed("load"):
+    level_index, ticket_index, cauldrons_df = load_playback(version)
 
 # -------------------------------
 # 5️. Date selection
 # -------------------------------
-min_date = min(potion_long["timestamp"].min(), ticket_long["date"].min())
-max_date = max(potion_long["timestamp"].max(), ticket_long["date"].max())
+min_date = min(level_index.min_time, ticket_index.min_time)
+max_date = max(level_index.max_time, ticket_index.max_time)
 selected_date = st.date_input("Select Date", min_value=min_date, max_value=max_date, value=min_date)
 
 # -------------------------------
 # 6️. Cauldron selection
 # -------------------------------
-cauldrons = potion_long["cauldron_id"].unique()
+cauldrons = level_index.keys
 selected_cauldrons = st.multiselect("Select Cauldrons", options=cauldrons, default=cauldrons)
 
 # -------------------------------
-# 7️. Filter data
+# 7️. Filter data (binary-search slices of the sorted indexes)
 # -------------------------------
-filtered_potion = potion_long[(potion_long["cauldron_id"].isin(selected_cauldrons)) &
-                              (potion_long["timestamp"].dt.date <= selected_date)]
-filtered_ticket = ticket_long[(ticket_long["cauldron_id"].isin(selected_cauldrons)) &
-                              (ticket_long["date"].dt.date <= selected_date)]
+filtered_ticket = ticket_index.through_date(selected_cauldrons, selected_date)
 
 # -------------------------------
 # 8️. Define cauldron colors & names
@@ -88,42 +100,50 @@ cauldron_names = dict(zip(cauldrons_df["id"], cauldrons_df["name"]))
 # 9️. Visualize Potion Levels
 # -------------------------------
 st.subheader("Potion Levels Over Time")
-plt.figure(figsize=(10, 5))
-for cauldron in selected_cauldrons:
-    df = filtered_potion[filtered_potion["cauldron_id"] == cauldron]
-    plt.plot(df["timestamp"], df["level"], 
-             label=cauldron_names[cauldron], 
-             color=cauldron_colors[cauldron])
-plt.xlabel("Time")
-plt.ylabel("Potion Level")
-plt.legend()
-st.pyplot(plt)
+selection = tuple(selected_cauldrons)
+
+
+def draw_levels():
+    fig, ax = plt.subplots(figsize=(10, 5))
+    for cauldron in selected_cauldrons:
+        df = level_index.through_date([cauldron], selected_date)
+        ax.plot(df["timestamp"], df["level"],
+                label=cauldron_names[cauldron],
+                color=cauldron_colors[cauldron])
+    ax.set_xlabel("Time")
+    ax.set_ylabel("Potion Level")
+    ax.legend()
+    return fig
+
+
+with timed("levels"):
+    show_chart(("levels", selection, selected_date, version), draw_levels)
 
 # -------------------------------
 # 10. Visualize Tickets Collected
 # -------------------------------
 st.subheader("Tickets Collected Over Time")
 
-# 1️⃣ Make ticket dates naive (remove timezone)
-ticket_long["date"] = ticket_long["date"].dt.tz_localize(None)
-
-# 2️⃣ Filter ticket data for selected cauldrons & date
-filtered_ticket = ticket_long[
-    (ticket_long["cauldron_id"].isin(selected_cauldrons)) &
-    (ticket_long["date"].dt.date <= selected_date)
-]
-
-# 3️⃣ Aggregate by date and cauldron
-ticket_sum = filtered_ticket.groupby(["date", "cauldron_id"])["amount_collected"].sum().reset_index()
-
-# 4️⃣ Plot
-plt.figure(figsize=(10, 5))
-for cauldron in selected_cauldrons:
-    df = ticket_sum[ticket_sum["cauldron_id"] == cauldron]
-    plt.plot(df["date"], df["amount_collected"], 
-             label=cauldron_names[cauldron], 
-             color=cauldron_colors[cauldron])
-plt.xlabel("Date")
-plt.ylabel("Amount Collected")
-plt.legend()
-st.pyplot(plt)
+
+def draw_tickets():
+    # 1️⃣ Make ticket dates naive (remove timezone) on the filtered copy
+    filtered_ticket["date"] = filtered_ticket["date"].dt.tz_localize(None)
+
+    # 2️⃣ Aggregate by date and cauldron
+    ticket_sum = filtered_ticket.groupby(["date", "cauldron_id"])["amount_collected"].sum().reset_index()
+
+    # 3️⃣ Plot
+    fig, ax = plt.subplots(figsize=(10, 5))
+    for cauldron in selected_cauldrons:
+        df = ticket_sum[ticket_sum["cauldron_id"] == cauldron]
+        ax.plot(df["date"], df["amount_collected"],
+                label=cauldron_names[cauldron],
+                color=cauldron_colors[cauldron])
+    ax.set_xlabel("Date")
+    ax.set_ylabel("Amount Collected")
+    ax.legend()
+    return fig
+
+
+with timed("tickets"):
+    show_chart(("tickets", selection, selected_date, version), draw_tickets)
@@ -0,0 +1,154 @@
+# background_jobs.py
+# Shared worker pool for the heavy dashboard computations.
+#
+# A computation is submitted into a named slot (e.g. 'ticket_matches') under a
+# key built from its inputs. Asking for a new key in the same slot cancels the
+# job that is still running there, so dragging a slider leaves at most one live
+# job per slot. Finished results are kept per slot (a few keys, LRU), and while
+# a new key is computing the slot's last result is served, stale, next to a
+# progress bar that polls the job and reruns the app once it lands. A job that
+# failed is handed out once more, with its error, and the next fetch of its key
+# submits it again, so a transient failure is retried on the following rerun.
+#
+# Work functions receive a ``progress(done, total=None, message=None)``
+# callback; calling it is also the cancellation point (it raises JobCancelled
+# once the job has been superseded).
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+MAX_WORKERS = 2
+KEEP_RESULTS = 8  # finished results kept per slot
+POLL_SECONDS = 0.5
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, slot, key):
+        self.slot = slot
+        self.key = key
+        self.progress = 0.0
+        self.message = ''
+        self.error = None
+        self.reported = False  # the error has been handed out by fetch
+        self.started = time.monotonic()
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    def report(self, done, total=None, message=None):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.progress = min(1.0, done / total if total else float(done))
+        if message:
+            self.message = message
+
+    def cancel(self):
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+
+class JobManager:
+    def __init__(self, max_workers=MAX_WORKERS, keep=KEEP_RESULTS):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='dashboard-job')
+        self.keep = keep
+        self._lock = threading.Lock()
+        self.current = {}  # slot -> newest Job
+        self.results = {}  # slot -> OrderedDict(key -> result)
+        self.latest = {}  # slot -> key of the newest finished result
+
+    def fetch(self, slot, key, fn, *args, **kwargs):
+        """(result, job) for ``key`` in ``slot``.
+
+        ``job`` is None when the result is fresh. Otherwise the job computing
+        ``key`` is returned and ``result`` is the slot's last finished result
+        (None if there is none yet). A failed job is returned once; the next
+        call for its key resubmits.
+        """
+        with self._lock:
+            done = self.results.setdefault(slot, OrderedDict())
+            if key in done:
+                done.move_to_end(key)
+                return done[key], None
+            job = self.current.get(slot)
+            if job is not None and job.key == key and job.error is not None:
+                if job.reported:
+                    job = None  # its error was surfaced already: try again
+                else:
+                    job.reported = True
+            if job is None or job.key != key:
+                if job is not None and not job.done:
+                    job.cancel()
+                job = Job(slot, key)
+                self.current[slot] = job
+                job.future = self.pool.submit(self._run, job, fn, args, kwargs)
+            stale = done.get(self.latest.get(slot))
+            return stale, job
+
+    def finished(self, slot, key):
+        """The finished result for ``key`` in ``slot``, or None; never submits a job."""
+        with self._lock:
+            done = self.results.get(slot)
+            if done is None or key not in done:
+                return None
+            done.move_to_end(key)
+            return done[key]
+
+    def _run(self, job, fn, args, kwargs):
+        try:
+            result = fn(*args, progress=job.report, **kwargs)
+        except JobCancelled:
+            return
+        except Exception as e:  # surfaced in the UI by the caller
+            job.error = e
+        else:
+            with self._lock:
+                done = self.results.setdefault(job.slot, OrderedDict())
+                done[job.key] = result
+                while len(done) > self.keep:
+                    done.popitem(last=False)
+                self.latest[job.slot] = job.key
+            job.progress = 1.0
+        finally:
+            job.finished = time.monotonic()
+
+
+@st.cache_resource
+def get_job_manager():
+    # one pool per server process, shared by every session
+    return JobManager()
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def job_status(slot):
+    """Progress bar for the job running in ``slot``; reruns the app when it finishes."""
+    job = get_job_manager().current.get(slot)
+    if job is None or job.done:
+        st.rerun()
+    elapsed = time.monotonic() - job.started
+    st.progress(job.progress, text=f'{job.message or "Working"}... ({elapsed:.0f}s)')
+
+
+def show_job(slot, job, stale, label):
+    """Render the state of a pending ``job``: an error, or progress (with a note when ``stale`` is shown)."""
+    if job.error is not None:
+        st.error(f'{label} failed: {job.error}')
+        return
+    job_status(slot)
+    if stale is not None:
+        st.caption(f'Showing {label.lower()} for the previous settings until the new ones are ready.')
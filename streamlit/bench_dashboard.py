@@ -0,0 +1,256 @@
+# bench_dashboard.py
+# Interaction latency harness for app.py and maptest.py.
+#
+# Builds synthetic datasets of increasing size (minute levels for 12 cauldrons,
+# daily drains and tickets, plus the detect/rates outputs), points the apps at
+# them with POTION_DATA_DIR and drives scripted interactions through
+# streamlit.testing's AppTest: cold load, warm rerun, date change, cauldron
+# toggles, the map time slider, the diagnostics window/outlier inputs and the
+# expandable sections. For every interaction it records the rerun latency, the
+# per-section timings the apps leave in st.session_state (section_timer.py)
+# and how long background jobs took to land.
+#
+# The report (JSON + markdown) can be compared with a previous one; an
+# interaction that got slower than the baseline by more than --tolerance (and
+# --min-ms) is flagged and the exit status is 1. --budget-ms sets maptest.py's
+# latency budget (latency_budget.py), so runs with the mode on and off compare.
+#
+# Run:  python streamlit/bench_dashboard.py --days 7,30,90 [--repeat 3] [--baseline old_report.json]
+import argparse
+import datetime as dt
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+APP_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = APP_DIR.parent / 'backend'
+DEFAULT_WORK_DIR = APP_DIR / 'data' / 'bench'
+CAULDRONS = [f'cauldron_{i:03d}' for i in range(1, 13)]  # app.py has colors for these twelve
+JOB_TIMEOUT = 300
+
+
+def make_dataset(out_dir, days, seed=0):
+    """Synthetic cauldron_data/tickets/cauldrons CSVs for ``days`` days, plus drain events and rates."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if (out_dir / 'cauldron_rates.csv').exists():
+        return out_dir
+    rng = np.random.default_rng(seed)
+    minutes = days * 24 * 60
+    index = pd.date_range('2025-01-01', periods=minutes, freq='min', tz='UTC')
+    levels = {}
+    tickets = []
+    for i, cid in enumerate(CAULDRONS):
+        capacity = 600 + 50 * i
+        step = rng.uniform(0.08, 0.2) + rng.normal(0, 0.02, minutes)
+        for day in range(days):
+            # one courier visit a day: drain most of the cauldron over an hour or two
+            start = day * 1440 + int(rng.integers(300, 1200))
+            length = int(rng.integers(60, 180))
+            volume = rng.uniform(0.5, 0.8) * capacity
+            step[start:start + length] -= volume / length
+            amount = volume * rng.uniform(0.97, 1.03) if rng.random() > 0.05 else volume * 0.6
+            tickets.append((cid, index[day * 1440].strftime('%Y-%m-%d %H:%M:%S+00:00'), round(amount, 2)))
+        levels[cid] = np.clip(capacity * 0.3 + np.cumsum(step), 0, capacity).round(2)
+    frame = pd.DataFrame(levels, index=index.rename('timestamp'))
+    frame.to_csv(out_dir / 'cauldron_data.csv', date_format='%Y-%m-%d %H:%M:%S+00:00')
+    pd.DataFrame(tickets, columns=['cauldron_id', 'date', 'amount_collected']).to_csv(out_dir / 'tickets.csv', index=False)
+    pd.DataFrame({
+        'max_volume': [600 + 50 * i for i in range(len(CAULDRONS))],
+        'id': CAULDRONS,
+        'name': [f'Bench Cauldron {i + 1}' for i in range(len(CAULDRONS))],
+        'latitude': [33.2148 + 0.0007 * i for i in range(len(CAULDRONS))],
+        'longitude': [-97.1331 + 0.0006 * i for i in range(len(CAULDRONS))],
+    }).to_csv(out_dir / 'cauldrons.csv', index=False)
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    from compute_rates import compute_rates
+    from detect_drain_events import detect_drain_events
+    levels_df = pd.read_csv(out_dir / 'cauldron_data.csv', index_col='timestamp', parse_dates=True)
+    detect_drain_events(levels_df).to_csv(out_dir / 'drain_events.csv', index=False)
+    compute_rates(levels_df).to_csv(out_dir / 'cauldron_rates.csv', index=False)
+    return out_dir
+
+
+def _by_label(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+
+def _first_day(at):
+    return at.date_input[0].value
+
+
+# (name, action) pairs; an action mutates widgets before the measured rerun
+APP_STEPS = [
+    ('cold load', None),
+    ('warm rerun', None),
+    ('change date', lambda at: at.date_input[0].set_value(_first_day(at) + dt.timedelta(days=1))),
+    ('toggle cauldron off', lambda at: at.multiselect[0].unselect(at.multiselect[0].value[0])),
+    ('toggle cauldron on', lambda at: at.multiselect[0].set_value(CAULDRONS)),
+]
+
+MAPTEST_STEPS = APP_STEPS + [
+    ('move map time slider', lambda at: _by_label(at.slider, 'Map time (UTC)').set_value(
+        _by_label(at.slider, 'Map time (UTC)').value - dt.timedelta(hours=12))),
+    ('open ticket diagnostics', lambda at: _by_label(at.toggle, 'Ticket matching (diagnostics)').set_value(True)),
+    ('change match window', lambda at: _by_label(at.number_input, 'Time window (hours) around ticket to match drains').set_value(48)),
+    ('move outlier slider', lambda at: _by_label(at.slider, 'Outlier fraction from median').set_value(0.5)),
+    ('open advanced charts', lambda at: _by_label(at.toggle, 'Show advanced charts').set_value(True)),
+    ('select historic cauldron', lambda at: _by_label(at.selectbox, 'Select cauldron column (historic)').set_value(CAULDRONS[-1])),
+]
+
+SCENARIOS = {'app.py': APP_STEPS, 'maptest.py': MAPTEST_STEPS}
+
+
+def wait_for_jobs(timeout=JOB_TIMEOUT):
+    """Seconds until every background job (background_jobs.py) has finished.
+
+    AppTest does not tick fragments, so the refinements latency_budget.py
+    starts from a tick are started here.
+    """
+    from background_jobs import get_job_manager
+    from latency_budget import start_waiting
+    manager = get_job_manager()
+    t0 = time.perf_counter()
+    start_waiting()
+    while any(not job.done for job in list(manager.current.values())):
+        if time.perf_counter() - t0 > timeout:
+            break
+        time.sleep(0.05)
+    return time.perf_counter() - t0
+
+
+def run_scenario(script, steps):
+    """One pass over ``steps`` from cold caches; returns a row per step."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    at = AppTest.from_file(str(APP_DIR / script), default_timeout=JOB_TIMEOUT)
+    rows = []
+    for name, action in steps:
+        if action is not None:
+            action(at)
+        at.session_state['section_timings'] = {}
+        t0 = time.perf_counter()
+        at.run()
+        latency = time.perf_counter() - t0
+        jobs = wait_for_jobs()
+        errors = [str(e.value) for e in at.exception]
+        sections = dict(at.session_state['section_timings']) if 'section_timings' in at.session_state else {}
+        rows.append({
+            'step': name,
+            'latency_ms': latency * 1000,
+            'jobs_ms': jobs * 1000,
+            'sections_ms': {k: v * 1000 for k, v in sections.items()},
+            'errors': errors,
+        })
+    return rows
+
+
+def median_rows(passes):
+    """Per-step medians over repeated passes of the same scenario."""
+    out = []
+    for rows in zip(*passes):
+        sections = {}
+        for r in rows:
+            for k, v in r['sections_ms'].items():
+                sections.setdefault(k, []).append(v)
+        out.append({
+            'step': rows[0]['step'],
+            'latency_ms': statistics.median(r['latency_ms'] for r in rows),
+            'jobs_ms': statistics.median(r['jobs_ms'] for r in rows),
+            'sections_ms': {k: statistics.median(v) for k, v in sections.items()},
+            'errors': sorted({e for r in rows for e in r['errors']}),
+        })
+    return out
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """Mark each result with its baseline latency and whether it regressed."""
+    base = {(r['app'], r['days'], r['step']): r for r in baseline.get('results', [])}
+    regressions = []
+    for r in results:
+        b = base.get((r['app'], r['days'], r['step']))
+        if b is None:
+            continue
+        r['baseline_ms'] = b['latency_ms']
+        r['regressed'] = r['latency_ms'] > b['latency_ms'] * (1 + tolerance) and r['latency_ms'] - b['latency_ms'] > min_ms
+        if r['regressed']:
+            regressions.append(r)
+    return regressions
+
+
+def markdown(report):
+    lines = [f"# Dashboard latency ({report['created']})", '',
+             '| app | days | interaction | rerun ms | baseline ms | jobs ms | slowest sections (ms) |',
+             '|---|---:|---|---:|---:|---:|---|']
+    for r in report['results']:
+        slowest = sorted(r['sections_ms'].items(), key=lambda kv: -kv[1])[:3]
+        base = f"{r['baseline_ms']:.0f}" if 'baseline_ms' in r else ''
+        flag = ' **slower**' if r.get('regressed') else ''
+        errors = f" ({len(r['errors'])} errors)" if r['errors'] else ''
+        lines.append(f"| {r['app']} | {r['days']} | {r['step']}{errors} | {r['latency_ms']:.0f}{flag} | {base} | "
+                     f"{r['jobs_ms']:.0f} | {', '.join(f'{k} {v:.0f}' for k, v in slowest)} |")
+    return '\n'.join(lines) + '\n'
+
+
+def _ints(text):
+    return [int(x) for x in text.split(',') if x]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rerun latency of the dashboards on synthetic data')
+    parser.add_argument('--days', type=_ints, default=[7, 30, 90], help='dataset sizes, in days of minute data')
+    parser.add_argument('--apps', default=','.join(SCENARIOS), help='comma separated: app.py,maptest.py')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--work-dir', default=str(DEFAULT_WORK_DIR), help='where the synthetic datasets are kept')
+    parser.add_argument('--out', help='report path without extension (.json and .md; default <work-dir>/report)')
+    parser.add_argument('--baseline', help='previous JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown vs the baseline (fraction)')
+    parser.add_argument('--min-ms', type=float, default=50, help='ignore slowdowns smaller than this')
+    parser.add_argument('--budget-ms', type=int, help="maptest.py's latency budget (latency_budget.py; 0 = off)")
+    args = parser.parse_args()
+
+    work_dir = Path(args.work_dir)
+    out = args.out or str(work_dir / 'report')
+    # the apps must read the synthetic CSVs only: no results store, no query service
+    os.environ['POTION_RESULTS_DB'] = str(work_dir / 'unused.db')
+    os.environ.pop('POTION_QUERY_URL', None)
+    if args.budget_ms is not None:
+        os.environ['POTION_LATENCY_BUDGET_MS'] = str(args.budget_ms)
+    sys.path.insert(0, str(APP_DIR))
+
+    results = []
+    for days in args.days:
+        t0 = time.perf_counter()
+        data_dir = make_dataset(work_dir / f'{days}d', days)
+        os.environ['POTION_DATA_DIR'] = str(data_dir)
+        print(f'{days} days: dataset ready in {time.perf_counter() - t0:.1f}s')
+        for app in args.apps.split(','):
+            passes = [run_scenario(app, SCENARIOS[app]) for _ in range(args.repeat)]
+            for row in median_rows(passes):
+                results.append({'app': app, 'days': days, **row})
+                print(f"  {app:<11} {row['step']:<26} {row['latency_ms']:8.0f} ms")
+
+    report = {'created': dt.datetime.now(dt.timezone.utc).isoformat(timespec='seconds'), 'repeat': args.repeat,
+              'budget_ms': args.budget_ms, 'results': results}
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.min_ms)
+    with open(f'{out}.json', 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    with open(f'{out}.md', 'w', encoding='utf-8') as f:
+        f.write(markdown(report))
+    print(f'report written to {out}.json / {out}.md')
+    for r in regressions:
+        print(f"slower: {r['app']} {r['days']}d {r['step']}: {r['baseline_ms']:.0f} -> {r['latency_ms']:.0f} ms")
+    if regressions or any(r['errors'] for r in results):
+        raise SystemExit(1)
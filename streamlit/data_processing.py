@@ -1,27 +1,14 @@
-import pandas as pd
-
-# 1. Load minute-level cauldron data
-df = pd.read_csv("cauldron_levels.csv", index_col='timestamp', parse_dates=True)
-
-# 2. Prepare a dictionary to store rates
-rates = {}
-
-# 3. Loop through all cauldrons
-for cauldron in df.columns:
-    df['diff'] = df[cauldron].diff()
-    fill_rate = df[df['diff'] > 0]['diff'].mean()
-    drain_rate = abs(df[df['diff'] < 0]['diff'].mean())
-    rates[cauldron] = {
-        'fill_rate': fill_rate,
-        'drain_rate': drain_rate
-    }
-
-# 4. Convert to DataFrame
-rates_df = pd.DataFrame(rates).T
-rates_df.index.name = 'cauldron_id'
-
-# 5. Save to a separate CSV
-rates_df.to_csv("cauldron_rates_summary.csv")
-
-print("Fill/Drain rates calculated and saved!")
-print(rates_df)
+# data_processing.py
+# Kept for old invocations: runs backend/compute_rates.py, which writes the
+# fill/drain rates (cauldron_rates.csv) into streamlit/data. Same arguments as
+# the backend script; in-process callers import it (or backend/stages.py)
+# instead.
+import os
+import runpy
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+if __name__ == '__main__':
+    sys.path.insert(0, BACKEND_DIR)
+    runpy.run_path(os.path.join(BACKEND_DIR, 'compute_rates.py'), run_name='__main__')
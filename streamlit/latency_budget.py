@@ -0,0 +1,303 @@
+# latency_budget.py
+# Adaptive-fidelity mode: keep each dashboard rerun inside a latency budget.
+#
+# Every heavy section declares a cost model, projected seconds = fixed +
+# per_unit * units, where units is whatever its cost grows with (points to
+# plot, tickets to match, heatmap cells, bytes of level history to parse).
+# Models start from the declared priors and are refit from the section's
+# measured runs, once per server process, since they describe the machine
+# rather than a session.
+#
+# A section gets a share of the per-rerun budget (sidebar; the default comes
+# from POTION_LATENCY_BUDGET_MS). If the full view is projected to fit, it is
+# rendered as before. If not, the section shows a coarser view sized to fit
+# (a level of the min/max pyramid for line charts, a ticket sample for the
+# diagnostics, the most recent days of the heatmap, the latest levels for the
+# map) under an "approximate" badge, and the full view is computed on the
+# shared job pool (background_jobs.py). Work that is projected to fit but runs
+# as a job anyway is waited on for the rest of the share first.
+#
+# Background work that was not projected to fit starts from the first tick of
+# a polling fragment, i.e. once the rerun that asked for it is over: next to
+# the script it would only slow the script down, and matplotlib draws one
+# figure at a time, so a full chart rendering would stall the script's own
+# charts. Full charts land in the render cache under their usual key, so the
+# rerun that follows the job shows them at lookup cost.
+#
+# With the mode switched off every section renders at full fidelity.
+import functools
+import os
+import threading
+import time
+from concurrent.futures import wait
+
+import numpy as np
+import streamlit as st
+
+from background_jobs import POLL_SECONDS, get_job_manager, show_job
+from render_cache import get_render_cache
+
+DEFAULT_BUDGET_MS = int(os.environ.get('POTION_LATENCY_BUDGET_MS', 1500))  # 0 starts with the mode off
+STATE_KEY = 'latency_budget_ms'
+RUN_KEY = 'latency_budget_run'  # full script runs so far in this session
+REFINE_KEY = 'latency_budget_refine'  # slot -> ((key, run), started) of the last refinement asked for in this session
+PYRAMID_BASE = 4  # level k of the pyramid buckets PYRAMID_BASE ** k rows
+PYRAMID_LEVELS = 8
+REFIT_DECAY = 0.8  # weight left to the older runs each time a cost model is refit
+REFIT_WEIGHT = 0.3  # step towards the newest run while all runs have had the same size
+
+
+class CostModel:
+    """Projected seconds for ``units`` of work: fixed + per_unit * units.
+
+    Both terms are refit by least squares over the measured runs, older runs
+    weighing less and less (REFIT_DECAY). Until runs of two different sizes
+    have been seen, both are scaled together.
+    """
+
+    def __init__(self, fixed, per_unit):
+        self.fixed = fixed
+        self.per_unit = per_unit
+        self._sums = np.zeros(5)  # weight, sum x, sum y, sum xx, sum xy
+        self._lock = threading.Lock()
+
+    def project(self, units):
+        return self.fixed + self.per_unit * units
+
+    def affordable(self, seconds):
+        """Units that fit in ``seconds``."""
+        return max(0, int((seconds - self.fixed) / self.per_unit))
+
+    def observe(self, units, seconds):
+        """Refit from a measured run."""
+        with self._lock:
+            self._sums = self._sums * REFIT_DECAY + [1.0, units, seconds, units * units, units * seconds]
+            w, sx, sy, sxx, sxy = self._sums
+            spread = w * sxx - sx * sx
+            if spread > 1e-6 * w * sxx and sxy * w > sx * sy:
+                self.per_unit = (w * sxy - sx * sy) / spread
+                self.fixed = max(0.0, (sy - self.per_unit * sx) / w)
+            else:
+                # one size so far: scale the prior towards the measurement, keeping its shape
+                step = 1 + REFIT_WEIGHT * (seconds / max(self.project(units), 1e-9) - 1)
+                self.fixed *= step
+                self.per_unit *= step
+
+
+@st.cache_resource
+def get_cost_models():
+    # section name -> CostModel, one set per server process
+    return {}
+
+
+def budget_controls():
+    """Sidebar switch and size of the budget; call once per script run."""
+    with st.sidebar:
+        on = st.toggle('Latency budget', value=DEFAULT_BUDGET_MS > 0,
+                       help='Show approximate views when the full ones would make a rerun slower than the budget, '
+                            'and refine them in the background.')
+        ms = st.number_input('Budget per rerun (ms)', min_value=100, max_value=60_000,
+                             value=DEFAULT_BUDGET_MS or 1500, step=100, disabled=not on)
+    st.session_state[STATE_KEY] = int(ms) if on else 0
+    st.session_state[RUN_KEY] = st.session_state.get(RUN_KEY, 0) + 1
+
+
+def approximate(detail):
+    """The "approximate" badge with what was left out."""
+    st.badge('Approximate', icon=':material/speed:', color='orange')
+    st.caption(f'{detail} The full view is being computed in the background.')
+
+
+def envelope_index(values, factor):
+    """Row positions of the min and max of every ``factor``-row bucket of ``values``, in order.
+
+    This is one level of the min/max pyramid: about 2 / factor of the rows, and
+    unlike striding it keeps the bottom of every drain and the top of every
+    peak. Missing readings are ignored; an all-missing bucket keeps its first row.
+    """
+    values = np.asarray(values, dtype='float64')
+    n = len(values)
+    if factor <= 1 or n <= 2 * factor:
+        return np.arange(n)
+    buckets = -(-n // factor)
+    padded = np.full(buckets * factor, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, factor)
+    missing = np.isnan(padded)
+    base = np.arange(buckets) * factor
+    lo = base + np.where(missing, np.inf, padded).argmin(axis=1)
+    hi = base + np.where(missing, -np.inf, padded).argmax(axis=1)
+    return np.unique(np.minimum(np.concatenate([lo, hi]), n - 1))
+
+
+class Section:
+    """A section's cost model and its share of the budget for the current run."""
+
+    def __init__(self, name, share, fixed, per_unit):
+        self.name = name
+        self.model = get_cost_models().setdefault(name, CostModel(fixed, per_unit))
+        self.seconds = st.session_state.get(STATE_KEY, DEFAULT_BUDGET_MS) / 1000 * share
+        self.started = time.perf_counter()
+        self._progress = None  # renders the progress of the computation a fallback stands in for
+
+    @property
+    def enabled(self):
+        return self.seconds > 0
+
+    def remaining(self):
+        return self.seconds - (time.perf_counter() - self.started)
+
+    def fits(self, units):
+        return not self.enabled or self.model.project(units) <= self.remaining()
+
+    def affordable(self, minimum=1):
+        """Units that fit in what is left of the share (at least ``minimum``)."""
+        return max(minimum, self.model.affordable(self.remaining()))
+
+    def pyramid_level(self, points):
+        """Finest pyramid level (>= 1) whose envelope of ``points`` rows fits the rest of the share."""
+        for level in range(1, PYRAMID_LEVELS):
+            if self.fits(2 * points / PYRAMID_BASE ** level):
+                return level
+        return PYRAMID_LEVELS
+
+    def measured(self, units, fn):
+        """``fn`` wrapped so every call refits the cost model (also when it runs as a job)."""
+        model = self.model
+
+        def run(*args, **kwargs):
+            t0 = time.perf_counter()
+            out = fn(*args, **kwargs)
+            model.observe(units, time.perf_counter() - t0)
+            return out
+
+        return run
+
+    def fetch(self, slot, key, units, fn, *args, label, **kwargs):
+        """(result, pending) of ``fn(*args, **kwargs)`` for ``key``, computed on the job pool.
+
+        With the mode off this is get_job_manager().fetch followed by show_job:
+        a pending result comes back as the slot's last one. With the mode on, a
+        computation projected to fit is waited on for the rest of the share and
+        one that is not starts after this run (refine); a pending result is
+        None, and the caller shows a fallback under Section.approximate.
+        """
+        manager = get_job_manager()
+        work = functools.partial(self.measured(units, fn), *args, **kwargs)
+        if self.enabled:
+            result = manager.finished(slot, key)
+            if result is not None:
+                return result, False
+            if not self.fits(units):
+                self._progress = lambda: refine(slot, key, work, label)
+                return None, True
+        result, job = manager.fetch(slot, key, work)
+        if job is not None and job.error is None and self.enabled:
+            wait([job.future], timeout=max(self.remaining(), 0.0))
+            result, job = manager.fetch(slot, key, work)
+        if job is None:
+            return result, False
+        if not self.enabled:
+            show_job(slot, job, result, label)
+            return result, True
+        self._progress = lambda: show_job(slot, job, None, label)
+        return None, True
+
+    def progress(self):
+        """The progress of the pending computation (from fetch or chart)."""
+        if self._progress is not None:
+            self._progress()
+            self._progress = None
+
+    def approximate(self, detail):
+        """The badge for a fallback view, then the progress of the full computation it stands in for."""
+        approximate(detail)
+        self.progress()
+
+    def recent(self, days, units_per_day, minimum=7):
+        """How many of the most recent ``days`` fit the rest of the share at ``units_per_day`` each."""
+        return min(days, max(minimum, self.affordable() // max(units_per_day, 1)))
+
+    def pyramid(self, points, draw):
+        """``coarse`` for Section.chart of a line chart: ``draw(factor)`` at the finest pyramid level that fits."""
+        def coarse():
+            level = self.pyramid_level(points)
+            factor = PYRAMID_BASE ** level
+            return (('pyramid', level), 2 * points / factor, lambda: draw(factor),
+                    f'pyramid level {level}, the low and high of every {factor} readings.')
+
+        return coarse
+
+    def chart(self, key, units, draw, coarse, label):
+        """Show the chart for ``key``, or a coarser one under the badge while the full one renders.
+
+        ``draw()`` returns the full Figure and ``coarse()`` a (tag, units, draw,
+        detail) tuple for a view that fits the rest of the share. ``draw`` runs on a
+        worker thread, so it must build the Figure directly
+        (matplotlib.figure.Figure) rather than through pyplot.
+        """
+        cache = get_render_cache()
+        slot = f'{self.name}:{key[0]}'
+        png = cache.get(key)
+        if png is None:
+            png = get_job_manager().finished(slot, key)  # rendered earlier, since evicted from the render cache
+        if png is None and self.fits(units):
+            png = cache.get_or_render(key, self.measured(units, draw))
+        if png is not None:
+            st.image(png)
+            return
+        tag, coarse_units, draw_coarse, detail = coarse()
+        st.image(cache.get_or_render(key + (tag,), self.measured(coarse_units, draw_coarse)))
+        work = self.measured(units, lambda progress=None: cache.get_or_render(key, draw))
+        self._progress = lambda: refine(slot, key, work, label)
+        self.approximate(f'{label}: {detail}')
+
+
+_waiting = {}  # slot -> (key, fn) of refinements asked for and not started yet
+_waiting_lock = threading.Lock()
+
+
+def start_waiting():
+    """Submit every refinement still waiting for its first tick (for callers without ticks, like AppTest)."""
+    with _waiting_lock:
+        waiting = list(_waiting.items())
+        _waiting.clear()
+    for slot, (key, fn) in waiting:
+        get_job_manager().fetch(slot, key, fn)
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def refine(slot, key, fn, label):
+    """Compute ``key`` on the job pool, starting from the first tick after the run that asked for it.
+
+    A computation next to the script would slow the script down (and
+    matplotlib draws one figure at a time, so a full chart rendering would
+    stall the script's own charts); the ticks of a fragment only run once the
+    script run is over.
+    """
+    manager = get_job_manager()
+    job = manager.current.get(slot)
+    running = job is not None and job.key == key and not job.done
+    asked = (key, st.session_state.get(RUN_KEY))
+    requested = st.session_state.setdefault(REFINE_KEY, {})
+    if not running and requested.get(slot, (None,))[0] != asked:
+        requested[slot] = (asked, False)
+        with _waiting_lock:
+            _waiting[slot] = (key, fn)
+        st.progress(0.0, text=f'{label}: starting after this rerun...')
+        return
+    with _waiting_lock:
+        if _waiting.get(slot, (None,))[0] == key:
+            del _waiting[slot]
+    if requested.get(slot) == (asked, True) and job is not None and job.key == key and job.error is not None:
+        # failed since this run asked for it; the next run tries again rather than every tick
+        st.error(f'{label} failed: {job.error}')
+        return
+    requested[slot] = (asked, True)
+    _, job = manager.fetch(slot, key, fn)
+    if job is not None and job.error is not None:
+        st.error(f'{label} failed: {job.error}')
+        return
+    if job is None or job.done:
+        st.rerun()
+    st.progress(job.progress, text=f'{label}: {job.message or "refining"}... ({time.monotonic() - job.started:.0f}s)')
@@ -1,4 +1,6 @@
+import datetime as dt
 import os
+import sys
 from pathlib import Path
 
 import pandas as pd
@@ -6,14 +8,22 @@ import streamlit as st
 import pydeck as pdk
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.figure import Figure
+
+import latency_budget
+import query_client
+from render_cache import show_chart
+from section_timer import timed
+from time_index import SnapshotIndex, TimeIndex, data_version
 
 
 st.set_page_config(page_title="Cauldron Map (local)", layout="wide")
 BASE = Path(__file__).resolve().parents[1]  # repo root (project folder ThePotionPolice)
 BACKEND_DIR = BASE / 'backend'
 
-# Use the project's streamlit/data directory for CSVs (required for local preview)
-DATA_DIR = BASE / 'streamlit' / 'data'
+# Use the project's streamlit/data directory for CSVs (required for local preview);
+# POTION_DATA_DIR points the dashboard at another dataset (e.g. the latency harness)
+DATA_DIR = Path(os.environ.get('POTION_DATA_DIR', BASE / 'streamlit' / 'data'))
 # Try to show a project logo at the top of the page (look in several common locations)
 logo_candidates = [
     DATA_DIR / 'logo.png',
@@ -59,12 +69,23 @@ if logo_path:
 BASE = Path(__file__).resolve().parents[1]  # repo root (project folder ThePotionPolice)
 BACKEND_DIR = BASE / 'backend'
 
-# Use the project's streamlit/data directory for CSVs (required for local preview)
-DATA_DIR = BASE / 'streamlit' / 'data'
+# Use the project's streamlit/data directory for CSVs (required for local preview);
+# POTION_DATA_DIR points the dashboard at another dataset (e.g. the latency harness)
+DATA_DIR = Path(os.environ.get('POTION_DATA_DIR', BASE / 'streamlit' / 'data'))
+# backend modules (out-of-core helpers etc.) are imported straight from the repo
+sys.path.insert(0, str(BACKEND_DIR))
+
+import level_codec
+import range_index
+import results_store
+
+RESULTS_DB = Path(results_store.DEFAULT_DB)
 
 CAULDRONS_CSV = DATA_DIR / 'cauldrons.csv'
 DATA_CSV = DATA_DIR / 'cauldron_data.csv'
 RATES_CSV = DATA_DIR / 'cauldron_rates.csv'
+# fixed-point archive of cauldron_data.csv (backend/level_codec.py), used when up to date
+LEVELS_ARCHIVE = DATA_DIR / 'cauldron_data.lvc'
 
 
 def load_cauldrons(path):
@@ -100,6 +121,10 @@ def load_rates(path):
 
 def load_levels(path):
     # returns latest level per cauldron (as percent if max volume known)
+    if query_client.enabled():
+        latest = query_client.latest_levels()
+        if latest is not None:
+            return latest
     if not path.exists():
         return {}
     df = pd.read_csv(path)
@@ -133,10 +158,12 @@ def load_levels(path):
 
 
 st.title('Cauldron Map (local CSV data)')
+latency_budget.budget_controls()
 
-cauldrons_df = load_cauldrons(CAULDRONS_CSV)
-rates_df = load_rates(RATES_CSV)
-levels_latest = load_levels(DATA_CSV)
+with timed('setup'):
+    cauldrons_df = load_cauldrons(CAULDRONS_CSV)
+    rates_df = load_rates(RATES_CSV)
+    levels_latest = load_levels(DATA_CSV)
 
 if cauldrons_df.empty:
     st.warning(f'No cauldrons found at {CAULDRONS_CSV}. Make sure the CSV exists and has latitude/longitude columns.')
@@ -147,11 +174,11 @@ if not rates_df.empty and 'id' in rates_df.columns:
     cauldrons_df = cauldrons_df.merge(rates_df.set_index('id'), how='left', left_on='id', right_index=True).reset_index(drop=True)
 
 # Add latest level (raw value) if available; convert to percent if max_volume exists
-def compute_display_level(row):
+def compute_display_level(row, levels=None):
     cid = row.get('id')
     if cid is None:
         return None
-    raw = levels_latest.get(cid)
+    raw = (levels_latest if levels is None else levels).get(cid)
     if raw is None:
         return None
     max_v = row.get('max_volume')
@@ -183,74 +210,139 @@ for r in rows:
         continue
     if lat == 0 and lon == 0:
         continue
-    locations.append({'id': r.get('id'), 'name': r.get('name'), 'lat': lat, 'lon': lon, 'level': r.get('display_level')})
+    locations.append({'id': r.get('id'), 'name': r.get('name'), 'lat': lat, 'lon': lon, 'level': r.get('display_level'), 'row': r})
 
 for i in range(len(locations) - 1):
     a = locations[i]
     b = locations[i + 1]
     paths.append({'from': a['id'], 'to': b['id'], 'coords': [[a['lat'], a['lon']], [b['lat'], b['lon']]]})
 
-st.write(f'Loaded {len(locations)} cauldron locations and {len(paths)} paths.')
-
-show_paths = st.checkbox('Show paths', value=False)
-marker_radius = st.slider('Marker radius', 0.1, 1.0, 0.1)
-
-# Prepare pydeck layers
-layers = []
-if locations:
-    # add a friendly level_display for tooltip (e.g. '42.5%' or 'N/A')
-    for loc in locations:
-        lvl = loc.get('level')
-        loc['level_display'] = f"{lvl}%" if (lvl is not None) else 'N/A'
-    df_loc = pd.DataFrame(locations)
-    layers.append(pdk.Layer(
-        'ScatterplotLayer',
-        df_loc,
-        get_position='[lon, lat]',
-        get_fill_color='[22,163,74, 200]',
-        get_radius=marker_radius * 100,
-        radius_scale=1,
-        pickable=True,
-        tooltip=True,
-    ))
-
-if show_paths and paths:
-    # build list of path objects - pydeck/Deck.gl expects [lon, lat] ordering for coordinates
-    line_data = [{'path': [[c[1], c[0]] for c in p['coords']], 'color': [43,140,190]} for p in paths]
-    # Use PathLayer which accepts an array of coordinates per feature via the `path` accessor
-    layers.append(pdk.Layer(
-        'PathLayer',
-        line_data,
-        get_path='path',
-        get_color='color',
-        width_scale=20,
-        width_min_pixels=2,
-    ))
-
-# initial view state
-if locations:
-    first = locations[0]
-    view_state = pdk.ViewState(latitude=first['lat'], longitude=first['lon'], zoom=15, pitch=0)
-else:
-    view_state = pdk.ViewState(latitude=37.76, longitude=-122.4, zoom=15, pitch=0)
+def read_snapshot_index():
+    """Fleet snapshots for the map time slider, read from the archive or the CSV."""
+    if LEVELS_ARCHIVE.exists() and DATA_CSV.exists() and LEVELS_ARCHIVE.stat().st_mtime_ns >= DATA_CSV.stat().st_mtime_ns:
+        frame = level_codec.LevelArchive(str(LEVELS_ARCHIVE)).frame().reset_index()
+    elif DATA_CSV.exists():
+        frame = pd.read_csv(DATA_CSV)
+    else:
+        return None
+    ts_col = next((c for c in frame.columns if c.lower() == 'timestamp'), None)
+    if ts_col is None:
+        return None
+    return SnapshotIndex.from_wide(frame, ts_col)
+
+
+@st.cache_resource(show_spinner=False)
+def load_snapshot_index(version):
+    # built once per data version
+    return read_snapshot_index()
 
-tooltip = {
-    'html': '<b>{name}</b><br/>ID: {id}<br/>Level: {level_display}',
-    'style': {
-        'backgroundColor': 'steelblue',
-        'color': 'white'
+
+def level_history_bytes():
+    return DATA_CSV.stat().st_size if DATA_CSV.exists() else 0
+
+
+def level_color(pct):
+    # green when low, amber around half full, red near overflow
+    if pct is None or pd.isna(pct):
+        return [148, 163, 184, 200]
+    p = min(max(float(pct) / 100.0, 0.0), 1.0)
+    low, mid, high = (22, 163, 74), (234, 179, 8), (220, 38, 38)
+    a, b, f = (low, mid, p * 2) if p < 0.5 else (mid, high, (p - 0.5) * 2)
+    return [int(a[k] + (b[k] - a[k]) * f) for k in range(3)] + [200]
+
+
+# The map is a fragment: scrubbing the time slider only reruns this block, and
+# each position is one row lookup in the snapshot index.
+@st.fragment
+@timed('map')
+def render_map():
+    # cost: parsing the level history into the snapshot index, once per data version
+    budget = latency_budget.Section('map', share=0.15, fixed=0.05, per_unit=5e-8)  # units: bytes of cauldron_data.csv
+    st.write(f'Loaded {len(locations)} cauldron locations and {len(paths)} paths.')
+
+    version = data_version(DATA_CSV, LEVELS_ARCHIVE)
+    if budget.enabled:
+        # built on the job pool; until it lands the map shows the latest levels without the slider
+        snapshots, pending = budget.fetch('snapshot_index', version, level_history_bytes(),
+                                          lambda progress=None: read_snapshot_index(), label='Snapshot index')
+        if pending:
+            budget.approximate('Latest levels only: the time slider appears once the snapshot index is built.')
+    else:
+        snapshots = load_snapshot_index(version)
+    levels_at = None
+    if snapshots is not None and len(snapshots):
+        lo, hi = snapshots.min_time.to_pydatetime(), snapshots.max_time.to_pydatetime()
+        map_time = st.slider('Map time (UTC)', min_value=lo, max_value=hi, value=hi,
+                             step=dt.timedelta(minutes=1), format='YYYY-MM-DD HH:mm')
+        if map_time < hi:
+            levels_at = snapshots.at(map_time)
+
+    show_paths = st.checkbox('Show paths', value=False)
+    marker_radius = st.slider('Marker radius', 0.1, 1.0, 0.1)
+
+    # Prepare pydeck layers
+    layers = []
+    if locations:
+        # add a friendly level_display for tooltip (e.g. '42.5%' or 'N/A')
+        points = []
+        for loc in locations:
+            lvl = loc['level'] if levels_at is None else compute_display_level(loc['row'], levels_at)
+            points.append({'id': loc['id'], 'name': loc['name'], 'lat': loc['lat'], 'lon': loc['lon'], 'level': lvl,
+                           'level_display': f"{lvl}%" if (lvl is not None) else 'N/A', 'color': level_color(lvl)})
+        df_loc = pd.DataFrame(points)
+        layers.append(pdk.Layer(
+            'ScatterplotLayer',
+            df_loc,
+            get_position='[lon, lat]',
+            get_fill_color='color',
+            get_radius=marker_radius * 100,
+            radius_scale=1,
+            pickable=True,
+            tooltip=True,
+        ))
+
+    if show_paths and paths:
+        # build list of path objects - pydeck/Deck.gl expects [lon, lat] ordering for coordinates
+        line_data = [{'path': [[c[1], c[0]] for c in p['coords']], 'color': [43,140,190]} for p in paths]
+        # Use PathLayer which accepts an array of coordinates per feature via the `path` accessor
+        layers.append(pdk.Layer(
+            'PathLayer',
+            line_data,
+            get_path='path',
+            get_color='color',
+            width_scale=20,
+            width_min_pixels=2,
+        ))
+
+    # initial view state
+    if locations:
+        first = locations[0]
+        view_state = pdk.ViewState(latitude=first['lat'], longitude=first['lon'], zoom=15, pitch=0)
+    else:
+        view_state = pdk.ViewState(latitude=37.76, longitude=-122.4, zoom=15, pitch=0)
+
+    tooltip = {
+        'html': '<b>{name}</b><br/>ID: {id}<br/>Level: {level_display}',
+        'style': {
+            'backgroundColor': 'steelblue',
+            'color': 'white'
+        }
     }
-}
 
-deck = pdk.Deck(layers=layers, initial_view_state=view_state, tooltip=tooltip)
+    deck = pdk.Deck(layers=layers, initial_view_state=view_state, tooltip=tooltip)
+
+    st.pydeck_chart(deck)
 
-st.pydeck_chart(deck)
+
+render_map()
 
 # -------------------------------
 # Historic Data Playback (moved from streamlit/app.py)
 # -------------------------------
 st.markdown('---')
 st.header('Historic Data Playback')
+# cost: plotting the selected cauldrons' readings through the selected date
+playback_budget = latency_budget.Section('playback', share=0.35, fixed=0.15, per_unit=2e-6)  # units: points plotted
 
 # Paths for playback (use DATA_DIR / DATA_CSV / CAULDRONS_CSV / RATES_CSV defined above)
 potion_path = DATA_CSV
@@ -258,30 +350,69 @@ ticket_path = DATA_DIR / 'tickets.csv'
 cauldrons_path = CAULDRONS_CSV
 rates_path = RATES_CSV
 
-# Load potion (cauldron_data) dataframe
-potion_df = pd.DataFrame()
-if Path(potion_path).exists():
-    try:
-        potion_df = pd.read_csv(potion_path, parse_dates=['timestamp'])
-    except Exception:
-        # fallback: read then try to parse timestamp column manually
-        potion_df = pd.read_csv(potion_path)
+
+@st.cache_resource
+def load_playback_indexes(version, _cauldrons_df, _rates_df):
+    """Read levels and tickets once per data version and index them by
+    (cauldron, time). Returns (level_index, ticket_index, message)."""
+    message = None
+    # Load potion (cauldron_data) dataframe
+    potion_df = pd.DataFrame()
+    if Path(potion_path).exists():
+        try:
+            potion_df = pd.read_csv(potion_path, parse_dates=['timestamp'])
+        except Exception:
+            # fallback: read then try to parse timestamp column manually
+            potion_df = pd.read_csv(potion_path)
+            for c in potion_df.columns:
+                if c.lower() == 'timestamp':
+                    potion_df[c] = pd.to_datetime(potion_df[c], utc=True, errors='coerce')
+                    break
+
+    # Load tickets dataframe
+    ticket_df = pd.DataFrame()
+    if Path(ticket_path).exists():
+        try:
+            ticket_df = pd.read_csv(ticket_path, parse_dates=['date'])
+        except Exception:
+            ticket_df = pd.read_csv(ticket_path)
+
+    # Transform potion_df to long form and merge with cauldrons/rates
+    level_index = None
+    if not potion_df.empty:
+        ts_col = None
         for c in potion_df.columns:
             if c.lower() == 'timestamp':
-                potion_df[c] = pd.to_datetime(potion_df[c], utc=True, errors='coerce')
+                ts_col = c
                 break
+        if ts_col is not None:
+            potion_long = potion_df.melt(id_vars=[ts_col], var_name='cauldron_id', value_name='level')
+            potion_long = potion_long.rename(columns={ts_col: 'timestamp'})
+            # merge cauldron info if available
+            if not _cauldrons_df.empty and 'id' in _cauldrons_df.columns:
+                potion_long = potion_long.merge(_cauldrons_df, left_on='cauldron_id', right_on='id', how='left')
+            # merge rates if available (best-effort)
+            if not _rates_df.empty:
+                if 'cauldron_id' in _rates_df.columns:
+                    potion_long = potion_long.merge(_rates_df, on='cauldron_id', how='left')
+                elif 'id' in _rates_df.columns:
+                    potion_long = potion_long.merge(_rates_df, left_on='cauldron_id', right_on='id', how='left')
+            level_index = TimeIndex(potion_long, 'timestamp')
+        else:
+            message = 'potion data missing a timestamp column; cannot show historic playback'
+    else:
+        message = 'No cauldron_data.csv found for playback'
 
-# Load tickets dataframe
-ticket_df = pd.DataFrame()
-if Path(ticket_path).exists():
-    try:
-        ticket_df = pd.read_csv(ticket_path, parse_dates=['date'])
-    except Exception:
-        ticket_df = pd.read_csv(ticket_path)
+    # Prepare ticket index
+    ticket_index = None
+    if not ticket_df.empty:
         for c in ticket_df.columns:
             if c.lower() == 'date':
-                ticket_df[c] = pd.to_datetime(ticket_df[c], utc=True, errors='coerce')
+                ticket_df = ticket_df.rename(columns={c: 'date'})
+                ticket_index = TimeIndex(ticket_df, 'date')
                 break
+    return level_index, ticket_index, message
+
 
 # Ensure cauldrons_df / rates_df are available (they were loaded earlier in this file)
 try:
@@ -293,68 +424,16 @@ try:
 except Exception:
     _rates_df = pd.DataFrame()
 
-# Transform potion_df to long form and merge with cauldrons/rates
-potion_long = pd.DataFrame()
-if not potion_df.empty:
-    ts_col = None
-    for c in potion_df.columns:
-        if c.lower() == 'timestamp':
-            ts_col = c
-            break
-    if ts_col is not None:
-        potion_long = potion_df.melt(id_vars=[ts_col], var_name='cauldron_id', value_name='level')
-        # merge cauldron info if available
-        if not _cauldrons_df.empty and 'id' in _cauldrons_df.columns:
-            potion_long = potion_long.merge(_cauldrons_df, left_on='cauldron_id', right_on='id', how='left')
-        # merge rates if available (best-effort)
-        if not _rates_df.empty:
-            if 'cauldron_id' in _rates_df.columns:
-                potion_long = potion_long.merge(_rates_df, on='cauldron_id', how='left')
-            elif 'id' in _rates_df.columns:
-                potion_long = potion_long.merge(_rates_df, left_on='cauldron_id', right_on='id', how='left')
-    else:
-        st.info('potion data missing a timestamp column; cannot show historic playback')
-else:
-    st.info('No cauldron_data.csv found for playback')
-
-# Prepare ticket_long
-ticket_long = ticket_df.copy() if not ticket_df.empty else pd.DataFrame()
-if not ticket_long.empty:
-    for c in ticket_long.columns:
-        if c.lower() == 'date':
-            ticket_long = ticket_long.rename(columns={c: 'date'})
-            ticket_long['date'] = pd.to_datetime(ticket_long['date'], utc=True, errors='coerce')
-            break
+playback_version = data_version(potion_path, ticket_path, cauldrons_path, rates_path)
+with timed('playback_load'):
+    level_index, ticket_index, playback_message = load_playback_indexes(playback_version, _cauldrons_df, _rates_df)
+if playback_message:
+    st.info(playback_message)
 
-# Date selection bounds
-min_date_val = None
-max_date_val = None
-if not potion_long.empty and 'timestamp' in potion_long.columns:
-    try:
-        min_date = potion_long[potion_long.columns[0]].min()
-        max_date = potion_long[potion_long.columns[0]].max()
-    except Exception:
-        min_date = None
-        max_date = None
-else:
-    min_date = None
-    max_date = None
-if not ticket_long.empty and 'date' in ticket_long.columns:
-    try:
-        min_date = min([d for d in [min_date, ticket_long['date'].min()] if d is not None])
-        max_date = max([d for d in [max_date, ticket_long['date'].max()] if d is not None])
-    except Exception:
-        pass
-if min_date is not None and pd.notna(min_date):
-    try:
-        min_date_val = pd.to_datetime(min_date).date()
-    except Exception:
-        min_date_val = None
-if max_date is not None and pd.notna(max_date):
-    try:
-        max_date_val = pd.to_datetime(max_date).date()
-    except Exception:
-        max_date_val = None
+# Date selection bounds (index min/max are O(1) after the build)
+bounds = [ix for ix in (level_index, ticket_index) if ix is not None and len(ix)]
+min_date_val = min(ix.min_time for ix in bounds).date() if bounds else None
+max_date_val = max(ix.max_time for ix in bounds).date() if bounds else None
 
 if min_date_val and max_date_val:
     selected_date = st.date_input('Select Date', min_value=min_date_val, max_value=max_date_val, value=min_date_val)
@@ -362,25 +441,17 @@ else:
     selected_date = st.date_input('Select Date')
 
 # Cauldron selection
-if not potion_long.empty:
-    cauldron_options = list(potion_long['cauldron_id'].dropna().unique())
+if level_index is not None:
+    cauldron_options = level_index.keys
 else:
     cauldron_options = list(_cauldrons_df['id'].unique()) if not _cauldrons_df.empty and 'id' in _cauldrons_df.columns else []
 
 selected_cauldrons = st.multiselect('Select Cauldrons', options=cauldron_options, default=cauldron_options)
 
-# Filter data
-if not potion_long.empty:
-    ts_col = [c for c in potion_long.columns if c.lower() == 'timestamp']
-    ts_col = ts_col[0] if ts_col else potion_long.columns[0]
-    filtered_potion = potion_long[(potion_long['cauldron_id'].isin(selected_cauldrons)) & (pd.to_datetime(potion_long[ts_col]).dt.date <= selected_date)]
-else:
-    filtered_potion = pd.DataFrame()
-
-if not ticket_long.empty:
-    filtered_ticket = ticket_long[(ticket_long['cauldron_id'].isin(selected_cauldrons)) & (ticket_long['date'].dt.date <= selected_date)]
-else:
-    filtered_ticket = pd.DataFrame()
+# Filter data (binary-search slices of the sorted indexes)
+ts_col = 'timestamp'
+filtered_potion = level_index.through_date(selected_cauldrons, selected_date) if level_index is not None else pd.DataFrame()
+filtered_ticket = ticket_index.through_date(selected_cauldrons, selected_date) if ticket_index is not None else pd.DataFrame()
 
 # Colors & names
 import matplotlib.colors as mcolors
@@ -395,18 +466,32 @@ cauldron_names = dict(zip(_cauldrons_df['id'], _cauldrons_df['name'])) if not _c
 # Visualize Potion Levels
 # -------------------------------
 st.subheader('Potion Levels Over Time')
-if not filtered_potion.empty:
-    fig, ax = plt.subplots(figsize=(10, 5))
+playback_selection = tuple(selected_cauldrons)
+
+
+def draw_playback_levels(factor=1):
+    # Figure rather than pyplot: the full-resolution chart may render on a worker thread
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
     for cauldron in selected_cauldrons:
-        df = filtered_potion[filtered_potion['cauldron_id'] == cauldron]
+        df = level_index.through_date([cauldron], selected_date)
         if df.empty:
             continue
+        if factor > 1:
+            df = df.iloc[latency_budget.envelope_index(pd.to_numeric(df['level'], errors='coerce'), factor)]
         times = pd.to_datetime(df[ts_col], errors='coerce')
         ax.plot(times, pd.to_numeric(df['level'], errors='coerce'), label=cauldron_names.get(cauldron, cauldron), color=cauldron_colors.get(cauldron, '#333333'))
     ax.set_xlabel('Time')
     ax.set_ylabel('Potion Level')
     ax.legend()
-    st.pyplot(fig)
+    return fig
+
+
+if not filtered_potion.empty:
+    with timed('playback_levels'):
+        playback_budget.chart(('playback_levels', playback_selection, selected_date, playback_version), len(filtered_potion),
+                              draw_playback_levels, playback_budget.pyramid(len(filtered_potion), draw_playback_levels),
+                              'Potion levels')
 else:
     st.info('No historic potion data available for the selected cauldrons/date')
 
@@ -414,24 +499,31 @@ else:
 # Tickets Collected Over Time
 # -------------------------------
 st.subheader('Tickets Collected Over Time')
+
+
+def draw_playback_tickets():
+    # make naive if tz-aware
+    try:
+        filtered_ticket['date'] = filtered_ticket['date'].dt.tz_localize(None)
+    except Exception:
+        pass
+    ticket_sum = filtered_ticket.groupby(['date', 'cauldron_id'])['amount_collected'].sum().reset_index()
+    fig, ax = plt.subplots(figsize=(10, 5))
+    for cauldron in selected_cauldrons:
+        df = ticket_sum[ticket_sum['cauldron_id'] == cauldron]
+        if df.empty:
+            continue
+        ax.plot(df['date'], df['amount_collected'], label=cauldron_names.get(cauldron, cauldron), color=cauldron_colors.get(cauldron, '#333333'))
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Amount Collected')
+    ax.legend()
+    return fig
+
+
 if not filtered_ticket.empty:
     try:
-        # make naive if tz-aware
-        try:
-            filtered_ticket['date'] = filtered_ticket['date'].dt.tz_localize(None)
-        except Exception:
-            pass
-        ticket_sum = filtered_ticket.groupby(['date', 'cauldron_id'])['amount_collected'].sum().reset_index()
-        fig, ax = plt.subplots(figsize=(10, 5))
-        for cauldron in selected_cauldrons:
-            df = ticket_sum[ticket_sum['cauldron_id'] == cauldron]
-            if df.empty:
-                continue
-            ax.plot(df['date'], df['amount_collected'], label=cauldron_names.get(cauldron, cauldron), color=cauldron_colors.get(cauldron, '#333333'))
-        ax.set_xlabel('Date')
-        ax.set_ylabel('Amount Collected')
-        ax.legend()
-        st.pyplot(fig)
+        with timed('playback_tickets'):
+            show_chart(('playback_tickets', playback_selection, selected_date, playback_version), draw_playback_tickets)
     except Exception:
         st.info('Unable to render tickets plot with the available ticket data')
 else:
@@ -448,6 +540,12 @@ DRAINS_CSV = DATA_DIR / 'drain_events.csv'
 
 
 def load_tickets(path):
+    if query_client.enabled():
+        df = query_client.tickets()
+        if df is not None:
+            return df
+    if results_store.fresh('tickets', DATA_DIR):
+        return results_store.query('tickets')
     if not path.exists():
         return pd.DataFrame()
     df = pd.read_csv(path)
@@ -472,6 +570,12 @@ def load_tickets(path):
 
 
 def load_drains(path):
+    if query_client.enabled():
+        df = query_client.drains()
+        if df is not None:
+            return df
+    if results_store.fresh('drain_events', DATA_DIR):
+        return results_store.query('drain_events')
     if not path.exists():
         return pd.DataFrame()
     df = pd.read_csv(path)
@@ -489,22 +593,29 @@ def load_drains(path):
     return df
 
 
-def match_tickets_to_drains(tickets, drains, window_hours=24, outlier_frac=0.3):
+def match_tickets_to_drains(tickets, drains, window_hours=24, outlier_frac=0.3, progress=None, levels=None):
+    # ``levels`` (a range_index.LevelRangeIndex) adds the measured level drop in each ticket's window
     if tickets.empty:
         return pd.DataFrame()
     # median per cauldron for simple outlier detection
     med = tickets.groupby('cauldron_id')['amount_collected'].median()
     rows = []
     for i, t in tickets.reset_index().iterrows():
+        if progress is not None and i % 16 == 0:
+            progress(i, len(tickets), 'Matching tickets to drain events')
         cid = t.get('cauldron_id')
         tdate = t.get('date')
         amt = t.get('amount_collected')
         dup_count = 0
         status = 'needs-review'
         matched = pd.DataFrame()
+        level_outflow = None
 
-        # duplicates (same cauldron, same date and amount)
-        if pd.notna(tdate):
+        # duplicates (same cauldron, same date and amount); fetch_tickets.py
+        # records the count at ingest, older CSVs fall back to a scan
+        if 'dup_count' in tickets.columns and pd.notna(t.get('dup_count')):
+            dup_count = int(t['dup_count'])
+        elif pd.notna(tdate):
             same = tickets[(tickets['cauldron_id'] == cid) & (tickets['date'].dt.date == tdate.date()) & (tickets['amount_collected'] == amt)]
             dup_count = len(same)
 
@@ -519,6 +630,9 @@ def match_tickets_to_drains(tickets, drains, window_hours=24, outlier_frac=0.3):
                 )
             )
             matched = drains.loc[cond].sort_values(by='start_time') if not drains.empty else pd.DataFrame()
+        if pd.notna(tdate) and levels is not None and cid in levels.col:
+            span = pd.Timedelta(hours=window_hours)
+            level_outflow = levels.outflow(cid, tdate - span, tdate + span)
 
         matched_significant = False
         matched_vol = 0.0
@@ -559,6 +673,7 @@ def match_tickets_to_drains(tickets, drains, window_hours=24, outlier_frac=0.3):
             'matched_events': len(matched),
             'matched_significant': bool(matched_significant),
             'matched_volume_sum': matched_vol,
+            'level_outflow': level_outflow,
             'median_amount': float(median) if median is not None and pd.notna(median) else None,
             'is_outlier': bool(is_outlier),
             'status': status,
@@ -568,20 +683,233 @@ def match_tickets_to_drains(tickets, drains, window_hours=24, outlier_frac=0.3):
     return pd.DataFrame(rows)
 
 
-with st.expander('Ticket matching (diagnostics)', expanded=False):
-    tickets = load_tickets(TICKETS_CSV)
-    drains = load_drains(DRAINS_CSV)
+def daily_end_volume_in_memory(cauldron_data_path):
+    """Last reading per (cauldron, day), reading the whole level history at once."""
+    data = pd.read_csv(cauldron_data_path)
+    # find timestamp column
+    ts_col = None
+    for c in data.columns:
+        if c.lower() == 'timestamp':
+            ts_col = c
+            break
+    if ts_col is None:
+        return None
+    data[ts_col] = pd.to_datetime(data[ts_col], utc=True, errors='coerce')
+    data['date'] = data[ts_col].dt.date
+
+    # melt to long form
+    level_cols = [c for c in data.columns if c not in [ts_col, 'date']]
+    if not level_cols:
+        return None
+    long = data.melt(id_vars=[ts_col, 'date'], value_vars=level_cols, var_name='cauldron_id', value_name='volume')
+
+    # end-of-day last reading per cauldron
+    return (
+        long.sort_values(ts_col)
+            .groupby(['cauldron_id', 'date'], as_index=False)
+            .agg(end_volume=('volume', 'last'))
+    )
+
+
+def build_daily_summary(cauldrons_df, cauldron_data_path, tickets_df, drains_df, chunk_rows=None, progress=None):
+    """Build a daily summary table similar to the analysis notebook.
+    Returns a DataFrame with end_of_day volume, ticket_volume, drain_volume and mismatch fields.
+    With ``chunk_rows`` the level history is streamed in chunks instead of read whole.
+    """
+    # load cauldron_data (wide format expected: timestamp + cauldron columns)
+    if not Path(cauldron_data_path).exists():
+        return pd.DataFrame()
+    if progress is not None:
+        progress(0, 3, 'Reading level history')
+    if chunk_rows:
+        from chunked_pipeline import daily_end_volumes
+        end_volume = daily_end_volumes(cauldron_data_path, chunk_rows)
+    else:
+        end_volume = daily_end_volume_in_memory(cauldron_data_path)
+    if end_volume is None:
+        return pd.DataFrame()
+    if progress is not None:
+        progress(1, 3, 'Summing tickets and drains per day')
+
+    # tickets per day
+    t = tickets_df.copy()
+    if not t.empty and 'date' in t.columns:
+        t['date'] = pd.to_datetime(t['date'], utc=True, errors='coerce').dt.date
+    ticket_daily = (t.groupby(['cauldron_id', 'date'], as_index=False)['amount_collected'].sum().rename(columns={'amount_collected': 'ticket_volume'}) if not t.empty else pd.DataFrame())
+
+    # drains per day (use start_time or end_time if present)
+    d = drains_df.copy()
+    if not d.empty:
+        for col in d.columns:
+            if col.lower() in ('start_time', 'end_time'):
+                d[col] = pd.to_datetime(d[col], utc=True, errors='coerce')
+        # prefer end_time if present
+        time_col = None
+        for name in ('end_time', 'start_time'):
+            for c in d.columns:
+                if c.lower() == name:
+                    time_col = c
+                    break
+            if time_col:
+                break
+        if time_col:
+            d['date'] = d[time_col].dt.date
+    drain_daily = (d.groupby(['cauldron_id', 'date'], as_index=False)['volume_lost'].sum().rename(columns={'volume_lost': 'drain_volume'}) if not d.empty and 'volume_lost' in d.columns else pd.DataFrame())
+
+    if progress is not None:
+        progress(2, 3, 'Combining daily totals')
+    # combine
+    daily = end_volume
+    if not ticket_daily.empty:
+        daily = daily.merge(ticket_daily, on=['cauldron_id', 'date'], how='left')
+    else:
+        daily['ticket_volume'] = 0.0
+    if not drain_daily.empty:
+        daily = daily.merge(drain_daily, on=['cauldron_id', 'date'], how='left')
+    else:
+        daily['drain_volume'] = 0.0
+
+    daily[['ticket_volume', 'drain_volume']] = daily[['ticket_volume', 'drain_volume']].fillna(0.0)
+
+    # attach capacity if available
+    use_cols = [c for c in ['id', 'max_volume'] if c in cauldrons_df.columns]
+    if use_cols:
+        caul_short = cauldrons_df.copy()
+        if 'id' in caul_short.columns:
+            caul_short = caul_short.rename(columns={'id': 'cauldron_id'})
+        select_cols = ['cauldron_id' if c == 'id' else c for c in use_cols]
+        select_cols = [c for c in select_cols if c in caul_short.columns]
+        caul_short = caul_short[select_cols] if select_cols else pd.DataFrame()
+        daily = daily.merge(caul_short, on='cauldron_id', how='left')
+    if 'max_volume' in daily.columns:
+        daily['fill_pct'] = (daily['end_volume'] / daily['max_volume']) * 100
+
+    # mismatches
+    daily['mismatch'] = daily['ticket_volume'] - daily['drain_volume']
+    daily['mismatch_abs'] = daily['mismatch'].abs()
+    daily['mismatch_pct'] = np.where(daily.get('max_volume', 0) > 0, (daily['mismatch_abs'] / daily['max_volume']) * 100, np.nan)
+
+    return daily
+
+
+# The diagnostics and analytics sections only run when switched on, inside
+# fragments (so their widgets rerun just the section). Their inputs are cached
+# per data version, and the heavy steps run as background jobs keyed by
+# version + parameters (background_jobs.py).
+def section_data_version():
+    return data_version(TICKETS_CSV, DRAINS_CSV, DATA_CSV, CAULDRONS_CSV, RESULTS_DB, LEVELS_ARCHIVE)
+
+
+@st.cache_data(show_spinner=False)
+def cached_tickets(version):
+    return load_tickets(TICKETS_CSV)
+
+
+@st.cache_data(show_spinner=False)
+def cached_drains(version):
+    return load_drains(DRAINS_CSV)
+
+
+# level histories above this size are streamed in chunks (POTION_CHUNK_ROWS forces it)
+CHUNKED_MIN_BYTES = 512 * 1024 * 1024
+CHUNK_ROWS = int(os.environ.get('POTION_CHUNK_ROWS', 0)) or None
+
+
+def daily_summary_chunk_rows():
+    if CHUNK_ROWS is None and DATA_CSV.exists() and DATA_CSV.stat().st_size > CHUNKED_MIN_BYTES:
+        return 100_000
+    return CHUNK_ROWS
+
+
+@st.cache_resource(show_spinner=False)
+def cached_timeline(version):
+    # load cauldron_data once per version; returned frame is shared, don't mutate
+    if LEVELS_ARCHIVE.exists() and LEVELS_ARCHIVE.stat().st_mtime_ns >= DATA_CSV.stat().st_mtime_ns:
+        return level_codec.LevelArchive(str(LEVELS_ARCHIVE)).frame().reset_index(), 'timestamp'
+    cd = pd.read_csv(DATA_CSV)
+    # normalize timestamp
+    ts = None
+    for c in cd.columns:
+        if c.lower() == 'timestamp':
+            ts = c
+            break
+    if ts is not None:
+        cd[ts] = pd.to_datetime(cd[ts], utc=True, errors='coerce')
+    return cd, ts
+
+
+@st.cache_resource(show_spinner=False)
+def cached_range_index(version):
+    # prefix sums + block min/max over the level history (backend/range_index.py)
+    frame, ts = cached_timeline(version)
+    if ts is None:
+        return None
+    return range_index.LevelRangeIndex.from_wide(frame, ts)
+
+
+@st.cache_data(show_spinner=False)
+def cached_level_ids(version):
+    return results_store.cauldron_ids('levels')
+
+
+@st.cache_data(show_spinner=False)
+def cached_level_slice(version, cauldron):
+    # one cauldron's history straight off the (cauldron_id, ts) index
+    return results_store.query('levels', cauldron=cauldron)
+
+
+def render_range_check(levels):
+    # every figure is a couple of binary searches into the range index, whatever the window
+    st.subheader('Range check')
+    lo = pd.Timestamp(levels.times[0], tz='UTC').to_pydatetime()
+    hi = pd.Timestamp(levels.times[len(levels) - 1], tz='UTC').to_pydatetime()
+    cols = st.columns([1, 3])
+    cid = cols[0].selectbox('Cauldron', options=levels.columns)
+    start, end = cols[1].slider('Window (UTC)', min_value=lo, max_value=hi, value=(max(lo, hi - dt.timedelta(days=1)), hi),
+                                step=dt.timedelta(minutes=1), format='YYYY-MM-DD HH:mm')
+    stats = levels.summary(cid, start, end)
+    for col, (label, key) in zip(st.columns(5), [('Net change (L)', 'net_change'), ('Inflow (L)', 'inflow'),
+                                                 ('Outflow (L)', 'outflow'), ('Min level', 'min'), ('Max level', 'max')]):
+        col.metric(label, 'n/a' if pd.isna(stats[key]) else round(stats[key], 2))
+
+
+TICKET_SAMPLE_MIN = 50  # smallest ticket sample worth showing
+
+
+@st.fragment
+@timed('ticket_diagnostics')
+def render_ticket_diagnostics():
+    # cost: matching every ticket against the drain events (match_tickets_to_drains)
+    budget = latency_budget.Section('ticket_diagnostics', share=0.25, fixed=0.02, per_unit=2e-3)  # units: tickets
+    version = section_data_version()
+    tickets = cached_tickets(version)
+    drains = cached_drains(version)
 
     st.write(f'Loaded {len(tickets)} tickets and {len(drains)} drain events')
 
+    levels = cached_range_index(version) if DATA_CSV.exists() else None
+    if levels is not None and len(levels):
+        render_range_check(levels)
+
     w = st.number_input('Time window (hours) around ticket to match drains', value=24, min_value=1, max_value=168)
     outlier_frac = st.slider('Outlier fraction from median', min_value=0.05, max_value=1.0, value=0.3)
 
     if tickets.empty:
         st.info('No tickets.csv found or it is empty')
     else:
-        results = match_tickets_to_drains(tickets, drains, window_hours=w, outlier_frac=outlier_frac)
-        if results.empty:
+        # runs on the shared job pool; moving the inputs again cancels the superseded job
+        results, pending = budget.fetch(
+            'ticket_matches', (version, int(w), float(outlier_frac)), len(tickets), match_tickets_to_drains,
+            tickets, drains, window_hours=w, outlier_frac=outlier_frac, levels=levels, label='Ticket matches')
+        if pending and budget.enabled:
+            # a fixed sample of the tickets, as many as fit, for the current settings
+            n = min(len(tickets), budget.affordable(minimum=TICKET_SAMPLE_MIN))
+            results = match_tickets_to_drains(tickets.sample(n, random_state=0).sort_index(), drains,
+                                              window_hours=w, outlier_frac=outlier_frac, levels=levels)
+            budget.approximate(f'Ticket matches for a sample of {n} of {len(tickets)} tickets.')
+        if results is None:
+            pass  # first run for these settings; the job status above stands in
+        elif results.empty:
             st.info('No ticket results')
         else:
             st.subheader('Status counts')
@@ -601,160 +929,105 @@ with st.expander('Ticket matching (diagnostics)', expanded=False):
                 if sel.iloc[0]['matched_preview']:
                     st.table(pd.DataFrame(sel.iloc[0]['matched_preview']))
 
-    ## Advanced analytics (charts & graphs)
-    st.markdown('---')
-    st.header('Advanced analytics')
 
+@st.fragment
+@timed('advanced_charts')
+def render_advanced_charts():
+    version = section_data_version()
 
-    def build_daily_summary(cauldrons_df, cauldron_data_path, tickets_df, drains_df):
-        """Build a daily summary table similar to the analysis notebook.
-        Returns a DataFrame with end_of_day volume, ticket_volume, drain_volume and mismatch fields.
-        """
-        # load cauldron_data (wide format expected: timestamp + cauldron columns)
-        if not Path(cauldron_data_path).exists():
-            return pd.DataFrame()
-        data = pd.read_csv(cauldron_data_path)
-        # find timestamp column
-        ts_col = None
-        for c in data.columns:
-            if c.lower() == 'timestamp':
-                ts_col = c
-                break
-        if ts_col is None:
-            return pd.DataFrame()
-        data[ts_col] = pd.to_datetime(data[ts_col], utc=True, errors='coerce')
-        data['date'] = data[ts_col].dt.date
-
-        # melt to long form
-        level_cols = [c for c in data.columns if c not in [ts_col, 'date']]
-        if not level_cols:
-            return pd.DataFrame()
-        long = data.melt(id_vars=[ts_col, 'date'], value_vars=level_cols, var_name='cauldron_id', value_name='volume')
-
-        # end-of-day last reading per cauldron
-        end_volume = (
-            long.sort_values(ts_col)
-                .groupby(['cauldron_id', 'date'], as_index=False)
-                .agg(end_volume=('volume', 'last'))
-        )
-
-        # tickets per day
-        t = tickets_df.copy()
-        if not t.empty and 'date' in t.columns:
-            t['date'] = pd.to_datetime(t['date'], utc=True, errors='coerce').dt.date
-        ticket_daily = (t.groupby(['cauldron_id', 'date'], as_index=False)['amount_collected'].sum().rename(columns={'amount_collected': 'ticket_volume'}) if not t.empty else pd.DataFrame())
-
-        # drains per day (use start_time or end_time if present)
-        d = drains_df.copy()
-        if not d.empty:
-            for col in d.columns:
-                if col.lower() in ('start_time', 'end_time'):
-                    d[col] = pd.to_datetime(d[col], utc=True, errors='coerce')
-            # prefer end_time if present
-            time_col = None
-            for name in ('end_time', 'start_time'):
-                for c in d.columns:
-                    if c.lower() == name:
-                        time_col = c
-                        break
-                if time_col:
-                    break
-            if time_col:
-                d['date'] = d[time_col].dt.date
-        drain_daily = (d.groupby(['cauldron_id', 'date'], as_index=False)['volume_lost'].sum().rename(columns={'volume_lost': 'drain_volume'}) if not d.empty and 'volume_lost' in d.columns else pd.DataFrame())
+    st.subheader('Current fill level by cauldron')
+    # use display_level column we already computed
+    fill_df = cauldrons_df[['name', 'display_level']].dropna().sort_values('display_level', ascending=False)
+    if not fill_df.empty:
+        # Use matplotlib to avoid pulling in Altair (streamlit.bar_chart imports Altair which may be incompatible
+        # with some Python / Altair installations).
+        names = list(fill_df['name'])
+        values = list(fill_df['display_level'])
 
-        # combine
-        daily = end_volume
-        if not ticket_daily.empty:
-            daily = daily.merge(ticket_daily, on=['cauldron_id', 'date'], how='left')
-        else:
-            daily['ticket_volume'] = 0.0
-        if not drain_daily.empty:
-            daily = daily.merge(drain_daily, on=['cauldron_id', 'date'], how='left')
-        else:
-            daily['drain_volume'] = 0.0
-
-        daily[['ticket_volume', 'drain_volume']] = daily[['ticket_volume', 'drain_volume']].fillna(0.0)
-
-        # attach capacity if available
-        use_cols = [c for c in ['id', 'max_volume'] if c in cauldrons_df.columns]
-        if use_cols:
-            caul_short = cauldrons_df.copy()
-            if 'id' in caul_short.columns:
-                caul_short = caul_short.rename(columns={'id': 'cauldron_id'})
-            select_cols = ['cauldron_id' if c == 'id' else c for c in use_cols]
-            select_cols = [c for c in select_cols if c in caul_short.columns]
-            caul_short = caul_short[select_cols] if select_cols else pd.DataFrame()
-            daily = daily.merge(caul_short, on='cauldron_id', how='left')
-        if 'max_volume' in daily.columns:
-            daily['fill_pct'] = (daily['end_volume'] / daily['max_volume']) * 100
-
-        # mismatches
-        daily['mismatch'] = daily['ticket_volume'] - daily['drain_volume']
-        daily['mismatch_abs'] = daily['mismatch'].abs()
-        daily['mismatch_pct'] = np.where(daily.get('max_volume', 0) > 0, (daily['mismatch_abs'] / daily['max_volume']) * 100, np.nan)
-
-        return daily
-
-
-    with st.expander('Show advanced charts', expanded=False):
-        # reload tickets / drains here so advanced charts operate independently
-        tickets_adv = load_tickets(TICKETS_CSV)
-        drains_adv = load_drains(DRAINS_CSV)
-
-        st.subheader('Current fill level by cauldron')
-        # use display_level column we already computed
-        fill_df = cauldrons_df[['name', 'display_level']].dropna().sort_values('display_level', ascending=False)
-        if not fill_df.empty:
-            # Use matplotlib to avoid pulling in Altair (streamlit.bar_chart imports Altair which may be incompatible
-            # with some Python / Altair installations).
-            names = list(fill_df['name'])
-            values = list(fill_df['display_level'])
+        def draw_fill_levels():
             fig, ax = plt.subplots(figsize=(10, 3))
             ax.bar(range(len(names)), values, color='darkgreen', edgecolor='orange')
             ax.set_ylabel('Display level')
             ax.set_xticks(range(len(names)))
             ax.set_xticklabels(names, rotation=90)
             ax.set_title('Current fill level by cauldron')
-            plt.tight_layout()
-            st.pyplot(fig)
-        else:
-            st.info('No fill level data available to show bar chart')
-
-        st.subheader('Per-cauldron historic timeline')
-        # load cauldron_data and allow selection
-        if Path(DATA_CSV).exists():
-            cd = pd.read_csv(DATA_CSV)
-            # normalize timestamp
-            ts = None
-            for c in cd.columns:
-                if c.lower() == 'timestamp':
-                    ts = c
-                    break
-            if ts is not None:
-                cd[ts] = pd.to_datetime(cd[ts], utc=True, errors='coerce')
-                level_cols = [c for c in cd.columns if c not in [ts]]
-                sel_id = st.selectbox('Select cauldron column (historic)', options=level_cols)
-                if sel_id:
-                    fig, ax = plt.subplots(figsize=(10, 3))
-                    ax.plot(cd[ts], pd.to_numeric(cd[sel_id], errors='coerce'), label='level')
+            fig.tight_layout()
+            return fig
+
+        show_chart(('fill_levels', tuple(names), tuple(values)), draw_fill_levels)
+    else:
+        st.info('No fill level data available to show bar chart')
+
+    st.subheader('Per-cauldron historic timeline')
+    # cost: plotting one cauldron's whole history
+    timeline_budget = latency_budget.Section('timeline', share=0.1, fixed=0.15, per_unit=2e-6)  # units: points plotted
+    # load cauldron_data and allow selection
+    if results_store.fresh('levels', DATA_DIR):
+        sel_id = st.selectbox('Select cauldron column (historic)', options=cached_level_ids(version))
+        if sel_id:
+            levels = cached_level_slice(version, sel_id)
+
+            def draw_timeline(factor=1):
+                rows = latency_budget.envelope_index(levels['level'], factor)
+                fig = Figure(figsize=(10, 3))
+                ax = fig.subplots()
+                ax.plot(levels['timestamp'].iloc[rows], levels['level'].iloc[rows], label='level')
+                ax.set_title(f'Historic levels for {sel_id}')
+                ax.set_ylabel('Volume')
+                ax.grid(True)
+                return fig
+
+            timeline_budget.chart(('timeline', (sel_id,), None, version), len(levels), draw_timeline,
+                                  timeline_budget.pyramid(len(levels), draw_timeline), 'Historic levels')
+    elif Path(DATA_CSV).exists():
+        cd, ts = cached_timeline(version)
+        if ts is not None:
+            level_cols = [c for c in cd.columns if c not in [ts]]
+            sel_id = st.selectbox('Select cauldron column (historic)', options=level_cols)
+            if sel_id:
+                def draw_timeline(factor=1):
+                    values = pd.to_numeric(cd[sel_id], errors='coerce')
+                    rows = latency_budget.envelope_index(values, factor)
+                    fig = Figure(figsize=(10, 3))
+                    ax = fig.subplots()
+                    ax.plot(cd[ts].iloc[rows], values.iloc[rows], label='level')
                     ax.set_title(f'Historic levels for {sel_id}')
                     ax.set_ylabel('Volume')
                     ax.grid(True)
-                    st.pyplot(fig)
-            else:
-                st.info('cauldron_data.csv missing a timestamp column; cannot show timeline')
-        else:
-            st.info('No cauldron_data.csv found for historic timelines')
+                    return fig
 
-        st.subheader('Daily mismatch heatmap')
-        daily = build_daily_summary(cauldrons_df, DATA_CSV, tickets_adv, drains_adv)
-        if daily.empty:
-            st.info('Not enough data to compute daily summary')
+                timeline_budget.chart(('timeline', (sel_id,), None, version), len(cd), draw_timeline,
+                                      timeline_budget.pyramid(len(cd), draw_timeline), 'Historic levels')
         else:
-            # pivot by cauldron x date for mismatch_pct
+            st.info('cauldron_data.csv missing a timestamp column; cannot show timeline')
+    else:
+        st.info('No cauldron_data.csv found for historic timelines')
+
+    st.subheader('Daily mismatch heatmap')
+    # cost: reading the level history for the daily end volumes, then one heatmap cell per cauldron-day
+    summary_budget = latency_budget.Section('daily_summary', share=0.05, fixed=0.1, per_unit=5e-8)  # units: bytes
+    daily, pending = summary_budget.fetch(
+        'daily_summary', version, level_history_bytes(), build_daily_summary,
+        cauldrons_df, DATA_CSV, cached_tickets(version), cached_drains(version), chunk_rows=daily_summary_chunk_rows(),
+        label='Daily summary')
+    if pending and summary_budget.enabled:
+        summary_budget.progress()  # nothing coarser to show; the heatmap and KPIs appear once it lands
+    if daily is None:
+        pass  # first run for this data version; the job status above stands in
+    elif daily.empty:
+        st.info('Not enough data to compute daily summary')
+    else:
+        heatmap_budget = latency_budget.Section('mismatch_heatmap', share=0.1, fixed=0.3, per_unit=2e-4)  # units: cells
+        n_cauldrons = daily['cauldron_id'].nunique()
+        n_days = daily['date'].nunique()
+
+        # pivot by cauldron x date for mismatch_pct
+        def draw_heatmap(days=None):
             heat = daily.pivot(index='cauldron_id', columns='date', values='mismatch_pct').fillna(0)
-            fig, ax = plt.subplots(figsize=(12, max(3, heat.shape[0] * 0.5)))
+            if days is not None:
+                heat = heat.iloc[:, -days:]
+            fig = Figure(figsize=(12, max(3, heat.shape[0] * 0.5)))
+            ax = fig.subplots()
             im = ax.imshow(heat.values, aspect='auto', cmap='YlOrRd', origin='upper')
             ax.set_yticks(range(len(heat.index)))
             ax.set_yticklabels(heat.index)
@@ -762,18 +1035,36 @@ with st.expander('Ticket matching (diagnostics)', expanded=False):
             ax.set_xticklabels([d.strftime('%b %d') for d in heat.columns], rotation=90)
             ax.set_title('Daily Ticket vs Drain Mismatch (% of capacity)')
             fig.colorbar(im, ax=ax, label='Mismatch %')
-            st.pyplot(fig)
-
-        st.subheader('Daily summary table & KPIs')
-        if not daily.empty:
-            total_unaccounted = daily['mismatch_abs'].sum()
-            total_days = len(daily)
-            suspicious_days = int((daily['mismatch_abs'] > 0).sum())
-            suspicious_rate = (suspicious_days / total_days * 100) if total_days else 0
-            cols = ['cauldron_id', 'date', 'end_volume', 'max_volume', 'fill_pct', 'ticket_volume', 'drain_volume', 'mismatch']
-            st.metric('Total unaccounted (L)', round(float(total_unaccounted), 2))
-            st.metric('Suspicious day rate (%)', f"{round(suspicious_rate,1)}%")
-            st.dataframe(daily[cols].sort_values(['cauldron_id', 'date'], ascending=[True, False]).head(200))
-        else:
-            st.info('No daily summary available')
+            return fig
+
+        def recent_heatmap():
+            days = heatmap_budget.recent(n_days, n_cauldrons)
+            return (('recent', days), days * n_cauldrons, lambda: draw_heatmap(days),
+                    f'only the most recent {days} of {n_days} days.')
+
+        heatmap_budget.chart(('mismatch_heatmap', None, None, version), len(daily), draw_heatmap, recent_heatmap,
+                             'Mismatch heatmap')
+
+    st.subheader('Daily summary table & KPIs')
+    if daily is not None and not daily.empty:
+        total_unaccounted = daily['mismatch_abs'].sum()
+        total_days = len(daily)
+        suspicious_days = int((daily['mismatch_abs'] > 0).sum())
+        suspicious_rate = (suspicious_days / total_days * 100) if total_days else 0
+        cols = ['cauldron_id', 'date', 'end_volume', 'max_volume', 'fill_pct', 'ticket_volume', 'drain_volume', 'mismatch']
+        st.metric('Total unaccounted (L)', round(float(total_unaccounted), 2))
+        st.metric('Suspicious day rate (%)', f"{round(suspicious_rate,1)}%")
+        st.dataframe(daily[cols].sort_values(['cauldron_id', 'date'], ascending=[True, False]).head(200))
+    else:
+        st.info('No daily summary available')
+
+
+if st.toggle('Ticket matching (diagnostics)', value=False):
+    render_ticket_diagnostics()
+
+## Advanced analytics (charts & graphs)
+st.markdown('---')
+st.header('Advanced analytics')
 
+if st.toggle('Show advanced charts', value=False):
+    render_advanced_charts()
@@ -0,0 +1,90 @@
+# query_client.py
+# Thin client for backend/query_service.py. Set POTION_QUERY_URL (for example
+# http://127.0.0.1:8765) to make the dashboard read from the service instead of
+# reparsing the CSVs; every helper returns None when the service is not
+# configured or unreachable so callers can fall back to the local files.
+import gzip
+import json
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import pandas as pd
+
+QUERY_URL = os.environ.get('POTION_QUERY_URL', '').rstrip('/')
+TIMEOUT_SECONDS = 5
+PAGE_SIZE = 5000
+
+
+def enabled():
+    return bool(QUERY_URL)
+
+
+def get_json(path, **params):
+    if not QUERY_URL:
+        return None
+    params = {k: v for k, v in params.items() if v is not None}
+    url = f'{QUERY_URL}{path}'
+    if params:
+        url += '?' + urllib.parse.urlencode(params)
+    req = urllib.request.Request(url, headers={'Accept-Encoding': 'gzip'})
+    try:
+        with urllib.request.urlopen(req, timeout=TIMEOUT_SECONDS) as resp:
+            body = resp.read()
+            if resp.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+    except (urllib.error.URLError, OSError):
+        return None
+    return json.loads(body)
+
+
+def fetch_all(path, **params):
+    """Follow ``next_offset`` until the whole result set is read."""
+    items = []
+    offset = 0
+    while offset is not None:
+        page = get_json(path, offset=offset, limit=PAGE_SIZE, **params)
+        if page is None:
+            return None
+        items.extend(page['items'])
+        offset = page['next_offset']
+    return items
+
+
+def _frame(items, time_cols):
+    if items is None:
+        return None
+    df = pd.DataFrame(items)
+    for c in time_cols:
+        if c in df.columns:
+            df[c] = pd.to_datetime(df[c], utc=True, errors='coerce')
+    return df
+
+
+def latest_levels():
+    """{cauldron_id: level} for the newest reading of every cauldron."""
+    body = get_json('/levels/latest')
+    if body is None:
+        return None
+    return {cid: rec['level'] for cid, rec in body['items'].items()}
+
+
+def levels(cauldron=None, start=None, end=None):
+    return _frame(fetch_all('/levels', cauldron=cauldron, start=start, end=end), ['timestamp'])
+
+
+def drains(cauldron=None, start=None, end=None, significant=None):
+    return _frame(fetch_all('/drains', cauldron=cauldron, start=start, end=end, significant=significant), ['start_time', 'end_time'])
+
+
+def tickets(cauldron=None, start=None, end=None):
+    return _frame(fetch_all('/tickets', cauldron=cauldron, start=start, end=end), ['date'])
+
+
+def rollups(cauldron=None, start=None, end=None):
+    return _frame(fetch_all('/rollups', cauldron=cauldron, start=start, end=end), ['day'])
+
+
+def suspicious(days=None, start=None, end=None):
+    return _frame(fetch_all('/suspicious', days=days, start=start, end=end), ['day'])
@@ -0,0 +1,88 @@
+# render_cache.py
+# Memory-bounded LRU cache of rasterized matplotlib charts.
+#
+# Charts are keyed by (chart type, selection, date range, data version). A miss
+# calls the draw function, saves the figure to PNG bytes and closes it right
+# away, so no pyplot figure outlives the rerun that created it. Revisiting a
+# selection is a dictionary lookup.
+import io
+import threading
+from collections import OrderedDict
+
+import matplotlib.pyplot as plt
+import streamlit as st
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_DPI = 100
+
+
+class RenderCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, dpi=DEFAULT_DPI):
+        self.max_bytes = max_bytes
+        self.dpi = dpi
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def get(self, key):
+        with self._lock:
+            png = self._items.get(key)
+            if png is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+            return png
+
+    def put(self, key, png):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            if len(png) > self.max_bytes:
+                return
+            self._items[key] = png
+            self._bytes += len(png)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get_or_render(self, key, draw):
+        """PNG bytes for ``key``; ``draw()`` must return a matplotlib Figure."""
+        png = self.get(key)
+        if png is not None:
+            return png
+        fig = draw()
+        try:
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', dpi=self.dpi, bbox_inches='tight')
+            png = buf.getvalue()
+        finally:
+            plt.close(fig)
+        with self._lock:
+            self.misses += 1
+        self.put(key, png)
+        return png
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+
+@st.cache_resource
+def get_render_cache():
+    # one cache per server process, shared by every session
+    return RenderCache()
+
+
+def show_chart(key, draw):
+    """Render (or reuse) the chart for ``key`` and display it."""
+    st.image(get_render_cache().get_or_render(key, draw))
@@ -0,0 +1,22 @@
+# section_timer.py
+# Wall time of the last run of each dashboard section, kept in
+# st.session_state['section_timings'] (seconds by section name) so the latency
+# harness (bench_dashboard.py) can read it back after every interaction.
+#
+# Use as a context manager around module-level code, or as a decorator under
+# @st.fragment so a fragment-only rerun is timed too.
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+STATE_KEY = 'section_timings'
+
+
+@contextmanager
+def timed(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        st.session_state.setdefault(STATE_KEY, {})[name] = time.perf_counter() - t0
@@ -0,0 +1,191 @@
+# time_index.py
+# Sorted int64 time index over a long-format frame (one row per cauldron and
+# timestamp) so the playback date filters become searchsorted slices instead of
+# a full `.dt.date` conversion of every row on each rerun. SnapshotIndex is
+# the time-major counterpart behind the map's time slider.
+import datetime as dt
+import os
+
+import numpy as np
+import pandas as pd
+
+DAY_NS = 86_400 * 1_000_000_000
+
+
+def data_version(*paths):
+    """Cache key for a set of input files (mtime + size, None if missing)."""
+    out = []
+    for p in paths:
+        try:
+            st_ = os.stat(p)
+            out.append((str(p), st_.st_mtime_ns, st_.st_size))
+        except OSError:
+            out.append((str(p), None, None))
+    return tuple(out)
+
+
+def _to_ns(value):
+    if isinstance(value, dt.date) and not isinstance(value, dt.datetime):
+        value = pd.Timestamp(value.year, value.month, value.day)
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return ts.as_unit('ns').value
+
+
+class TimeIndex:
+    """Rows sorted by (cauldron, time) with per-cauldron day boundary offsets.
+
+    ``frame`` is held as-is (sorted) and must not be mutated by callers; every
+    query returns a new frame built with ``take`` over a contiguous slice per
+    cauldron, so a selection costs O(log n) plus the size of the output.
+    """
+
+    def __init__(self, frame, time_col, key_col='cauldron_id'):
+        self.time_col = time_col
+        self.key_col = key_col
+        frame = frame.copy()
+        frame[time_col] = pd.to_datetime(frame[time_col], utc=True, errors='coerce')
+        frame = frame.dropna(subset=[time_col, key_col])
+        frame = frame.sort_values([key_col, time_col], kind='mergesort').reset_index(drop=True)
+        self.frame = frame
+        self.times = frame[time_col].dt.as_unit('ns').astype('int64').to_numpy()
+
+        keys = frame[key_col].to_numpy()
+        self.blocks = {}
+        if len(keys):
+            cuts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+            starts = np.concatenate([[0], cuts])
+            ends = np.concatenate([cuts, [len(keys)]])
+            for s, e in zip(starts, ends):
+                self.blocks[keys[s]] = (int(s), int(e))
+
+        # UTC day starts covering the data, and for every cauldron the row
+        # offset where each of those days begins (plus one past the last day)
+        if len(self.times):
+            first = self.times.min() // DAY_NS
+            last = self.times.max() // DAY_NS
+            self.day_starts = np.arange(first, last + 2, dtype='int64') * DAY_NS
+        else:
+            self.day_starts = np.array([], dtype='int64')
+        self.day_offsets = {
+            k: s + np.searchsorted(self.times[s:e], self.day_starts, 'left')
+            for k, (s, e) in self.blocks.items()
+        }
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def keys(self):
+        return list(self.blocks)
+
+    @property
+    def min_time(self):
+        return pd.Timestamp(self.times.min(), tz='UTC') if len(self.times) else None
+
+    @property
+    def max_time(self):
+        return pd.Timestamp(self.times.max(), tz='UTC') if len(self.times) else None
+
+    def _day_offset(self, key, day):
+        """Row offset (within the sorted frame) of the first row on/after ``day``."""
+        offsets = self.day_offsets[key]
+        k = np.searchsorted(self.day_starts, _to_ns(day), 'left')
+        if k >= len(offsets):
+            return self.blocks[key][1]
+        return int(offsets[k])
+
+    def positions(self, keys, start=None, end=None):
+        """Row positions for ``keys`` with start <= time < end (ns or None)."""
+        out = []
+        for k in keys:
+            if k not in self.blocks:
+                continue
+            s, e = self.blocks[k]
+            lo = s if start is None else s + int(np.searchsorted(self.times[s:e], start, 'left'))
+            hi = e if end is None else s + int(np.searchsorted(self.times[s:e], end, 'left'))
+            out.append(np.arange(lo, hi))
+        return np.concatenate(out) if out else np.array([], dtype='int64')
+
+    def take(self, positions):
+        return self.frame.take(positions)
+
+    def through_date(self, keys, date):
+        """Rows for ``keys`` on or before the UTC calendar day ``date``."""
+        out = []
+        for k in keys:
+            if k not in self.blocks:
+                continue
+            s = self.blocks[k][0]
+            out.append(np.arange(s, self._day_offset(k, date + dt.timedelta(days=1))))
+        return self.take(np.concatenate(out) if out else np.array([], dtype='int64'))
+
+    def on_dates(self, keys, first, last):
+        """Rows for ``keys`` whose UTC calendar day is in [first, last]."""
+        out = []
+        for k in keys:
+            if k not in self.blocks:
+                continue
+            out.append(np.arange(self._day_offset(k, first), self._day_offset(k, last + dt.timedelta(days=1))))
+        return self.take(np.concatenate(out) if out else np.array([], dtype='int64'))
+
+    def between(self, keys, start, end):
+        """Rows for ``keys`` with start <= time < end (anything Timestamp-like)."""
+        return self.take(self.positions(keys, _to_ns(start), _to_ns(end)))
+
+
+class SnapshotIndex:
+    """Time-major fleet snapshots for the map slider.
+
+    ``values`` is a C-contiguous (time x cauldron) matrix, forward-filled so row
+    i holds every cauldron's latest known level at ``times[i]``; a snapshot is
+    one contiguous row. On a regular time grid (the minute data) the row for a
+    timestamp is computed arithmetically, otherwise it is a binary search.
+    """
+
+    def __init__(self, times, keys, values):
+        self.times = np.asarray(times, dtype='int64')
+        self.keys = list(keys)
+        self.values = np.ascontiguousarray(values, dtype='float64')
+        self.step = None
+        if len(self.times) > 1:
+            steps = np.diff(self.times)
+            if steps[0] > 0 and (steps == steps[0]).all():
+                self.step = int(steps[0])
+
+    @classmethod
+    def from_wide(cls, frame, time_col='timestamp'):
+        """From a wide frame (time column + one column per cauldron)."""
+        frame = frame.copy()
+        frame[time_col] = pd.to_datetime(frame[time_col], utc=True, errors='coerce')
+        frame = frame.dropna(subset=[time_col]).sort_values(time_col, kind='mergesort')
+        keys = [c for c in frame.columns if c != time_col]
+        values = frame[keys].apply(pd.to_numeric, errors='coerce').ffill().to_numpy(dtype='float64')
+        return cls(frame[time_col].dt.as_unit('ns').astype('int64').to_numpy(), keys, values)
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def min_time(self):
+        return pd.Timestamp(self.times[0], tz='UTC') if len(self.times) else None
+
+    @property
+    def max_time(self):
+        return pd.Timestamp(self.times[-1], tz='UTC') if len(self.times) else None
+
+    def row(self, when):
+        """Index of the last snapshot at or before ``when`` (None if before the data)."""
+        ns = _to_ns(when)
+        if not len(self.times) or ns < self.times[0]:
+            return None
+        if self.step is not None:
+            return min((ns - int(self.times[0])) // self.step, len(self.times) - 1)
+        return int(np.searchsorted(self.times, ns, 'right')) - 1
+
+    def at(self, when):
+        """{cauldron: level} at ``when``; cauldrons with no reading yet are left out."""
+        i = self.row(when)
+        if i is None:
+            return {}
+        return {k: float(v) for k, v in zip(self.keys, self.values[i]) if not np.isnan(v)}
@@ -1,21 +1,13 @@
-import requests
-import pandas as pd
-
-url = "https://hackutd2025.eog.systems/api/Information/cauldrons"
-
-response = requests.get(url)
-
-print("Status code:", response.status_code)
-print("Raw text response:")
-print(response.text[:500])  # show first 500 characters to inspect
-
-if response.status_code == 200:
-    try:
-        data = response.json()
-        df = pd.DataFrame(data)
-        df.to_csv("cauldrons.csv", index=False)
-        print("Cauldron data fetched and saved to cauldrons.csv")
-    except Exception as e:
-        print("Could not parse JSON:", e)
-else:
-    print(f"Failed to fetch cauldron data (status {response.status_code})")
+# fetch_cauldrons.py
+# Kept for old invocations: runs backend/fetch_cauldrons.py, which writes the
+# cauldron list (cauldrons.csv) into streamlit/data. Same arguments as the
+# backend script; in-process callers import it (or backend/stages.py) instead.
+import os
+import runpy
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
+
+if __name__ == '__main__':
+    sys.path.insert(0, BACKEND_DIR)
+    runpy.run_path(os.path.join(BACKEND_DIR, 'fetch_cauldrons.py'), run_name='__main__')
@@ -1,32 +1,13 @@
 # fetch_tickets.py
+# Kept for old invocations: runs backend/fetch_tickets.py, which appends new
+# tickets to streamlit/data/tickets.csv. Same arguments as the backend script;
+# in-process callers import it (or backend/stages.py) instead.
 import os
-import pandas as pd
-import requests
+import runpy
+import sys
 
-# API endpoint
-TICKET_API = "https://hackutd2025.eog.systems/api/Tickets"
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend')
 
-# Directory for saving CSV
-script_dir = os.path.dirname(__file__)
-output_file = os.path.join(script_dir, "tickets.csv")
-
-# Fetch tickets from API
-response = requests.get(TICKET_API)
-if response.status_code != 200:
-    raise RuntimeError(f"Failed to fetch ticket data: {response.status_code}")
-
-tickets_json = response.json()
-tickets = pd.DataFrame(tickets_json.get("transport_tickets", []))
-
-if tickets.empty:
-    print("No tickets found in API data.")
-else:
-    # Convert ticket date to datetime (UTC)
-    tickets["date"] = pd.to_datetime(tickets["date"], utc=True)
-
-    # Keep only needed columns
-    tickets = tickets[["cauldron_id", "date", "amount_collected"]]
-
-    # Save to CSV
-    tickets.to_csv(output_file, index=False)
-    print(f"Tickets saved to {output_file}")
+if __name__ == '__main__':
+    sys.path.insert(0, BACKEND_DIR)
+    runpy.run_path(os.path.join(BACKEND_DIR, 'fetch_tickets.py'), run_name='__main__')
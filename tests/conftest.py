@@ -0,0 +1,26 @@
+# The backend scripts import each other as top-level modules (they are run as
+# python backend/<script>.py), so the tests put backend/ on the path the same way.
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+
+def random_levels(rng, rows, cauldrons=3, missing=0.1, start="2025-10-30"):
+    """Wide level frame in centi-liter steps with runs of missing readings, also at the edges."""
+    steps = rng.integers(-150, 120, size=(rows, cauldrons))
+    values = (50_000 + np.cumsum(steps, axis=0)) / 100
+    gaps = rng.random((rows, cauldrons)) < missing
+    gaps |= np.roll(gaps, 1, axis=0)  # runs of two or more
+    values[gaps] = np.nan
+    index = pd.date_range(start, periods=rows, freq="min", tz="UTC", name="timestamp").as_unit("ns")
+    return pd.DataFrame(values, index=index, columns=[f"cauldron_{i + 1:03d}" for i in range(cauldrons)])
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
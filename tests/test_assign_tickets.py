@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from assign_tickets import FILL_TOLERANCE, HOUR_NS, UNMATCHED_COST, assign_tickets, match_cauldron, pair_costs
+
+
+def brute(anchors, amounts, drain_ns, volumes, window_ns):
+    """Best total gain over all order-preserving one-to-one pairings, by the O(n * m) table."""
+    ti, dj, cost = pair_costs(anchors, amounts, drain_ns, volumes, window_ns)
+    gain = np.full((len(anchors), len(drain_ns)), -np.inf)
+    gain[ti, dj] = UNMATCHED_COST - cost
+    best = np.zeros((len(anchors) + 1, len(drain_ns) + 1))
+    for i in range(1, len(anchors) + 1):
+        for j in range(1, len(drain_ns) + 1):
+            best[i, j] = max(best[i - 1, j], best[i, j - 1], best[i - 1, j - 1] + gain[i - 1, j - 1])
+    return best[-1, -1]
+
+
+def random_cauldron(rng, tickets, drains):
+    anchors = np.sort(rng.integers(0, 10 * 24, size=tickets)) * HOUR_NS
+    drain_ns = np.sort(rng.integers(0, 10 * 24, size=drains)) * HOUR_NS
+    amounts = rng.uniform(20, 150, size=tickets).round(2)
+    amounts[rng.random(tickets) < 0.1] = 0.0
+    return anchors, amounts, drain_ns, rng.uniform(5, 200, size=drains).round(2)
+
+
+@pytest.mark.parametrize("tickets,drains", [(1, 0), (5, 3), (8, 40), (30, 30), (40, 12)])
+def test_match_is_the_best_order_preserving_pairing(rng, tickets, drains):
+    for _ in range(20):
+        anchors, amounts, drain_ns, volumes = random_cauldron(rng, tickets, drains)
+        window_ns = int(rng.choice([6, 18, 48]) * HOUR_NS)
+        ti, dj, cost = match_cauldron(anchors, amounts, drain_ns, volumes, window_ns)
+        assert (np.diff(ti) > 0).all() and (np.diff(dj) > 0).all()  # one-to-one and uncrossed
+        assert (np.abs(drain_ns[dj] - anchors[ti]) <= window_ns).all()
+        assert np.isclose((UNMATCHED_COST - cost).sum(), brute(anchors, amounts, drain_ns, volumes, window_ns))
+
+
+def test_assign_tickets_pairs_each_drain_and_ticket_once(rng):
+    days = pd.date_range("2025-10-30", periods=6, freq="D", tz="UTC")
+    tickets = pd.DataFrame({"cauldron_id": rng.choice(["a", "b"], size=12), "date": rng.choice(days, size=12),
+                            "amount_collected": rng.uniform(20, 120, size=12).round(2)})
+    start = days[0] + pd.to_timedelta(rng.integers(0, 6 * 24 * 60, size=40), unit="min")
+    drains = pd.DataFrame({"cauldron_id": rng.choice(["a", "b"], size=40), "start_time": start,
+                           "end_time": start + pd.Timedelta("30min"), "volume_lost": rng.uniform(10, 120, size=40)})
+    pairs, summary, unassigned = assign_tickets(tickets, drains)
+    assert not pairs["ticket_index"].duplicated().any()
+    assert not pairs.duplicated(["cauldron_id", "start_time"]).any()
+    assert summary["assigned_drains"].max() <= 1
+    assert len(pairs) + len(unassigned) == len(drains)
+    multi, multi_summary, _ = assign_tickets(tickets, drains, multi=True)
+    assert not multi.duplicated(["cauldron_id", "start_time"]).any()
+    assert (multi_summary["assigned_volume"] <= (1 + FILL_TOLERANCE) * multi_summary["amount_collected"] + 1e-9).all()
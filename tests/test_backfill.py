@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import backfill
+from conftest import random_levels
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit", "data")
+
+
+def synthetic_dir(path, rng, missing):
+    """Three days of levels with regular drains on top of the noise, and a ticket per cauldron-day."""
+    df = random_levels(rng, 3 * 1440, missing=missing)
+    drains = (np.arange(len(df)) % 180 < 12)[:, None] * np.linspace(0.8, 1.6, df.shape[1])
+    df = (df - np.cumsum(drains, axis=0)).round(2)
+    df.to_csv(path / "cauldron_data.csv")
+    days = pd.date_range(df.index[0].normalize(), periods=3, freq="D")
+    pd.DataFrame({
+        "cauldron_id": np.repeat(df.columns, 3),
+        "date": np.tile(days, df.shape[1]),
+        "amount_collected": rng.uniform(60, 140, size=3 * df.shape[1]).round(2),
+    }).to_csv(path / "tickets.csv", index=False)
+    return str(path)
+
+
+def written(data_dir):
+    return {name: open(os.path.join(data_dir, name), "rb").read() for name in backfill.OUTPUTS}
+
+
+@pytest.mark.parametrize("shard", ["day", "week"])
+def test_sample_data_matches_the_serial_stages(tmp_path, shard):
+    for name in ("cauldron_data.csv", "tickets.csv"):
+        shutil.copy(os.path.join(SAMPLE_DIR, name), tmp_path)
+    backfill.backfill(str(tmp_path), str(tmp_path / "results.db"), shard, jobs=2)
+    assert written(tmp_path) == backfill.serial_outputs(str(tmp_path))
+
+
+@pytest.mark.parametrize("missing,denoise_window", [(0.0, 0), (0.0, 5), (0.02, 0)])
+def test_synthetic_data_matches_the_serial_stages(tmp_path, rng, missing, denoise_window):
+    data_dir = synthetic_dir(tmp_path, rng, missing)
+    backfill.backfill(data_dir, str(tmp_path / "results.db"), "day", jobs=2, denoise_window=denoise_window)
+    assert written(data_dir) == backfill.serial_outputs(data_dir, denoise_window=denoise_window)
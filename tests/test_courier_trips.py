@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from courier_trips import MINUTE_NS, chain_drains, courier_trips
+
+
+def brute(drains, travel, max_idle, max_trip):
+    """chain_drains by scanning every open trip for every drain: O(n**2)."""
+    starts = pd.to_datetime(drains["start_time"], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+    ends = pd.to_datetime(drains["end_time"], utc=True).dt.as_unit("ns").astype("int64").to_numpy()
+    ids = list(travel.index)
+    travel_ns = np.rint(travel.to_numpy() * MINUTE_NS).astype("int64")
+    trip = np.full(len(drains), -1)
+    idle = np.full(len(drains), np.nan)
+    tails = {}  # trip -> (cauldron slot, end_ns, first start_ns)
+    for i in np.argsort(starts, kind="stable"):
+        here = ids.index(drains["cauldron_id"].iat[i])
+        best = None
+        for t, (s, end, first) in tails.items():
+            wait = starts[i] - travel_ns[s, here] - end
+            if 0 <= wait <= max_idle * MINUTE_NS and starts[i] - first <= max_trip * MINUTE_NS:
+                if best is None or wait < best[0]:
+                    best = (wait, t)
+        if best is None:
+            t = len({*trip[trip >= 0]})
+            tails[t] = (here, ends[i], starts[i])
+        else:
+            wait, t = best
+            tails[t] = (here, ends[i], tails[t][2])
+            idle[i] = wait / MINUTE_NS
+        trip[i] = t
+    return trip, idle
+
+
+def random_drains(rng, count, cauldrons):
+    # whole seconds over a few days, so no two waits tie and the best fit is unique
+    starts = np.sort(rng.choice(np.arange(3 * 24 * 3600), size=count, replace=False)) * 1_000_000_000
+    length = rng.integers(60, 3 * 3600, size=count) * 1_000_000_000
+    return pd.DataFrame({
+        "cauldron_id": rng.choice(cauldrons, size=count),
+        "start_time": pd.to_datetime(starts, utc=True),
+        "end_time": pd.to_datetime(starts + length, utc=True),
+        "volume_lost": rng.uniform(0.2, 100, size=count),
+    })
+
+
+def random_travel(rng, cauldrons):
+    minutes = rng.uniform(1, 40, size=(len(cauldrons), len(cauldrons)))
+    minutes = np.round((minutes + minutes.T) / 2, 3)
+    np.fill_diagonal(minutes, 0.0)
+    return pd.DataFrame(minutes, index=cauldrons, columns=cauldrons)
+
+
+@pytest.mark.parametrize("count,max_idle,max_trip", [(1, 60, 480), (40, 60, 480), (300, 60, 480), (300, 240, 120),
+                                                     (300, 15, 10_000)])
+def test_chain_matches_the_pairwise_scan(rng, count, max_idle, max_trip):
+    cauldrons = [f"cauldron_{i:03d}" for i in range(1, 6)]
+    for _ in range(5):
+        drains = random_drains(rng, count, cauldrons)
+        travel = random_travel(rng, cauldrons)
+        trip, idle = chain_drains(drains, travel, max_idle, max_trip)
+        want_trip, want_idle = brute(drains, travel, max_idle, max_trip)
+        np.testing.assert_array_equal(trip, want_trip)
+        np.testing.assert_allclose(idle, want_idle)
+
+
+def test_stops_merge_drains_at_the_same_cauldron(rng):
+    names = ["cauldron_001", "cauldron_002", "cauldron_003"]
+    cauldrons = pd.DataFrame({"id": names, "latitude": [33.0, 33.001, 33.002], "longitude": [-97.0, -97.0, -97.0]})
+    drains = random_drains(rng, 200, names)
+    tickets = pd.DataFrame(columns=["cauldron_id", "date", "amount_collected"])
+    trips, stops = courier_trips(drains, tickets, cauldrons, max_trip=240)
+    assert stops["drains"].sum() == len(drains) == trips["drains"].sum()
+    same = stops.groupby("trip_id")["cauldron_id"].shift() == stops["cauldron_id"]
+    assert not same.any()
+    assert (stops["travel_minutes"].dropna() > 0).all()
+    first_start = stops.groupby("trip_id")["start_time"].transform("first")
+    assert ((stops["start_time"] - first_start) <= pd.Timedelta(minutes=240)).all()
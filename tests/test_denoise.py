@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import random_levels
+from denoise import RollingMedian, StreamingMedianFilter, filtered_chunks, median_filter
+
+
+@pytest.mark.parametrize("window", [1, 3, 5, 9])
+def test_median_filter_matches_pandas(rng, window):
+    df = random_levels(rng, 400, missing=0.1).round(0)  # coarse levels, so windows hold ties
+    want = df.rolling(window, center=True, min_periods=1).median().where(df.notna())
+    pd.testing.assert_frame_equal(median_filter(df, window), want)
+
+
+def test_short_frames_use_the_shorter_windows(rng):
+    df = random_levels(rng, 3, missing=0.0)
+    want = df.rolling(9, center=True, min_periods=1).median()
+    pd.testing.assert_frame_equal(median_filter(df, 9), want)
+
+
+@pytest.mark.parametrize("window", [3, 7])
+def test_streaming_in_chunks_matches_batch(rng, window):
+    df = random_levels(rng, 300, missing=0.1)
+    cuts = np.sort(rng.choice(np.arange(1, len(df)), size=15, replace=False))
+    chunks = (df.iloc[part] for part in np.split(np.arange(len(df)), cuts))
+    pd.testing.assert_frame_equal(pd.concat(list(filtered_chunks(chunks, window))), median_filter(df, window),
+                                  check_freq=False)
+
+
+def test_rolling_median_under_insert_and_delete(rng):
+    median, held = RollingMedian(), []
+    for _ in range(3000):
+        if held and rng.random() < 0.45:
+            x = held.pop(rng.integers(len(held)))
+            median.remove(x)
+        else:
+            x = float(rng.integers(0, 20))
+            held.append(x)
+            median.add(x)
+        assert len(median) == len(held)
+        if held:
+            assert median.median() == np.median(held)
+        else:
+            assert np.isnan(median.median())
+
+
+def test_even_window_is_refused():
+    with pytest.raises(ValueError):
+        StreamingMedianFilter(4)
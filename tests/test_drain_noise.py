@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import random_levels
+from detect_drain_events import detect_drain_events
+from drain_noise import noise_owners
+
+
+def day_totals(events):
+    day = pd.to_datetime(events["start_time"], utc=True).dt.floor("D")
+    return events.groupby([events["cauldron_id"], day])["volume_lost"].sum()
+
+
+@pytest.mark.parametrize("noise_k", [1.0, 3.0, 50.0])
+def test_floor_keeps_the_volume_per_cauldron_day(rng, noise_k):
+    df = random_levels(rng, 4 * 1440, missing=0.05)
+    everything = detect_drain_events(df, 0)
+    merged = detect_drain_events(df, noise_k)
+    assert len(merged) < len(everything)
+    pd.testing.assert_series_equal(day_totals(merged), day_totals(everything))
+    assert merged["significant"].sum() == everything["significant"].sum()
+
+
+def test_noise_goes_to_the_nearer_event_of_its_day():
+    hour = 3_600_000_000_000
+    cauldrons = np.array(["a", "a", "a", "a", "b", "b", "b"])
+    start = np.array([1, 2, 5, 25, 1, 3, 4]) * hour
+    noise = np.array([False, True, False, True, True, True, False])
+    # a: the 02:00 fragment is closer to 01:00 than to 05:00; the next-day one has no event above the floor
+    # b: both fragments go to the 04:00 event
+    assert noise_owners(cauldrons, start, start, noise).tolist() == [0, 0, 2, 3, 6, 6, 6]
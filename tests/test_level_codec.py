@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import level_codec
+from conftest import random_levels
+from compute_rates import compute_rates
+
+
+def brute(df, cauldron, lo, hi):
+    """(total, min, max, net change) of rows [lo, hi) in centi-liters, straight off the frame."""
+    v = df[cauldron].to_numpy()[lo:hi]
+    units = np.rint(v[~np.isnan(v)] * 100).astype("int64")
+    if not units.size:
+        return 0, None, None, 0
+    return int(units.sum()), int(units.min()), int(units.max()), int(units[-1] - units[0])
+
+
+@pytest.mark.parametrize("block_rows", [1, 4, 7, 64])
+def test_round_trip_and_reductions_match_brute_force(tmp_path, rng, block_rows):
+    df = random_levels(rng, 200, missing=0.2)
+    df.iloc[:5, 0] = np.nan  # outages at both edges of a column
+    df.iloc[-9:, 1] = np.nan
+    df.iloc[:, 2] = np.nan  # and a column without any reading
+    path = tmp_path / "levels.lvc"
+    level_codec.write(df, path, block_rows)
+    archive = level_codec.LevelArchive(path)
+
+    pd.testing.assert_frame_equal(archive.frame(), df, check_freq=False)
+    for _ in range(200):
+        lo, hi = sorted(rng.integers(0, len(df) + 1, size=2))
+        start, end = (df.index[lo], df.index[hi - 1]) if hi > lo else (df.index[0], df.index[0] - pd.Timedelta("1min"))
+        for c in df.columns:
+            total, low, high, net = brute(df, c, lo, hi)
+            assert archive.total(c, start, end) == total / 100
+            assert archive.min(c, start, end) == (None if low is None else low / 100)
+            assert archive.max(c, start, end) == (None if high is None else high / 100)
+            assert archive.net_change(c, start, end) == net / 100
+
+
+def test_net_change_past_an_outage_at_the_edge(tmp_path):
+    index = pd.date_range("2025-10-30", periods=5, freq="min", tz="UTC", name="timestamp")
+    df = pd.DataFrame({"cauldron_001": [1.0, 2.5, -1.8, np.nan, np.nan]}, index=index)
+    level_codec.write(df, tmp_path / "levels.lvc", block_rows=1)
+    assert level_codec.LevelArchive(tmp_path / "levels.lvc").net_change("cauldron_001") == pytest.approx(-2.8)
+
+
+def test_rates_from_headers_match_compute_rates(tmp_path, rng):
+    df = random_levels(rng, 500)
+    level_codec.write(df, tmp_path / "levels.lvc", block_rows=16)
+    pd.testing.assert_frame_equal(level_codec.LevelArchive(tmp_path / "levels.lvc").rates(), compute_rates(df))
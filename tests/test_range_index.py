@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import random_levels
+from range_index import LevelRangeIndex
+
+
+def brute(df, cauldron, start, end):
+    """The range summary by slicing the frame: steps between consecutive readings inside [start, end]."""
+    v = df[cauldron][(df.index >= start) & (df.index <= end)].to_numpy()
+    if not len(v):
+        return dict.fromkeys(["net_change", "inflow", "outflow", "min", "max"], np.nan)
+    units = np.rint(v * 100)
+    d = np.diff(units)
+    d = d[~np.isnan(d)]
+    valid = units[~np.isnan(units)]
+    return {
+        "net_change": d.sum() / 100,
+        "inflow": d[d > 0].sum() / 100,
+        "outflow": -d[d < 0].sum() / 100,
+        "min": valid.min() / 100 if valid.size else np.nan,
+        "max": valid.max() / 100 if valid.size else np.nan,
+    }
+
+
+def random_ranges(rng, df, count):
+    for _ in range(count):
+        a, b = sorted(rng.integers(-5, len(df) + 5, size=2))
+        step = pd.Timedelta("1min")
+        yield df.index[0] + a * step - step * rng.integers(0, 2) / 2, df.index[0] + b * step
+
+
+@pytest.mark.parametrize("block", [1, 4, 64])
+def test_summary_matches_slicing(rng, block):
+    df = random_levels(rng, 700, missing=0.15)
+    df.iloc[100:400, 1] = np.nan  # an outage spanning several blocks
+    index = LevelRangeIndex.from_wide(df, block=block)
+    for start, end in random_ranges(rng, df, 300):
+        for c in df.columns:
+            got, want = index.summary(c, start, end), brute(df, c, start, end)
+            assert got == pytest.approx(want, nan_ok=True), (c, start, end)
+
+
+def test_appending_in_chunks_matches_building_at_once(rng):
+    df = random_levels(rng, 500)
+    whole = LevelRangeIndex.from_wide(df, block=8)
+    grown = LevelRangeIndex(df.columns, block=8)
+    cuts = np.sort(rng.choice(np.arange(1, len(df)), size=20, replace=False))
+    for part in np.split(np.arange(len(df)), cuts):
+        grown.append(df.index[part], df.to_numpy()[part])
+    for start, end in random_ranges(rng, df, 100):
+        for c in df.columns:
+            assert grown.summary(c, start, end) == pytest.approx(whole.summary(c, start, end), nan_ok=True)
+
+
+def test_vectorized_totals_match_single_ranges(rng):
+    df = random_levels(rng, 300)
+    index = LevelRangeIndex.from_wide(df)
+    starts, ends = zip(*random_ranges(rng, df, 50))
+    inflow, outflow = index.totals("cauldron_002", list(starts), list(ends))
+    for s, e, i, o in zip(starts, ends, inflow, outflow):
+        assert (i, o) == pytest.approx((index.inflow("cauldron_002", s, e), index.outflow("cauldron_002", s, e)), nan_ok=True)